@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Approximate nearest-neighbour index cho FaceGallery (pure NumPy)
+- IVFIndex: coarse quantizer k-means (spherical) + inverted lists
+- Knob recall/latency: n_lists (số cluster) và n_probe (số list quét mỗi query)
+- Index chỉ lưu centroids + thứ tự row, vector vẫn đọc từ gallery.matrix (không nhân đôi RAM)
+- Gallery nhỏ hoặc n_probe >= n_lists → fall-back về exact search
+- Gallery thêm/xoá người khi đang chạy → updated() gán row mới vào centroid sẵn có, không train lại
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from face_gallery import l2_normalize, exact_search
+
+INDEX_FORMAT_VERSION = 1
+
+
+def matrix_fingerprint(matrix):
+    """Hash nội dung gallery.matrix để phát hiện index cũ (gallery đã thay đổi)"""
+    return hashlib.sha1(np.ascontiguousarray(matrix).data).hexdigest()
+
+
+def _assign(matrix, centroids, chunk_size=65536):
+    """Gán mỗi vector vào centroid gần nhất (theo chunk để giới hạn RAM)"""
+    labels = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk_size):
+        block = matrix[start:start + chunk_size]
+        labels[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(matrix, n_clusters, n_iter=20, seed=0):
+    """K-means trên mặt cầu đơn vị (cosine), trả về centroids đã normalize"""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    centroids = np.array(matrix[rng.choice(n, n_clusters, replace=False)], dtype=np.float32)
+
+    for _ in range(n_iter):
+        labels = _assign(matrix, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[nonempty])[:-1]])
+        sums[nonempty] = np.add.reduceat(matrix[np.argsort(labels, kind='stable')], starts, axis=0)
+
+        # Cluster rỗng → lấy ngẫu nhiên 1 điểm làm centroid mới
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = matrix[rng.choice(n, len(empty), replace=False)]
+        centroids = l2_normalize(sums)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index với coarse quantizer k-means.
+    search() nhận probes đã L2-normalize, trả về (indices, similarities) như exact_search;
+    các list được probe có ít hơn k row → phần thiếu là index -1, similarity -1 (caller phải bỏ qua index âm)
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=20, max_train_points=256, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.max_train_points = max_train_points  # số điểm train tối đa cho mỗi list
+        self.seed = seed
+        self.matrix = None
+        self.centroids = None
+        self.order = None    # row index của gallery, sắp theo list
+        self.offsets = None  # list i = order[offsets[i]:offsets[i + 1]]
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def build(self, matrix):
+        """Train coarse quantizer và chia gallery.matrix vào các inverted list"""
+        n = matrix.shape[0]
+        if self.n_lists is None:
+            self.n_lists = max(1, int(4 * np.sqrt(n)))
+        self.n_lists = min(self.n_lists, n)
+
+        # Train trên sample để thời gian build không phụ thuộc N
+        rng = np.random.default_rng(self.seed)
+        n_train = min(n, self.n_lists * self.max_train_points)
+        train = matrix if n_train == n else matrix[np.sort(rng.choice(n, n_train, replace=False))]
+        self.centroids = spherical_kmeans(np.asarray(train, dtype=np.float32), self.n_lists,
+                                          n_iter=self.n_iter, seed=self.seed)
+        self._attach(matrix, _assign(matrix, self.centroids))
+        return self
+
+    def _attach(self, matrix, labels):
+        self.matrix = matrix
+        self.order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=self.n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def list_labels(self):
+        """Inverted list của từng row gallery (suy ra từ order/offsets)"""
+        labels = np.empty(len(self.order), dtype=np.int64)
+        labels[self.order] = np.repeat(np.arange(self.n_lists), np.diff(self.offsets))
+        return labels
+
+    def updated(self, matrix, keep_rows, n_new):
+        """
+        Index mới (cùng centroids) cho matrix = rows keep_rows của matrix cũ + n_new row nối vào cuối
+        Index hiện tại không đổi → search đang chạy trên gallery cũ vẫn đúng
+        """
+        labels = np.concatenate([self.list_labels()[keep_rows],
+                                 _assign(matrix[len(keep_rows):len(keep_rows) + n_new], self.centroids)])
+        index = IVFIndex(n_lists=self.n_lists, n_probe=self.n_probe, n_iter=self.n_iter,
+                         max_train_points=self.max_train_points, seed=self.seed)
+        index.centroids = self.centroids
+        index._attach(matrix, labels)
+        return index
+
+    def search(self, probes, k=1):
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex chưa được build")
+
+        n_probe = min(self.n_probe, self.n_lists)
+        if n_probe >= self.n_lists:
+            return exact_search(self.matrix, probes, k)
+
+        coarse = probes @ self.centroids.T
+        lists = np.argpartition(-coarse, n_probe - 1, axis=1)[:, :n_probe]
+
+        k = max(1, min(k, self.matrix.shape[0]))
+        out_idx = np.full((probes.shape[0], k), -1, dtype=np.int64)
+        out_sim = np.full((probes.shape[0], k), -1.0, dtype=np.float32)
+
+        for i, probe in enumerate(probes):
+            rows = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists[i]])
+            if len(rows) == 0:
+                continue
+            sims = self.matrix[rows] @ probe
+            kk = min(k, len(rows))
+            top = np.argpartition(-sims, kk - 1)[:kk] if kk < len(rows) else np.arange(len(rows))
+            top = top[np.argsort(-sims[top])]
+            out_idx[i, :kk] = rows[top]
+            out_sim[i, :kk] = sims[top]
+
+        return out_idx, out_sim
+
+    def save(self, path):
+        """Lưu centroids + inverted lists (.npz), vector không lưu lại"""
+        np.savez(path, version=INDEX_FORMAT_VERSION, centroids=self.centroids,
+                 order=self.order, offsets=self.offsets,
+                 shape=np.array(self.matrix.shape), n_probe=self.n_probe,
+                 fingerprint=matrix_fingerprint(self.matrix))
+
+    @classmethod
+    def load(cls, path, matrix):
+        """Load index đã lưu và gắn vào gallery.matrix, lỗi nếu gallery không khớp"""
+        data = np.load(path)
+        if int(data['version']) != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Index version không hỗ trợ: {int(data['version'])}")
+        if tuple(data['shape']) != matrix.shape:
+            raise ValueError(f"Index build cho gallery {tuple(data['shape'])}, gallery hiện tại {matrix.shape}")
+        if str(data['fingerprint']) != matrix_fingerprint(matrix):
+            raise ValueError("Index build cho gallery khác (fingerprint không khớp)")
+
+        index = cls(n_lists=len(data['centroids']), n_probe=int(data['n_probe']))
+        index.centroids = data['centroids']
+        index.order = data['order']
+        index.offsets = data['offsets']
+        index.matrix = matrix
+        return index
+
+
+def load_or_build_ivf(gallery, path=None, n_lists=None, n_probe=8):
+    """
+    Gắn IVFIndex vào gallery: load từ path nếu hợp lệ, ngược lại build mới và lưu lại
+    Returns: index (hoặc None nếu gallery rỗng)
+    """
+    if len(gallery) == 0:
+        return None
+
+    index = None
+    if path and os.path.exists(path):
+        try:
+            index = IVFIndex.load(path, gallery.matrix)
+            index.n_probe = n_probe
+            print(f"✅ Loaded ANN index: {path}")
+        except Exception as e:
+            print(f"⚠️ ANN index không dùng được, build lại: {e}")
+
+    if index is None:
+        index = IVFIndex(n_lists=n_lists, n_probe=n_probe).build(gallery.matrix)
+        print(f"✅ Built ANN index: {index.n_lists} lists, n_probe={index.n_probe}")
+        if path:
+            index.save(path)
+
+    gallery.index = index
+    return index
@@ -1,4 +1,9 @@
 # Anti-Spoofing module - Silent-Face
-from .models import MiniFASNetV1, MiniFASNetV2, MiniFASNetV1SE, MiniFASNetV2SE
 from .utils import parse_model_name, get_kernel, CropImage
-from .transform import Compose, ToTensor
+
+try:
+    from .models import MiniFASNetV1, MiniFASNetV2, MiniFASNetV1SE, MiniFASNetV2SE
+    from .transform import Compose, ToTensor
+except ImportError:
+    # Chưa cài torch → chỉ dùng được ONNX backend (onnx_backend.OnnxModel)
+    pass
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Cache model anti-spoof đã tối ưu để khởi động nhanh
+- Lần đầu: load .pth → optimize_for_inference (gộp BN) → trace + freeze (TorchScript) → lưu vào cache_dir
+- Các lần sau: torch.jit.load graph đã freeze, không parse .pth / dựng lại module / trace lại
+- Key = hash nội dung .pth + phiên bản torch + device + layout → đổi weights hay nâng torch thì tự build lại
+- Hash .pth cũng được ghi vào trong file cache và kiểm tra lúc load (file cache bị copy / đổi tên → build lại)
+- Lúc build: so logits bản tối ưu với model gốc (verify_equivalence), lệch thì không ghi cache
+
+Cách chạy (build sẵn cache cho các .pth trong thư mục anti_spoof, in thời gian build vs load):
+    python -m anti_spoof.model_cache
+    python -m anti_spoof.model_cache --clear
+"""
+
+import argparse
+import hashlib
+import os
+import time
+import warnings
+
+import torch
+
+from .models import load_model
+from .optimize import optimize_for_inference, verify_equivalence
+from .utils import parse_model_name
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """sha256 nội dung file (16 ký tự hex đầu)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _cache_suffix(device, channels_last):
+    return f".{torch.device(device).type}{'.cl' if channels_last else ''}.pt"
+
+
+def cache_path_for(model_path, device, channels_last=False, cache_dir=DEFAULT_CACHE_DIR, checkpoint=None):
+    """<cache_dir>/<tên model>.<hash>.<torch>.<device>[.cl].pt (checkpoint: file_hash(model_path) nếu đã tính)"""
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    torch_version = torch.__version__.split("+")[0]
+    return os.path.join(cache_dir, f"{name}.{checkpoint or file_hash(model_path)}.{torch_version}"
+                                   f"{_cache_suffix(device, channels_last)}")
+
+
+def _remove_stale(model_path, cache_path, suffix):
+    """Xoá bản cache cũ của cùng model + device + layout (hash/torch khác), giữ cache_dir gọn"""
+    cache_dir, current = os.path.split(cache_path)
+    prefix = os.path.splitext(os.path.basename(model_path))[0] + "."
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name.endswith(suffix) and name != current:
+            os.remove(os.path.join(cache_dir, name))
+
+
+def load_optimized_model(model_path, device="cpu", channels_last=False, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Model đã tối ưu (TorchScript đã freeze) cho model_path, ưu tiên đọc từ cache
+    Returns: (model, (h_input, w_input, model_type, scale), cache_hit)
+    """
+    info = parse_model_name(os.path.basename(model_path))
+    checkpoint = file_hash(model_path)
+    cache_path = cache_path_for(model_path, device, channels_last, cache_dir, checkpoint)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)  # torch.jit.* báo deprecated từ PyTorch 2.x
+        if os.path.exists(cache_path):
+            try:
+                extra = {"checkpoint": b""}  # file cache cũ (chưa ghi hash) → không khớp → build lại
+                model = torch.jit.load(cache_path, map_location=device, _extra_files=extra).eval()
+                if extra["checkpoint"].decode() == checkpoint:
+                    return model, info, True
+                print(f"   ⚠️ Cache {os.path.basename(cache_path)} build từ checkpoint khác, build lại")
+            except Exception as e:
+                print(f"   ⚠️ Cache hỏng ({os.path.basename(cache_path)}): {e}, build lại")
+
+        original, info = load_model(model_path, device)
+        model = optimize_for_inference(original, channels_last=channels_last, compile_mode="script",
+                                       input_size=info[:2])
+        verify_equivalence(original, model, info[:2])  # AssertionError → không ghi cache sai
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"  # ghi file tạm rồi rename → process khác không đọc file dở
+        torch.jit.save(model, tmp_path, _extra_files={"checkpoint": checkpoint})
+        os.replace(tmp_path, cache_path)
+    _remove_stale(model_path, cache_path, _cache_suffix(device, channels_last))
+    return model, info, False
+
+
+def clear_cache(cache_dir=DEFAULT_CACHE_DIR):
+    """Xoá mọi file cache, trả về số file đã xoá"""
+    if not os.path.isdir(cache_dir):
+        return 0
+    names = [name for name in os.listdir(cache_dir) if name.endswith(".pt")]
+    for name in names:
+        os.remove(os.path.join(cache_dir, name))
+    return len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / xoá cache model anti-spoof đã tối ưu")
+    parser.add_argument("--dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"✅ Đã xoá {clear_cache(args.cache_dir)} file cache")
+        return
+
+    print(f"{'model':<36} {'build s':>8} {'load s':>8}")
+    for name in sorted(os.listdir(args.dir)):
+        if not (name.endswith(".pth") and "MiniFAS" in name):
+            continue
+        path = os.path.join(args.dir, name)
+        start = time.perf_counter()
+        _, _, hit = load_optimized_model(path, args.device, args.channels_last, args.cache_dir)
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        load_optimized_model(path, args.device, args.channels_last, args.cache_dir)
+        load_s = time.perf_counter() - start
+        print(f"{name:<36} {'(cache)' if hit else f'{build_s:.2f}':>8} {load_s:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -224,3 +224,31 @@ def MiniFASNetV1SE(embedding_size=128, conv6_kernel=(7, 7), drop_p=0.75, num_cla
 
 def MiniFASNetV2SE(embedding_size=128, conv6_kernel=(7, 7), drop_p=0.75, num_classes=4, img_channel=3):
     return MiniFASNetSE(KEEP_DICT['1.8M_'], embedding_size, conv6_kernel, drop_p, num_classes, img_channel)
+
+
+MODEL_MAPPING = {
+    'MiniFASNetV1': MiniFASNetV1, 'MiniFASNetV2': MiniFASNetV2,
+    'MiniFASNetV1SE': MiniFASNetV1SE, 'MiniFASNetV2SE': MiniFASNetV2SE
+}
+
+
+def load_model(model_path, device='cpu'):
+    """
+    Tạo model theo tên file .pth (parse_model_name) và load weights
+    Returns: (model ở eval mode, (h_input, w_input, model_type, scale))
+    """
+    import os
+    from collections import OrderedDict
+    from .utils import parse_model_name, get_kernel
+
+    info = parse_model_name(os.path.basename(model_path))
+    h_input, w_input, model_type, _ = info
+    model = MODEL_MAPPING[model_type](conv6_kernel=get_kernel(h_input, w_input)).to(device)
+
+    state_dict = torch.load(model_path, map_location=device, weights_only=True)
+    if list(state_dict.keys())[0].startswith('module.'):
+        state_dict = OrderedDict((k[7:], v) for k, v in state_dict.items())
+
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model, info
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Export MiniFASNet (.pth) sang ONNX với batch axis động + ONNX Runtime backend
+- Export cần torch; chạy inference bằng ONNX Runtime thì không cần torch
+- Session dùng CPUExecutionProvider, giới hạn số thread để chạy chung process với insightface
+
+Cách chạy (export toàn bộ .pth trong thư mục anti_spoof + kiểm tra logits):
+    python -m anti_spoof.onnx_backend --verify
+"""
+
+import argparse
+import inspect
+import os
+
+import numpy as np
+
+from .utils import parse_model_name
+
+ONNX_OPSET = 13
+INPUT_NAME = "input"
+OUTPUT_NAME = "logits"
+
+
+def onnx_path_for(pth_path):
+    """2.7_80x80_MiniFASNetV2.pth → 2.7_80x80_MiniFASNetV2.onnx (giữ tên để parse_model_name vẫn dùng được)"""
+    return os.path.splitext(pth_path)[0] + ".onnx"
+
+
+def export_model(pth_path, onnx_path=None):
+    """Export 1 model .pth sang ONNX, input (batch, 3, h, w) với batch động"""
+    import torch
+    from .models import load_model
+
+    onnx_path = onnx_path or onnx_path_for(pth_path)
+    model, (h_input, w_input, _, _) = load_model(pth_path, device='cpu')
+    dummy = torch.zeros(1, 3, h_input, w_input)
+
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False  # exporter TorchScript: ổn định với dynamic_axes
+    torch.onnx.export(model, dummy, onnx_path, input_names=[INPUT_NAME], output_names=[OUTPUT_NAME],
+                      dynamic_axes={INPUT_NAME: {0: "batch"}, OUTPUT_NAME: {0: "batch"}},
+                      opset_version=ONNX_OPSET, **kwargs)
+    return onnx_path
+
+
+def verify_parity(pth_path, onnx_path, batch_size=8, atol=1e-4, seed=0):
+    """So sánh logits PyTorch vs ONNX Runtime trên batch ngẫu nhiên, trả về max abs diff"""
+    import torch
+    from .models import load_model
+
+    model, (h_input, w_input, _, _) = load_model(pth_path, device='cpu')
+    rng = np.random.default_rng(seed)
+    batch = rng.uniform(0, 255, (batch_size, 3, h_input, w_input)).astype(np.float32)
+
+    with torch.no_grad():
+        expected = model(torch.from_numpy(batch)).numpy()
+    actual = OnnxModel(onnx_path)(batch)
+
+    max_diff = float(np.max(np.abs(expected - actual)))
+    if max_diff > atol:
+        raise AssertionError(f"Logits lệch {max_diff:.2e} > {atol:.0e}: {os.path.basename(onnx_path)}")
+    return max_diff
+
+
+def softmax(logits):
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class OnnxModel:
+    """Wrapper ONNX Runtime: gọi như model PyTorch nhưng nhận/trả numpy (N, 3, h, w) → (N, num_classes)"""
+
+    def __init__(self, onnx_path, num_threads=1):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        # Ít thread: nhiều model nhỏ + insightface cùng process, tránh tranh CPU
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # Tên file giữ format .pth gốc (.int8.onnx = bản quantize, anti_spoof/quantize.py)
+        self.h_input, self.w_input, self.model_type, self.scale = parse_model_name(
+            os.path.basename(onnx_path).replace(".int8.onnx", ".pth").replace(".onnx", ".pth"))
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export MiniFASNet .pth sang ONNX")
+    parser.add_argument("--dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--verify", action="store_true", help="So sánh logits PyTorch vs ONNX Runtime")
+    args = parser.parse_args()
+
+    for name in sorted(os.listdir(args.dir)):
+        if not (name.endswith(".pth") and "MiniFAS" in name):
+            continue
+        pth_path = os.path.join(args.dir, name)
+        onnx_path = export_model(pth_path)
+        print(f"   ✓ {name} → {os.path.basename(onnx_path)}")
+        if args.verify:
+            print(f"     max |Δlogits| = {verify_parity(pth_path, onnx_path):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Tối ưu MiniFASNet cho inference (chỉ dùng sau khi đã load weights, model ở eval mode)
+- Gộp BatchNorm vào weight/bias của conv đứng trước (Conv_block, Linear_block, SEModule)
+- Gộp BatchNorm1d cuối vào Linear prob, bỏ Dropout, bỏ nhánh linear không dùng khi embedding_size == 512
+- Tuỳ chọn: layout channels_last, TorchScript (torch.jit.trace + freeze) hoặc torch.compile
+
+Cách chạy (kiểm tra logits trước/sau + đo tốc độ cho các .pth trong thư mục anti_spoof):
+    python -m anti_spoof.optimize
+    python -m anti_spoof.optimize --channels-last --compile script --batch-size 16
+"""
+
+import argparse
+import copy
+import os
+import time
+
+import torch
+from torch.nn import BatchNorm2d, Conv2d, Identity, Linear
+
+from .models import Conv_block, Linear_block, MiniFASNet, SEModule, load_model
+
+
+def fuse_conv_bn(conv, bn):
+    """Conv2d + BatchNorm2d (eval) → 1 Conv2d có bias"""
+    fused = Conv2d(conv.in_channels, conv.out_channels, kernel_size=conv.kernel_size, stride=conv.stride,
+                   padding=conv.padding, dilation=conv.dilation, groups=conv.groups, bias=True)
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    with torch.no_grad():
+        fused.weight.copy_(conv.weight * scale.reshape(-1, 1, 1, 1))
+        fused.bias.copy_((bias - bn.running_mean) * scale + bn.bias)
+    return fused.to(conv.weight.device)
+
+
+def fuse_bn_linear(bn, linear):
+    """BatchNorm1d (eval) + Linear → 1 Linear có bias: W(a*x + b) = (W*a)x + W*b"""
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    shift = bn.bias - bn.running_mean * scale
+    fused = Linear(linear.in_features, linear.out_features, bias=True)
+    bias = linear.bias if linear.bias is not None else torch.zeros(linear.out_features, device=shift.device)
+    with torch.no_grad():
+        fused.weight.copy_(linear.weight * scale)
+        fused.bias.copy_(bias + linear.weight @ shift)
+    return fused.to(linear.weight.device)
+
+
+def _fuse_blocks(module):
+    """Gộp BN trong mọi block con, thay BN bằng Identity để forward giữ nguyên"""
+    for child in module.modules():
+        if isinstance(child, (Conv_block, Linear_block)) and isinstance(child.bn, BatchNorm2d):
+            child.conv = fuse_conv_bn(child.conv, child.bn)
+            child.bn = Identity()
+        elif isinstance(child, SEModule) and isinstance(child.bn1, BatchNorm2d):
+            child.fc1 = fuse_conv_bn(child.fc1, child.bn1)
+            child.bn1 = Identity()
+            child.fc2 = fuse_conv_bn(child.fc2, child.bn2)
+            child.bn2 = Identity()
+
+
+def optimize_for_inference(model, channels_last=False, compile_mode=None, input_size=(80, 80)):
+    """
+    Trả về bản sao đã tối ưu của model (model gốc không đổi)
+    compile_mode: None | "script" (TorchScript) | "compile" (torch.compile, cần PyTorch 2.x)
+    input_size: (h, w) input mẫu để trace khi compile_mode == "script"
+    """
+    model = copy.deepcopy(model).eval()
+    _fuse_blocks(model)
+
+    if isinstance(model, MiniFASNet):
+        model.prob = fuse_bn_linear(model.bn, model.prob)
+        model.bn = Identity()
+        model.drop = Identity()
+        if model.embedding_size == 512:
+            model.linear = Identity()  # forward không gọi nhánh này, bỏ weights thừa
+
+    if channels_last:
+        # Input từ numpy (N, H, W, C).permute(0, 3, 1, 2) vốn đã là channels_last → không cần copy
+        model = model.to(memory_format=torch.channels_last)
+    if compile_mode == "script":
+        # trace thay vì script: forward của Depth_Wise dùng Optional mà TorchScript không suy kiểu được
+        device = next(model.parameters()).device
+        example = torch.zeros(2, 3, *input_size, device=device)
+        if channels_last:
+            example = example.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            model = torch.jit.freeze(torch.jit.trace(model, example))
+    elif compile_mode == "compile":
+        model = torch.compile(model)
+    return model
+
+
+def verify_equivalence(original, optimized, input_size, batch_size=8, atol=1e-4, seed=0):
+    """So sánh logits model gốc vs model đã tối ưu trên batch ngẫu nhiên, trả về max abs diff"""
+    h_input, w_input = input_size
+    device = next(original.parameters()).device
+    generator = torch.Generator().manual_seed(seed)
+    batch = (torch.rand(batch_size, 3, h_input, w_input, generator=generator) * 255).to(device)
+
+    with torch.no_grad():
+        expected = original(batch)
+        actual = optimized(batch.contiguous(memory_format=torch.channels_last))
+    max_diff = float((expected - actual).abs().max())
+    if max_diff > atol:
+        raise AssertionError(f"Logits lệch {max_diff:.2e} > {atol:.0e}")
+    return max_diff
+
+
+def _benchmark(model, batch, repeat):
+    with torch.no_grad():
+        for _ in range(3):  # warm-up (compile/script tối ưu ở vài lần chạy đầu)
+            model(batch)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model(batch)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tối ưu MiniFASNet cho inference + kiểm tra tương đương")
+    parser.add_argument("--dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--compile", choices=["script", "compile"], default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'model':<36} {'max |Δ|':>9} {'gốc ms':>8} {'tối ưu ms':>10} {'speedup':>8}")
+    for name in sorted(os.listdir(args.dir)):
+        if not (name.endswith(".pth") and "MiniFAS" in name):
+            continue
+        model, (h_input, w_input, _, _) = load_model(os.path.join(args.dir, name))
+        optimized = optimize_for_inference(model, channels_last=args.channels_last, compile_mode=args.compile,
+                                           input_size=(h_input, w_input))
+        max_diff = verify_equivalence(model, optimized, (h_input, w_input), batch_size=args.batch_size)
+
+        batch = torch.rand(args.batch_size, 3, h_input, w_input) * 255
+        if args.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        base_s = _benchmark(model, batch, args.repeat)
+        opt_s = _benchmark(optimized, batch, args.repeat)
+        print(f"{name:<36} {max_diff:>9.2e} {base_s * 1000:>8.2f} {opt_s * 1000:>10.2f} {base_s / opt_s:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+INT8 post-training static quantization cho MiniFASNet / MiniFASNetSE (ONNX Runtime, CPU)
+- Đầu vào: file .onnx FP32 (anti_spoof/onnx_backend.py) + thư mục crop mặt để calibrate
+- Crop phải được cắt bằng CropImage.crop với đúng scale/size của model, lưu BGR (cv2.imwrite)
+- Đầu ra: <tên>.int8.onnx (QDQ, weight int8 per-channel, activation uint8), chạy bằng OnnxModel
+
+Bố cục thư mục crop (dùng chung cho calibrate và đánh giá):
+    crops/<tên model không đuôi>/real/*.jpg, crops/<tên model>/fake/*.jpg
+    hoặc crops/real, crops/fake nếu chỉ có 1 model / mọi model cùng scale
+
+Torch FX quantization (torch.ao) đã deprecated và PReLU không có kernel int8 → dùng ONNX Runtime.
+
+Cách chạy:
+    python -m anti_spoof.quantize --calib crops/
+"""
+
+import argparse
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def int8_path_for(onnx_path):
+    """2.7_80x80_MiniFASNetV2.onnx → 2.7_80x80_MiniFASNetV2.int8.onnx"""
+    return os.path.splitext(onnx_path)[0] + ".int8.onnx"
+
+
+def model_crop_dir(root, model_path):
+    """Thư mục crop riêng của model (root/<tên model>) nếu có, không thì dùng chung root"""
+    stem = os.path.basename(model_path).split(".pth")[0].split(".int8")[0].split(".onnx")[0]
+    own = os.path.join(root, stem)
+    return own if os.path.isdir(own) else root
+
+
+def list_images(folder):
+    """Ảnh trong folder và các thư mục con, sắp theo đường dẫn tương đối"""
+    paths = []
+    for dirpath, _, names in os.walk(folder):
+        paths.extend(os.path.join(dirpath, n) for n in names if n.lower().endswith(IMAGE_EXTS))
+    return sorted(paths, key=lambda p: os.path.relpath(p, folder))
+
+
+def load_crops(paths, h_input, w_input):
+    """Đọc crop BGR → batch float32 (N, 3, h, w) giống input check_batch"""
+    batch = np.empty((len(paths), 3, h_input, w_input), dtype=np.float32)
+    for i, path in enumerate(paths):
+        img = cv2.imread(path)
+        if img is None:
+            raise IOError(f"Không đọc được ảnh: {path}")
+        if img.shape[:2] != (h_input, w_input):
+            img = cv2.resize(img, (w_input, h_input))
+        batch[i] = img.transpose(2, 0, 1)
+    return batch
+
+
+def _calibration_reader(batch, input_name, batch_size):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class CropReader(CalibrationDataReader):
+        def __init__(self):
+            self.chunks = iter(range(0, len(batch), batch_size))
+
+        def get_next(self):
+            start = next(self.chunks, None)
+            return None if start is None else {input_name: batch[start:start + batch_size]}
+
+    return CropReader()
+
+
+def quantize_model(onnx_path, calib_dir, int8_path=None, max_images=512, batch_size=16, seed=0):
+    """Calibrate trên crop trong calib_dir rồi quantize static, trả về đường dẫn .int8.onnx"""
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    from .onnx_backend import INPUT_NAME, OnnxModel
+
+    int8_path = int8_path or int8_path_for(onnx_path)
+    reference = OnnxModel(onnx_path)
+    paths = list_images(model_crop_dir(calib_dir, onnx_path))
+    if not paths:
+        raise FileNotFoundError(f"Không có ảnh calibrate trong {calib_dir}")
+    if len(paths) > max_images:
+        rng = np.random.default_rng(seed)
+        paths = [paths[i] for i in sorted(rng.choice(len(paths), max_images, replace=False))]
+    batch = load_crops(paths, reference.h_input, reference.w_input)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference + gộp node trước khi quantize (khuyến nghị của ORT)
+        prepared = os.path.join(tmp, "prepared.onnx")
+        quant_pre_process(onnx_path, prepared)
+        # QDQ + activation uint8 / weight int8 per-channel: format nhanh nhất trên CPU x86
+        quantize_static(prepared, int8_path, _calibration_reader(batch, INPUT_NAME, batch_size),
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, per_channel=True,
+                        calibrate_method=CalibrationMethod.MinMax)
+    return int8_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize INT8 các model anti-spoof ONNX")
+    parser.add_argument("--dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--calib", required=True, help="Thư mục crop mặt để calibrate")
+    parser.add_argument("--max-images", type=int, default=512)
+    args = parser.parse_args()
+
+    for name in sorted(os.listdir(args.dir)):
+        if not (name.endswith(".onnx") and "MiniFAS" in name and ".int8" not in name):
+            continue
+        int8_path = quantize_model(os.path.join(args.dir, name), args.calib, max_images=args.max_images)
+        print(f"   ✓ {name} → {os.path.basename(int8_path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Kiểm tra logits ONNX Runtime khớp PyTorch cho từng kiến trúc MiniFASNet (weights khởi tạo ngẫu nhiên,
+không cần file .pth thật) — export lệch thì fail
+
+Cách chạy:
+    python -m pytest anti_spoof/test_onnx_parity.py
+    python -m anti_spoof.test_onnx_parity
+"""
+
+import os
+import tempfile
+
+import torch
+
+from .models import MODEL_MAPPING
+from .onnx_backend import export_model, verify_parity
+from .utils import get_kernel
+
+ATOL = 1e-4
+H_INPUT, W_INPUT = 80, 80
+
+
+def random_checkpoint(model_type, out_dir, seed=0):
+    """Lưu state_dict ngẫu nhiên (cả running stats của BatchNorm) với tên file theo format parse_model_name"""
+    torch.manual_seed(seed)
+    model = MODEL_MAPPING[model_type](conv6_kernel=get_kernel(H_INPUT, W_INPUT))
+    for module in model.modules():
+        if isinstance(module, torch.nn.modules.batchnorm._BatchNorm):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 1.5)
+    path = os.path.join(out_dir, f"1_{H_INPUT}x{W_INPUT}_{model_type}.pth")
+    torch.save(model.state_dict(), path)
+    return path
+
+
+def check_parity(model_type):
+    with tempfile.TemporaryDirectory() as tmp:
+        pth_path = random_checkpoint(model_type, tmp)
+        return verify_parity(pth_path, export_model(pth_path), atol=ATOL)  # AssertionError nếu lệch > ATOL
+
+
+def test_onnx_parity():
+    for model_type in MODEL_MAPPING:
+        check_parity(model_type)
+
+
+if __name__ == "__main__":
+    for model_type in MODEL_MAPPING:
+        print(f"   ✓ {model_type}: max |Δlogits| = {check_parity(model_type):.2e}")
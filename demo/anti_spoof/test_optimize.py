@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Kiểm tra model đã tối ưu (gộp BN, channels_last, TorchScript) và model đọc từ cache cho logits khớp model gốc
+- Weights khởi tạo ngẫu nhiên, không cần file .pth thật
+- Cache: đổi weights → build lại; file cache build từ checkpoint khác → không dùng
+
+Cách chạy:
+    python -m pytest anti_spoof/test_optimize.py
+    python -m anti_spoof.test_optimize
+"""
+
+import os
+import tempfile
+
+import torch
+
+from .model_cache import cache_path_for, load_optimized_model
+from .models import MODEL_MAPPING, load_model
+from .optimize import optimize_for_inference, verify_equivalence
+from .test_onnx_parity import random_checkpoint
+
+ATOL = 1e-4
+VARIANTS = [
+    {},
+    {"channels_last": True},
+    {"compile_mode": "script"},
+    {"channels_last": True, "compile_mode": "script"},
+]
+
+
+def check_optimize(model_type):
+    """max |Δlogits| lớn nhất qua các biến thể tối ưu, AssertionError nếu lệch > ATOL"""
+    with tempfile.TemporaryDirectory() as tmp:
+        model, info = load_model(random_checkpoint(model_type, tmp))
+    return max(verify_equivalence(model, optimize_for_inference(model, input_size=info[:2], **options),
+                                  info[:2], atol=ATOL)
+               for options in VARIANTS)
+
+
+def test_optimize_equivalence():
+    for model_type in MODEL_MAPPING:
+        check_optimize(model_type)
+
+
+def test_model_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, ".cache")
+        pth_path = random_checkpoint("MiniFASNetV2", tmp, seed=0)
+        original, info = load_model(pth_path)
+
+        _, _, hit = load_optimized_model(pth_path, cache_dir=cache_dir)
+        cached, _, hit_again = load_optimized_model(pth_path, cache_dir=cache_dir)
+        assert not hit and hit_again
+        verify_equivalence(original, cached, info[:2], atol=ATOL)
+
+        # Checkpoint đổi weights → key khác, build lại đúng weights mới, cache cũ bị xoá
+        old_cache = cache_path_for(pth_path, "cpu", cache_dir=cache_dir)
+        random_checkpoint("MiniFASNetV2", tmp, seed=1)  # ghi đè cùng file
+        rebuilt, _, hit = load_optimized_model(pth_path, cache_dir=cache_dir)
+        assert not hit and not os.path.exists(old_cache)
+        verify_equivalence(load_model(pth_path)[0], rebuilt, info[:2], atol=ATOL)
+
+        # File cache của checkpoint khác bị đặt vào đúng tên → phát hiện qua hash ghi trong file, build lại
+        new_cache = cache_path_for(pth_path, "cpu", cache_dir=cache_dir)
+        torch.jit.save(cached, new_cache, _extra_files={"checkpoint": "0" * 16})
+        _, _, hit = load_optimized_model(pth_path, cache_dir=cache_dir)
+        assert not hit
+
+
+if __name__ == "__main__":
+    for model_type in MODEL_MAPPING:
+        print(f"   ✓ {model_type}: max |Δlogits| = {check_optimize(model_type):.2e}")
+    test_model_cache()
+    print("   ✓ model_cache")
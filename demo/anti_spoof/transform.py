@@ -27,3 +27,55 @@ class ToTensor:
             img = torch.from_numpy(pic.transpose((2, 0, 1)))
             return img.float()
         raise TypeError(f'pic should be ndarray. Got {type(pic)}')
+
+
+class BatchBuffer:
+    """
+    Buffer input dùng lại giữa các lần gọi cho 1 model: thay ToTensor + stack + .to(device) mỗi frame
+    - staging: (capacity, h, w, 3) uint8, cv2.resize ghi thẳng vào (CropImage.crop_batch)
+    - host: (capacity, 3, h, w) float32, pinned khi chạy CUDA để copy non_blocking
+    - device: bản sao trên GPU (chỉ khi device là CUDA)
+    Chỉ cấp phát lại khi số mặt vượt capacity (tăng gấp đôi) → steady state không cấp phát
+    """
+
+    def __init__(self, h_input, w_input, capacity=8, device="cpu", channels_last=False):
+        self.h_input = h_input
+        self.w_input = w_input
+        self.device = torch.device(device)
+        self.channels_last = channels_last
+        self.pinned = self.device.type == "cuda"
+        self.capacity = 0
+        self.reserve(capacity)
+
+    def reserve(self, n):
+        """Đảm bảo buffer chứa được n mặt"""
+        if n <= self.capacity:
+            return
+        capacity = max(n, self.capacity * 2)
+        shape = (capacity, 3, self.h_input, self.w_input)
+        memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+
+        self.staging = np.empty((capacity, self.h_input, self.w_input, 3), dtype=np.uint8)
+        self.host = torch.empty(shape, dtype=torch.float32, pin_memory=self.pinned,
+                                memory_format=memory_format)
+        self.host_np = self.host.numpy()  # cùng bộ nhớ, để numpy/cv2 ghi vào
+        self.device_tensor = (torch.empty(shape, dtype=torch.float32, device=self.device,
+                                          memory_format=memory_format)
+                              if self.pinned else None)
+        self.capacity = capacity
+
+    def crops(self, n):
+        """View (n, h, w, 3) uint8 để ghi crop"""
+        self.reserve(n)
+        return self.staging[:n]
+
+    def batch(self, n):
+        """View numpy (n, 3, h, w) float32 của host buffer"""
+        self.reserve(n)
+        return self.host_np[:n]
+
+    def to_device(self, n):
+        """Tensor (n, 3, h, w) trên device: CPU dùng thẳng host buffer, CUDA copy non_blocking từ pinned"""
+        if self.device_tensor is None:
+            return self.host[:n]
+        return self.device_tensor[:n].copy_(self.host[:n], non_blocking=True)
@@ -70,3 +70,103 @@ class CropImage:
         
         img = org_img[left_top_y:right_bottom_y + 1, left_top_x:right_bottom_x + 1]
         return cv2.resize(img, (out_w, out_h))
+    
+    @staticmethod
+    def _get_new_boxes(src_w, src_h, bboxes, scale):
+        """Bản vector hoá của _get_new_box cho N bbox [x, y, w, h] → (N, 4) int [x1, y1, x2, y2]"""
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        x, y, box_w, box_h = bboxes.T
+        
+        scale = np.minimum(np.minimum((src_h - 1) / box_h, (src_w - 1) / box_w), scale)
+        new_width = box_w * scale
+        new_height = box_h * scale
+        center_x = box_w / 2 + x
+        center_y = box_h / 2 + y
+        
+        left_top_x = center_x - new_width / 2
+        left_top_y = center_y - new_height / 2
+        right_bottom_x = center_x + new_width / 2
+        right_bottom_y = center_y + new_height / 2
+        
+        # Dịch box vào trong ảnh, cùng thứ tự với _get_new_box
+        shift = np.minimum(left_top_x, 0)
+        right_bottom_x -= shift
+        left_top_x -= shift
+        shift = np.minimum(left_top_y, 0)
+        right_bottom_y -= shift
+        left_top_y -= shift
+        shift = np.maximum(right_bottom_x - (src_w - 1), 0)
+        left_top_x -= shift
+        right_bottom_x -= shift
+        shift = np.maximum(right_bottom_y - (src_h - 1), 0)
+        left_top_y -= shift
+        right_bottom_y -= shift
+        
+        # int() cắt về phía 0 như bản gốc
+        return np.trunc(np.stack([left_top_x, left_top_y, right_bottom_x, right_bottom_y], axis=1)).astype(np.int64)
+    
+    def crop_batch(self, org_img, bboxes, configs, channels_last=False, method="resize", buffers=None):
+        """
+        Crop + resize N mặt cho nhiều model trong 1 lần gọi
+        bboxes: (N, 4) [x, y, w, h]; configs: list (scale, out_w, out_h), scale None = resize cả ảnh
+        method: "resize" (giống hệt crop()) hoặc "warp" (warpAffine thẳng từ frame, không cắt slice)
+        buffers: list BatchBuffer (transform.py) theo thứ tự configs → ghi vào buffer dùng lại, không cấp phát
+        Returns: list batch float32 (N, 3, out_h, out_w) theo thứ tự configs, sẵn sàng đưa vào model
+                 channels_last=True → cùng shape nhưng bộ nhớ NHWC (khớp model torch channels_last)
+        """
+        src_h, src_w = org_img.shape[:2]
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        batches = []
+        
+        for k, (scale, out_w, out_h) in enumerate(configs):
+            if buffers is not None:
+                crops = buffers[k].crops(len(bboxes))
+            else:
+                crops = np.empty((len(bboxes), out_h, out_w, 3), dtype=np.uint8)
+            if scale is None:
+                crops[:] = cv2.resize(org_img, (out_w, out_h))
+            else:
+                boxes = self._get_new_boxes(src_w, src_h, bboxes, scale)
+                for i, (x1, y1, x2, y2) in enumerate(boxes):
+                    if method == "warp":
+                        # Ánh xạ tâm pixel giống cv2.resize: src = (dst + 0.5) * roi / out - 0.5 + x1
+                        sx, sy = out_w / (x2 - x1 + 1), out_h / (y2 - y1 + 1)
+                        matrix = np.array([[sx, 0, sx * (0.5 - x1) - 0.5], [0, sy, sy * (0.5 - y1) - 0.5]])
+                        cv2.warpAffine(org_img, matrix, (out_w, out_h), dst=crops[i], flags=cv2.INTER_LINEAR,
+                                       borderMode=cv2.BORDER_REPLICATE)
+                    else:
+                        cv2.resize(org_img[y1:y2 + 1, x1:x2 + 1], (out_w, out_h), dst=crops[i])
+            
+            # HWC → CHW + uint8 → float32 trong 1 lần copy cho cả batch
+            if buffers is not None:
+                batch = buffers[k].batch(len(bboxes))
+            elif channels_last:
+                batch = np.empty((len(bboxes), out_h, out_w, 3), dtype=np.float32).transpose(0, 3, 1, 2)
+            else:
+                batch = np.empty((len(bboxes), 3, out_h, out_w), dtype=np.float32)
+            np.copyto(batch, crops.transpose(0, 3, 1, 2))
+            batches.append(batch)
+        
+        return batches
+
+
+def crop_batch_torch(frame, boxes, out_w, out_h):
+    """
+    Crop + resize bilinear trên GPU cho N box cùng lúc (F.affine_grid + grid_sample)
+    frame: tensor float (1, 3, H, W) đã ở trên device; boxes: (N, 4) int [x1, y1, x2, y2] (từ _get_new_boxes)
+    Returns: tensor (N, 3, out_h, out_w), cùng quy ước tâm pixel với cv2.resize
+    """
+    import torch
+    import torch.nn.functional as F
+    
+    _, _, src_h, src_w = frame.shape
+    boxes = torch.as_tensor(boxes, dtype=torch.float32, device=frame.device).reshape(-1, 4)
+    x1, y1, x2, y2 = boxes.unbind(1)
+    theta = torch.zeros(len(boxes), 2, 3, device=frame.device)
+    theta[:, 0, 0] = (x2 + 1 - x1) / src_w
+    theta[:, 0, 2] = (x1 + x2 + 1) / src_w - 1
+    theta[:, 1, 1] = (y2 + 1 - y1) / src_h
+    theta[:, 1, 2] = (y1 + y2 + 1) / src_h - 1
+    grid = F.affine_grid(theta, (len(boxes), frame.shape[1], out_h, out_w), align_corners=False)
+    return F.grid_sample(frame.expand(len(boxes), -1, -1, -1), grid, mode="bilinear",
+                         padding_mode="border", align_corners=False)
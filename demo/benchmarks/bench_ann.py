@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark recall vs latency: IVFIndex so với exact scan của FaceGallery
+
+Cách chạy:
+    python benchmarks/bench_ann.py --size 50000
+    python benchmarks/bench_ann.py --size 100000 --n-lists 1024 --n-probe 1 4 8 16 32
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_gallery import FaceGallery, l2_normalize  # noqa: E402
+from ann_index import IVFIndex  # noqa: E402
+
+
+def synthetic_gallery(size, dim, n_clusters, seed):
+    """Gallery giả lập: embedding gom cụm quanh n_clusters tâm (giống phân bố embedding thật hơn uniform)"""
+    rng = np.random.default_rng(seed)
+    centers = l2_normalize(rng.standard_normal((n_clusters, dim)))
+    labels = rng.integers(0, n_clusters, size)
+    emb = centers[labels] + 0.6 * rng.standard_normal((size, dim)) / np.sqrt(dim)
+    return FaceGallery([f"P{i:06d}" for i in range(size)], [""] * size, emb)
+
+
+def make_queries(gallery, n_queries, noise, seed):
+    """Query = embedding trong gallery + nhiễu (mô phỏng ảnh chụp khác của cùng người)"""
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.choice(len(gallery), n_queries, replace=False)
+    q = gallery.matrix[rows] + noise * rng.standard_normal((n_queries, gallery.dim)) / np.sqrt(gallery.dim)
+    return l2_normalize(q)
+
+
+def timed_search(gallery, queries, k, batch):
+    """Search theo batch, trả về (indices, ms/query)"""
+    out = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        out.append(gallery.search(queries[i:i + batch], k=k)[0])
+    elapsed = time.perf_counter() - start
+    return np.concatenate(out), elapsed * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVFIndex vs exact scan")
+    parser.add_argument("--size", type=int, default=50000, help="Số embedding trong gallery")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=2000, help="Số cụm của gallery giả lập")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.3)
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--batch", type=int, default=1, help="Số probe mỗi lần search (1 = 1 face/lần)")
+    parser.add_argument("--n-lists", type=int, default=None, help="Mặc định 4*sqrt(N)")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    gallery = synthetic_gallery(args.size, args.dim, args.clusters, args.seed)
+    queries = make_queries(gallery, args.queries, args.noise, args.seed)
+
+    exact_idx, exact_ms = timed_search(gallery, queries, args.k, args.batch)
+    print(f"Gallery: {args.size} x {args.dim}, queries: {args.queries}, k={args.k}, batch={args.batch}")
+    print(f"Exact scan: {exact_ms:.3f} ms/query")
+
+    start = time.perf_counter()
+    index = IVFIndex(n_lists=args.n_lists, seed=args.seed).build(gallery.matrix)
+    print(f"IVF build: {index.n_lists} lists trong {time.perf_counter() - start:.2f}s")
+    gallery.index = index
+
+    print(f"{'n_probe':>8} {'recall@' + str(args.k):>10} {'ms/query':>10} {'speedup':>8}")
+    for n_probe in args.n_probe:
+        index.n_probe = n_probe
+        idx, ms = timed_search(gallery, queries, args.k, args.batch)
+        # Recall = tỉ lệ kết quả top-k exact được ANN tìm thấy (index -1 = list probe không đủ k row)
+        hits = sum(len(np.intersect1d(a[a >= 0], b)) for a, b in zip(idx, exact_idx))
+        recall = hits / exact_idx.size
+        print(f"{n_probe:>8} {recall:>10.4f} {ms:>10.3f} {exact_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark throughput anti-spoof: check() từng mặt so với check_batch() cả frame
+
+Cách chạy:
+    python benchmarks/bench_antispoof.py
+    python benchmarks/bench_antispoof.py --faces 1 4 16 32 64 --repeat 20
+    python benchmarks/bench_antispoof.py --backend onnx
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_recognition_demo import AntiSpoofEngine  # noqa: E402
+
+
+def make_frame_and_bboxes(num_faces, width, height, seed):
+    """Frame ngẫu nhiên + num_faces bbox (x1, y1, x2, y2) kích thước 80-200px"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    sizes = rng.integers(80, 200, num_faces)
+    x1 = rng.integers(0, width - sizes)
+    y1 = rng.integers(0, height - sizes)
+    return frame, [np.array([x, y, x + s, y + s], dtype=np.float32) for x, y, s in zip(x1, y1, sizes)]
+
+
+def measure(fn, repeat):
+    """Chạy fn repeat lần (ẩn log [SF]), trả về thời gian trung bình (s)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AntiSpoofEngine.check vs check_batch")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch")
+    args = parser.parse_args()
+
+    engine = AntiSpoofEngine(device_id=0, backend=args.backend)
+    if not engine.load():
+        print("❌ Không load được anti-spoof models")
+        sys.exit(1)
+
+    print(f"{'faces':>6} {'loop ms':>10} {'batch ms':>10} {'loop f/s':>10} {'batch f/s':>10} {'speedup':>8}")
+    for num_faces in args.faces:
+        frame, bboxes = make_frame_and_bboxes(num_faces, args.width, args.height, args.seed)
+        loop_s = measure(lambda: [engine.check(frame, b) for b in bboxes], args.repeat)
+        batch_s = measure(lambda: engine.check_batch(frame, bboxes), args.repeat)
+        print(f"{num_faces:>6} {loop_s * 1000:>10.2f} {batch_s * 1000:>10.2f} "
+              f"{num_faces / loop_s:>10.1f} {num_faces / batch_s:>10.1f} {loop_s / batch_s:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
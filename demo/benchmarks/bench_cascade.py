@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark cascade anti-spoof: tỉ lệ exit sớm, latency/mặt và độ khớp với ensemble đầy đủ theo margin
+Có --source + --label (real/fake) thì tính thêm accuracy (cần insightface để detect mặt);
+không có nhãn thì chỉ in exit sớm / latency / độ khớp, không có cột accuracy
+
+Cách chạy:
+    python benchmarks/bench_cascade.py
+    python benchmarks/bench_cascade.py --source real_faces.mp4 --label real --margins 0.2 0.4 0.6 0.8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from face_recognition_demo import AntiSpoofEngine  # noqa: E402
+from bench_antispoof import make_frame_and_bboxes  # noqa: E402
+
+
+def load_samples(args):
+    """list (frame, bboxes x1y1x2y2): từ video/ảnh (detect bằng insightface) hoặc frame ngẫu nhiên"""
+    if args.source is None:
+        return [make_frame_and_bboxes(args.faces, 1920, 1080, seed) for seed in range(args.frames)]
+
+    from insightface.app import FaceAnalysis
+    from frame_source import iter_frames
+
+    face_model = FaceAnalysis(name='buffalo_l', allowed_modules=['detection'],
+                              providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+    face_model.prepare(ctx_id=0, det_size=(640, 640))
+    samples = []
+    for frame in iter_frames(args.source, args.frames):
+        bboxes, _ = face_model.det_model.detect(frame, input_size=(640, 640), max_num=0, metric='default')
+        if len(bboxes):
+            samples.append((frame, [b[:4] for b in bboxes]))
+    return samples
+
+
+def run(engine, samples):
+    """Kết quả (is_real, score, label) của mọi mặt + thời gian/mặt (s), ẩn log [SF]"""
+    results, faces = [], 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.check_batch(*samples[0])  # warm-up
+        start = time.perf_counter()
+        for frame, bboxes in samples:
+            results += engine.check_batch(frame, bboxes)
+            faces += len(bboxes)
+        elapsed = time.perf_counter() - start
+    return results, elapsed / max(faces, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cascade anti-spoof theo margin")
+    parser.add_argument("--source", default=None, help="File video hoặc thư mục ảnh (mặc định: frame ngẫu nhiên)")
+    parser.add_argument("--label", choices=["real", "fake"], default=None, help="Nhãn đúng của mọi mặt trong source")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--faces", type=int, default=8, help="Số mặt/frame khi dùng frame ngẫu nhiên")
+    parser.add_argument("--margins", type=float, nargs="+", default=[0.2, 0.4, 0.6, 0.8, 0.95])
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch")
+    args = parser.parse_args()
+
+    engine = AntiSpoofEngine(device_id=0, backend=args.backend, cascade=False)
+    if not engine.load():
+        print("❌ Không load được anti-spoof models")
+        sys.exit(1)
+    if len(engine.models) < 2:
+        print("⚠️ Chỉ có 1 model, cascade không có tác dụng")
+
+    samples = load_samples(args)
+    if not samples:
+        print("❌ Không có mặt nào để đánh giá")
+        sys.exit(1)
+    print("Thứ tự cascade: " + ", ".join(f"{name} ({engine.models[name]['latency'] * 1000:.1f} ms)"
+                                         for name in engine.cascade_order))
+
+    labelled = args.source is not None and args.label is not None  # frame ngẫu nhiên không có nhãn đúng
+    full, full_s = run(engine, samples)
+    full_real = np.array([r[0] for r in full])
+
+    def report(name, results, seconds, early_exit):
+        is_real = np.array([r[0] for r in results])
+        agree = float(np.mean(is_real == full_real))
+        line = f"{name:<10} {early_exit * 100:>9.1f}% {seconds * 1000:>8.2f} {full_s / seconds:>7.2f}x {agree:>7.3f}"
+        if labelled:
+            line += f" {float(np.mean(is_real == (args.label == 'real'))):>9.3f}"
+        print(line)
+
+    header = f"{'margin':<10} {'exit sớm':>10} {'ms/mặt':>8} {'speedup':>8} {'agree':>7}"
+    print(header + (f" {'accuracy':>9}" if labelled else ""))
+    report("full", full, full_s, 0.0)
+    engine.cascade = True
+    for margin in args.margins:
+        engine.cascade_margin = margin
+        engine.cascade_stats.update(faces=0, early_exit=0, model_runs=0)
+        results, seconds = run(engine, samples)
+        report(f"{margin:.2f}", results, seconds, engine.early_exit_ratio())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark recall + latency: MultiScaleDetector so với detect cố định DET_SIZE (1920, 1920)
+Recall tính trên mặt mà detect 1920 tìm được (IoU >= --iou với 1 mặt của multiscale)
+
+Cách chạy (cần insightface):
+    python benchmarks/bench_detection.py --source classroom.mp4 --max-frames 300
+    python benchmarks/bench_detection.py --source snapshots/ --coarse-sizes 480 640 960
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from frame_source import iter_frames  # noqa: E402
+from face_tracker import iou_matrix  # noqa: E402
+from multiscale_detect import MultiScaleDetector  # noqa: E402
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-scale detection vs DET_SIZE cố định")
+    parser.add_argument("--source", required=True, help="File video hoặc thư mục ảnh")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--full-size", type=int, default=1920)
+    parser.add_argument("--coarse-sizes", type=int, nargs="+", default=[320, 480, 640, 960, 1280])
+    parser.add_argument("--min-face-px", type=int, default=20)
+    parser.add_argument("--refresh", type=int, default=30, help="Số frame giữa 2 lần detect full-size")
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    from insightface.app import FaceAnalysis
+    full_size = (args.full_size, args.full_size)
+    face_model = FaceAnalysis(name='buffalo_l', allowed_modules=['detection'],
+                              providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+    face_model.prepare(ctx_id=0, det_size=full_size)
+    det_model = face_model.det_model
+    detector = MultiScaleDetector(det_model, coarse_sizes=args.coarse_sizes, full_size=full_size,
+                                  min_face_px=args.min_face_px, full_refresh_interval=args.refresh)
+
+    fixed_times, multi_times = [], []
+    ref_faces = matched = multi_faces = 0
+    for frame in iter_frames(args.source, args.max_frames):
+        start = time.perf_counter()
+        ref, _ = det_model.detect(frame, input_size=full_size, max_num=0, metric='default')
+        fixed_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found, _ = detector.detect(frame)
+        multi_times.append(time.perf_counter() - start)
+
+        ref_faces += len(ref)
+        multi_faces += len(found)
+        if len(ref) and len(found):
+            matched += int(np.sum(iou_matrix(ref[:, :4], found[:, :4]).max(axis=1) >= args.iou))
+
+    if not fixed_times:
+        print(f"❌ Không đọc được frame nào từ {args.source}")
+        sys.exit(1)
+
+    recall = matched / ref_faces if ref_faces else 1.0
+    print(f"Frames: {len(fixed_times)}, mặt (fixed {args.full_size}): {ref_faces}, mặt (multiscale): {multi_faces}")
+    print(f"{'mode':<12} {'avg ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall':>8}")
+    print(f"{'fixed':<12} {np.mean(fixed_times) * 1000:>8.1f} {percentile_ms(fixed_times, 50):>8.1f} "
+          f"{percentile_ms(fixed_times, 95):>8.1f} {1.0:>8.3f}")
+    print(f"{'multiscale':<12} {np.mean(multi_times) * 1000:>8.1f} {percentile_ms(multi_times, 50):>8.1f} "
+          f"{percentile_ms(multi_times, 95):>8.1f} {recall:>8.3f}")
+    print(f"Multiscale: {detector.stats}")
+
+
+if __name__ == "__main__":
+    main()
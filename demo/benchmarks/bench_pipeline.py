@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark pipeline nhận diện headless (không cần camera RTSP / cửa sổ Tk) trên video hoặc thư mục ảnh
+- Mặc định chạy đúng các stage của RecognitionPipeline (detect → is_frontal_face + anti-spoof → nhận diện →
+  annotate) tuần tự cho từng frame, không bỏ frame nào
+- --per-face: đường cũ từng mặt một: face_model.get → is_frontal_face → AntiSpoofEngine.check → recognize_face
+- Báo cáo: FPS, latency từng stage (p50/p90/p99), số mặt/giây, peak RSS; --json để lưu và so sánh các lần chạy
+
+Cách chạy (cần insightface):
+    python benchmarks/bench_pipeline.py --source classroom.mp4 --max-frames 300
+    python benchmarks/bench_pipeline.py --source snapshots/ --detection fixed --det-size 640 --json runs/640.json
+    python benchmarks/bench_pipeline.py --source classroom.mp4 --per-face --no-liveness
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from frame_source import iter_frames  # noqa: E402
+import face_recognition_demo as demo  # noqa: E402
+from metrics import enable_log  # noqa: E402
+from pipeline import RecognitionPipeline  # noqa: E402
+
+STAGES = ("detect", "liveness", "recognize", "annotate")
+
+
+def peak_rss_mb():
+    """Peak RSS của process (MB), None nếu không đo được trên hệ điều hành này"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # macOS: bytes, Linux: KB
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)  # Windows
+    except (ImportError, AttributeError):
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def latency_summary(samples):
+    """ms: mean, p50, p90, p99, max"""
+    if not samples:
+        return {"count": 0}
+    ms = np.array(samples) * 1000
+    return {"count": len(ms), "mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)),
+            "p90_ms": float(np.percentile(ms, 90)), "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max())}
+
+
+def build_pipeline(args, face_model, anti_spoof, gallery):
+    """RecognitionPipeline không stream/thread, gắn model + tuỳ chọn như App"""
+    pipeline = RecognitionPipeline(None, args.threshold, demo.is_frontal_face)
+    pipeline.face_model = face_model
+    pipeline.anti_spoof = anti_spoof
+    pipeline.gallery = gallery
+    pipeline.detect_enabled = True
+    pipeline.liveness_enabled = anti_spoof is not None
+    pipeline.recognize_enabled = gallery is not None
+    if args.detection == "multiscale":
+        from multiscale_detect import MultiScaleDetector
+        pipeline.detector = MultiScaleDetector(face_model.det_model, full_size=(args.det_size, args.det_size),
+                                               full_refresh_interval=demo.MULTISCALE_FULL_REFRESH)
+    if args.tracking:
+        from face_tracker import FaceTracker
+        pipeline.tracker = FaceTracker(liveness_ttl=demo.LIVENESS_TTL, identity_ttl=demo.IDENTITY_TTL)
+    if args.motion_gate:
+        from motion_gate import MotionGate
+        pipeline.motion_gate = MotionGate(min_changed_ratio=demo.MOTION_MIN_CHANGED_RATIO,
+                                          max_skip=demo.MOTION_MAX_SKIP)
+    return pipeline
+
+
+def run_pipeline(pipeline, frame, timings):
+    """Chạy lần lượt các stage của pipeline cho 1 frame, trả về số mặt detect được"""
+    packet = {"seq": 0, "frame": frame, "faces": [], "captured_at": time.time()}
+    handlers = {"detect": pipeline._detect, "liveness": pipeline._liveness,
+                "recognize": pipeline._recognize, "annotate": pipeline._annotate}
+    for name in STAGES:
+        start = time.perf_counter()
+        handlers[name](packet)
+        timings[name].append(time.perf_counter() - start)
+    return len(packet["faces"])
+
+
+def run_per_face(face_model, anti_spoof, gallery, threshold, frame, timings):
+    """Đường xử lý từng mặt như App trước khi có pipeline: get → is_frontal_face → check → recognize_face"""
+    start = time.perf_counter()
+    faces = face_model.get(frame)
+    timings["detect"].append(time.perf_counter() - start)
+
+    live_s = recog_s = 0.0
+    for face in faces:
+        start = time.perf_counter()
+        is_frontal, _ = demo.is_frontal_face(face.kps)
+        is_real = True
+        if is_frontal and anti_spoof is not None:
+            is_real = anti_spoof.check(frame, face.bbox)[0]
+        live_s += time.perf_counter() - start
+        if is_frontal and is_real and gallery is not None:
+            start = time.perf_counter()
+            demo.recognize_face(face.embedding, gallery, threshold)
+            recog_s += time.perf_counter() - start
+    timings["liveness"].append(live_s)
+    timings["recognize"].append(recog_s)
+    return len(faces)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline nhận diện headless trên video / thư mục ảnh")
+    parser.add_argument("--source", required=True, help="File video hoặc thư mục ảnh")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=5, help="Số frame đầu chạy nhưng không tính")
+    parser.add_argument("--det-size", type=int, default=demo.DET_SIZE[0])
+    parser.add_argument("--detection", choices=["fixed", "multiscale"], default=demo.DETECTION_MODE)
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=demo.ANTISPOOF_BACKEND)
+    parser.add_argument("--cascade", action="store_true", help="Anti-spoof cascade (ANTISPOOF_CASCADE)")
+    parser.add_argument("--tracking", action="store_true", help="Bật FaceTracker (cache liveness/identity)")
+    parser.add_argument("--motion-gate", action="store_true", help="Bật MotionGate (bỏ detect khi đứng yên)")
+    parser.add_argument("--no-liveness", action="store_true")
+    parser.add_argument("--no-recognize", action="store_true")
+    parser.add_argument("--per-face", action="store_true", help="Đường xử lý từng mặt (check + recognize_face)")
+    parser.add_argument("--gallery", default=demo.FACE_DATABASE_PATH)
+    parser.add_argument("--threshold", type=float, default=demo.RECOGNITION_THRESHOLD)
+    parser.add_argument("--scoring", choices=["max", "centroid", "topk"], default=demo.RECOGNITION_SCORING,
+                        help="Gộp similarity khi 1 người có nhiều embedding")
+    parser.add_argument("--top-k", type=int, default=demo.RECOGNITION_TOP_K)
+    parser.add_argument("--json", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if not demo.INSIGHTFACE_AVAILABLE:
+        print("❌ Cần insightface để detect mặt")
+        sys.exit(1)
+
+    det_size = (args.det_size, args.det_size)
+    load_start = time.perf_counter()
+    face_model = demo.load_face_model(det_size)
+    anti_spoof = None
+    if not args.no_liveness and demo.ANTISPOOF_AVAILABLE:
+        anti_spoof = demo.AntiSpoofEngine(device_id=0, backend=args.backend, cascade=args.cascade)
+        if not anti_spoof.load():
+            anti_spoof = None
+    gallery = None
+    if not args.no_recognize:
+        gallery, _ = demo.load_gallery_with_log(args.gallery)  # áp log enroll chưa compact như demo
+        gallery.set_scoring(args.scoring, args.top_k)
+        gallery = gallery or None
+        if gallery is not None and len(gallery) >= demo.ANN_MIN_GALLERY_SIZE:
+            demo.load_or_build_ivf(gallery, demo.ANN_INDEX_PATH, n_probe=demo.ANN_N_PROBE)
+    load_s = time.perf_counter() - load_start
+
+    if args.per_face:
+        process = lambda frame, timings: run_per_face(  # noqa: E731
+            face_model, anti_spoof, gallery, args.threshold, frame, timings)
+    else:
+        pipeline = build_pipeline(args, face_model, anti_spoof, gallery)
+        process = lambda frame, timings: run_pipeline(pipeline, frame, timings)  # noqa: E731
+
+    timings = {name: [] for name in STAGES}
+    frame_times, faces, frames = [], 0, 0
+    wall_start = None
+    for i, frame in enumerate(iter_frames(args.source, args.max_frames + args.warmup)):
+        if i == args.warmup:
+            timings = {name: [] for name in STAGES}
+            wall_start = time.perf_counter()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # ẩn log in ra trong lúc đo
+            num_faces = process(frame, timings)
+        if i >= args.warmup:
+            frame_times.append(time.perf_counter() - start)
+            faces += num_faces
+            frames += 1
+    if not frames:
+        print(f"❌ Không đủ frame trong {args.source} (cần > {args.warmup} frame warm-up)")
+        sys.exit(1)
+    wall_s = time.perf_counter() - wall_start
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "source": args.source, "mode": "per_face" if args.per_face else "pipeline",
+            "det_size": args.det_size, "detection": None if args.per_face else args.detection,
+            "antispoof_backend": args.backend if anti_spoof is not None else None, "cascade": args.cascade,
+            "tracking": args.tracking, "motion_gate": args.motion_gate,
+            "gallery_size": len(gallery) if gallery is not None else 0,
+            "gallery_embeddings": gallery.num_embeddings if gallery is not None else 0,
+            "scoring": gallery.scoring if gallery is not None else None,
+        },
+        "load_s": load_s,
+        "frames": frames,
+        "faces": faces,
+        "wall_s": wall_s,
+        "fps": frames / wall_s,
+        "faces_per_s": faces / wall_s,
+        "frame": latency_summary(frame_times),
+        "stages": {name: latency_summary(samples) for name, samples in timings.items() if samples},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    print(f"Frames: {frames} | mặt: {faces} ({faces / frames:.1f}/frame) | load model: {load_s:.1f}s")
+    print(f"FPS: {report['fps']:.2f} | mặt/s: {report['faces_per_s']:.1f} | peak RSS: "
+          + (f"{report['peak_rss_mb']:.0f} MB" if report["peak_rss_mb"] is not None else "n/a"))
+    print(f"{'stage':<10} {'mean ms':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, summary in list(report["stages"].items()) + [("frame", report["frame"])]:
+        print(f"{name:<10} {summary['mean_ms']:>8.2f} {summary['p50_ms']:>8.2f} {summary['p90_ms']:>8.2f} "
+              f"{summary['p99_ms']:>8.2f} {summary['max_ms']:>8.2f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✅ Đã ghi {args.json}")
+
+
+if __name__ == "__main__":
+    if demo.ANTISPOOF_LOG_EVERY:
+        enable_log("anti_spoof")
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark throughput ProcessInferencePool theo số worker (so với số core)
+--workload full: pipeline đầy đủ (detect + anti-spoof + nhận diện, cần insightface)
+--workload antispoof: chỉ anti-spoof trên bbox cố định (đo được cả khi chưa cài insightface)
+
+Cách chạy:
+    python benchmarks/bench_process_pool.py --source classroom.mp4
+    python benchmarks/bench_process_pool.py --workload antispoof --workers 1 2 4 8 --frames 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from process_pool import ProcessInferencePool, auto_worker_count, available_cores  # noqa: E402
+
+
+def load_antispoof_processor(num_faces=8):
+    """Factory cho worker: chỉ chạy AntiSpoofEngine.check_batch trên num_faces bbox cố định"""
+    import contextlib
+    import io
+    from face_recognition_demo import AntiSpoofEngine
+
+    engine = AntiSpoofEngine(device_id=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not engine.load():
+            raise RuntimeError("Không load được anti-spoof models")
+
+    def process(frame):
+        h, w = frame.shape[:2]
+        size = min(h, w) // 4
+        bboxes = [[(i * size) % (w - size), (i * size // 2) % (h - size)] for i in range(num_faces)]
+        bboxes = [[x, y, x + size, y + size] for x, y in bboxes]
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [result[0] for result in engine.check_batch(frame, bboxes)]
+    return process
+
+
+def load_frames(source, max_frames, seed=0):
+    if source is None:
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        return [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(min(max_frames, 16))]
+    from frame_source import iter_frames
+    return list(iter_frames(source, max_frames))
+
+
+def run(pool, frames, total):
+    """Gửi total frame (lặp lại danh sách frames), trả về frame/s"""
+    start = time.perf_counter()
+    futures = [pool.submit(frames[i % len(frames)]) for i in range(total)]
+    for future in futures:
+        future.result()
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    cores = available_cores()
+    parser = argparse.ArgumentParser(description="Benchmark ProcessInferencePool theo số worker")
+    parser.add_argument("--source", default=None, help="File video hoặc thư mục ảnh (mặc định: frame ngẫu nhiên)")
+    parser.add_argument("--workload", choices=["full", "antispoof"], default="full")
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=200, help="Số frame gửi mỗi lần đo")
+    args = parser.parse_args()
+
+    auto = auto_worker_count(args.threads_per_worker)
+    counts = args.workers or sorted({1, 2, 4, 8, 16, 32, auto} & set(range(1, auto + 1)) | {auto})
+    frames = load_frames(args.source, args.frames)
+    if not frames:
+        print(f"❌ Không đọc được frame nào từ {args.source}")
+        sys.exit(1)
+    shape = max(f.shape[0] for f in frames), max(f.shape[1] for f in frames), 3
+    factory = ("process_pool:load_frame_processor" if args.workload == "full"
+               else "bench_process_pool:load_antispoof_processor")
+
+    print(f"Cores khả dụng: {cores}, auto workers: {auto} ({args.threads_per_worker} thread/worker)")
+    print(f"{'workers':>8} {'load s':>8} {'frame/s':>9} {'speedup':>8} {'hiệu suất':>10}")
+    base = None
+    for count in counts:
+        pool = ProcessInferencePool(num_workers=count, threads_per_worker=args.threads_per_worker,
+                                    worker_factory=factory, max_frame_shape=shape).start()
+        try:
+            run(pool, frames, count * 2)  # warm-up mỗi worker
+            fps = run(pool, frames, args.frames)
+        finally:
+            load_s = pool.stats()["load_s"]
+            pool.stop()
+        base = base or fps / count
+        print(f"{count:>8} {load_s:>8.1f} {fps:>9.1f} {fps / base:>7.2f}x {fps / base / count * 100:>9.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+So sánh anti-spoof FP32 vs INT8 (ONNX Runtime CPU): accuracy lớp real/fake + throughput
+Thư mục crop: <crops>/<tên model>/real|fake/*.jpg (xem anti_spoof/quantize.py)
+
+Cách chạy:
+    # 1. Cắt crop từ video/ảnh đã biết nhãn (cần insightface), mỗi model 1 thư mục theo scale
+    python benchmarks/bench_quantization.py --collect real_faces.mp4 --label real --crops crops/
+    python benchmarks/bench_quantization.py --collect print_attack/ --label fake --crops crops/
+    # 2. Quantize (calibrate trên crops/) + báo cáo, có thể đánh giá trên tập khác bằng --eval
+    python benchmarks/bench_quantization.py --crops crops/ --eval crops_eval/
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from anti_spoof.onnx_backend import OnnxModel, export_model, onnx_path_for, softmax  # noqa: E402
+from anti_spoof.quantize import list_images, load_crops, model_crop_dir, quantize_model  # noqa: E402
+from anti_spoof.utils import CropImage, parse_model_name  # noqa: E402
+
+ANTISPOOF_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "anti_spoof")
+REAL_LABEL = 1  # Silent-Face: 0 = print, 1 = real, 2 = replay
+
+
+def model_paths(antispoof_dir):
+    return [os.path.join(antispoof_dir, n) for n in sorted(os.listdir(antispoof_dir))
+            if n.endswith(".pth") and "MiniFAS" in n]
+
+
+def collect(source, label, crops_dir, pth_paths, max_frames):
+    """Detect mặt rồi lưu crop cho từng model (đúng scale/size) vào crops/<model>/<label>/"""
+    from insightface.app import FaceAnalysis
+    from frame_source import iter_frames
+
+    face_model = FaceAnalysis(name='buffalo_l', allowed_modules=['detection'],
+                              providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+    face_model.prepare(ctx_id=0, det_size=(640, 640))
+    cropper = CropImage()
+    configs = []
+    for pth_path in pth_paths:
+        name = os.path.basename(pth_path)
+        h_input, w_input, _, scale = parse_model_name(name)
+        out_dir = os.path.join(crops_dir, name.split(".pth")[0], label)
+        os.makedirs(out_dir, exist_ok=True)
+        configs.append((out_dir, h_input, w_input, scale))
+
+    saved = 0
+    for frame_idx, frame in enumerate(iter_frames(source, max_frames)):
+        bboxes, _ = face_model.det_model.detect(frame, input_size=(640, 640), max_num=0, metric='default')
+        for face_idx, (x1, y1, x2, y2, _) in enumerate(bboxes):
+            bbox = [int(x1), int(y1), int(x2 - x1), int(y2 - y1)]
+            if bbox[2] <= 0 or bbox[3] <= 0:
+                continue
+            name = f"{os.path.basename(os.path.normpath(source))}_{frame_idx:06d}_{face_idx}.jpg"
+            for out_dir, h_input, w_input, scale in configs:
+                crop = cropper.crop(org_img=frame, bbox=bbox, scale=scale, out_w=w_input, out_h=h_input,
+                                    crop=scale is not None)
+                cv2.imwrite(os.path.join(out_dir, name), crop)
+            saved += 1
+    print(f"✅ Đã lưu {saved} mặt ({label}) × {len(configs)} model vào {crops_dir}")
+
+
+def labeled_crops(eval_dir, model_path):
+    """(paths, labels): labels = True nếu crop thuộc thư mục real/"""
+    root = model_crop_dir(eval_dir, model_path)
+    paths, labels = [], []
+    for label in ("real", "fake"):
+        found = list_images(os.path.join(root, label))
+        paths += found
+        labels += [label == "real"] * len(found)
+    return paths, np.array(labels, dtype=bool)
+
+
+def predict(model, batch, batch_size):
+    """Softmax (N, 3) + thời gian/mặt (s)"""
+    model(batch[:batch_size])  # warm-up
+    probs = []
+    start = time.perf_counter()
+    for i in range(0, len(batch), batch_size):
+        probs.append(softmax(model(batch[i:i + batch_size])))
+    return np.concatenate(probs), (time.perf_counter() - start) / len(batch)
+
+
+def class_accuracy(probs, is_real):
+    pred_real = probs.argmax(axis=1) == REAL_LABEL
+    real_acc = float(np.mean(pred_real[is_real])) if is_real.any() else float("nan")
+    fake_acc = float(np.mean(~pred_real[~is_real])) if (~is_real).any() else float("nan")
+    return real_acc, fake_acc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark anti-spoof FP32 vs INT8")
+    parser.add_argument("--crops", required=True, help="Thư mục crop (calibrate + đánh giá mặc định)")
+    parser.add_argument("--eval", default=None, help="Thư mục crop để đánh giá (mặc định = --crops)")
+    parser.add_argument("--collect", default=None, help="Video/thư mục ảnh để cắt crop (cần insightface)")
+    parser.add_argument("--label", choices=["real", "fake"], default="real")
+    parser.add_argument("--max-frames", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    pth_paths = model_paths(ANTISPOOF_DIR)
+    if args.collect:
+        collect(args.collect, args.label, args.crops, pth_paths, args.max_frames)
+        return
+
+    eval_dir = args.eval or args.crops
+    ensemble = {}
+    print(f"{'model':<32} {'':>5} {'real acc':>9} {'fake acc':>9} {'agree':>7} {'ms/mặt':>8} {'speedup':>8}")
+    for pth_path in pth_paths:
+        onnx_path = onnx_path_for(pth_path)
+        if not os.path.exists(onnx_path):
+            export_model(pth_path, onnx_path)
+        int8_path = quantize_model(onnx_path, args.crops)
+
+        paths, is_real = labeled_crops(eval_dir, pth_path)
+        if not paths:
+            print(f"❌ Không có crop real/fake trong {eval_dir}")
+            sys.exit(1)
+        fp32, int8 = OnnxModel(onnx_path, args.threads), OnnxModel(int8_path, args.threads)
+        batch = load_crops(paths, fp32.h_input, fp32.w_input)
+        probs_fp32, t_fp32 = predict(fp32, batch, args.batch_size)
+        probs_int8, t_int8 = predict(int8, batch, args.batch_size)
+        agree = float(np.mean(probs_fp32.argmax(axis=1) == probs_int8.argmax(axis=1)))
+
+        name = os.path.basename(pth_path)
+        for tag, probs, t in (("fp32", probs_fp32, t_fp32), ("int8", probs_int8, t_int8)):
+            real_acc, fake_acc = class_accuracy(probs, is_real)
+            print(f"{name if tag == 'fp32' else '':<32} {tag:>5} {real_acc:>9.3f} {fake_acc:>9.3f} "
+                  f"{agree if tag == 'int8' else 1.0:>7.3f} {t * 1000:>8.2f} {t_fp32 / t:>7.2f}x")
+        ensemble[name] = ([os.path.basename(p) for p in paths], is_real, probs_fp32, probs_int8, t_fp32, t_int8)
+
+    # Ensemble (trung bình softmax như AntiSpoofEngine) khi mọi model có cùng danh sách crop
+    names = [v[0] for v in ensemble.values()]
+    if len(ensemble) > 1 and all(n == names[0] for n in names):
+        is_real = next(iter(ensemble.values()))[1]
+        t_fp32 = sum(v[4] for v in ensemble.values())
+        t_int8 = sum(v[5] for v in ensemble.values())
+        mean_fp32 = np.mean([v[2] for v in ensemble.values()], axis=0)
+        mean_int8 = np.mean([v[3] for v in ensemble.values()], axis=0)
+        agree = float(np.mean(mean_fp32.argmax(axis=1) == mean_int8.argmax(axis=1)))
+        for tag, probs, t in (("fp32", mean_fp32, t_fp32), ("int8", mean_int8, t_int8)):
+            real_acc, fake_acc = class_accuracy(probs, is_real)
+            print(f"{'ensemble' if tag == 'fp32' else '':<32} {tag:>5} {real_acc:>9.3f} {fake_acc:>9.3f} "
+                  f"{agree if tag == 'int8' else 1.0:>7.3f} {t * 1000:>8.2f} {t_fp32 / t:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark accuracy vs latency khi mỗi người có nhiều embedding (nhiều ảnh enroll)
+- Gallery giả lập: mỗi người có 1 tâm + biến thể theo điều kiện chụp (ánh sáng / góc mặt) dùng chung cho mọi người
+- Enroll --templates ảnh / người ở các điều kiện khác nhau; probe chụp ở 1 điều kiện bất kỳ + nhiễu
+- So sánh 1 embedding / người với scoring "max", "centroid", "topk" trên cùng probe:
+  top-1 accuracy, tỉ lệ nhận đúng ở --threshold, ms / batch probe
+
+Cách chạy:
+    python benchmarks/bench_scoring.py --persons 2000 --templates 5
+    python benchmarks/bench_scoring.py --persons 10000 --templates 3 --top-k 2 --threshold 0.45
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_gallery import FaceGallery, l2_normalize  # noqa: E402
+
+
+def synthetic_identities(persons, templates, conditions, dim, spread, rng):
+    """
+    Embedding = tâm người + hướng của điều kiện chụp + nhiễu nhỏ
+    Returns: (centers (P, D), shifts (C, D), noise, enrolled (P * templates, D)) — row của 1 người liền nhau
+    """
+    centers = l2_normalize(rng.standard_normal((persons, dim)))
+    shifts = spread * l2_normalize(rng.standard_normal((conditions, dim)))
+    noise = 0.3 / np.sqrt(dim)
+
+    enroll_conditions = np.stack([rng.choice(conditions, templates, replace=False) for _ in range(persons)])
+    enrolled = (centers[:, None, :] + shifts[enroll_conditions]
+                + noise * rng.standard_normal((persons, templates, dim))).reshape(-1, dim)
+    return centers, shifts, noise, enrolled
+
+
+def make_probes(centers, shifts, noise, n_probes, rng):
+    """Probe = người ngẫu nhiên ở điều kiện chụp ngẫu nhiên (có thể chưa có trong ảnh enroll)"""
+    labels = rng.integers(0, len(centers), n_probes)
+    conditions = rng.integers(0, len(shifts), n_probes)
+    probes = centers[labels] + shifts[conditions] + noise * rng.standard_normal((n_probes, centers.shape[1]))
+    return l2_normalize(probes), labels
+
+
+def evaluate(gallery, probes, labels, threshold, batch):
+    """(top-1 accuracy, tỉ lệ match đúng người và >= threshold, ms / batch)"""
+    results = []
+    start = time.perf_counter()
+    for i in range(0, len(probes), batch):
+        results += gallery.match_batch(probes[i:i + batch], -1.0)
+    elapsed = time.perf_counter() - start
+    expected = [gallery.ids[label] for label in labels]
+    top1 = np.mean([pid == want for (pid, _, _), want in zip(results, expected)])
+    accepted = np.mean([pid == want and sim >= threshold for (pid, _, sim), want in zip(results, expected)])
+    return top1, accepted, elapsed * 1000 * batch / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scoring nhiều embedding / người (max, centroid, topk)")
+    parser.add_argument("--persons", type=int, default=2000)
+    parser.add_argument("--templates", type=int, default=5, help="Số embedding enroll cho mỗi người")
+    parser.add_argument("--conditions", type=int, default=12, help="Số điều kiện chụp (ánh sáng / góc mặt)")
+    parser.add_argument("--spread", type=float, default=0.9, help="Độ lệch embedding giữa các điều kiện chụp")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--probes", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=8, help="Số mặt mỗi lần match (≈ số mặt / frame)")
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers, shifts, noise, enrolled = synthetic_identities(
+        args.persons, args.templates, args.conditions, args.dim, args.spread, rng)
+    ids = [f"P{i:06d}" for i in range(args.persons)]
+    probes, labels = make_probes(centers, shifts, noise, args.probes, rng)
+
+    single = FaceGallery(ids, ids, enrolled[::args.templates])  # chỉ ảnh enroll đầu tiên
+    multi = FaceGallery(ids, ids, enrolled, counts=[args.templates] * args.persons)
+    print(f"Gallery: {args.persons} người x {args.templates} embedding, probe: {args.probes}, "
+          f"batch {args.batch}, threshold {args.threshold}")
+    print(f"{'scoring':<20} {'top-1':>7} {'@thr':>7} {'ms/batch':>9}")
+
+    rows = [("1 embedding", single, "max")] + [(mode if mode != "topk" else f"topk (k={args.top_k})", multi, mode)
+                                                for mode in ("max", "centroid", "topk")]
+    for label, gallery, mode in rows:
+        gallery.set_scoring(mode, args.top_k)
+        gallery.match_batch(probes[:args.batch], -1.0)  # warm-up (centroid / vị trí topk tính lần đầu)
+        top1, accepted, ms = evaluate(gallery, probes, labels, args.threshold, args.batch)
+        print(f"{label:<20} {top1:>7.3f} {accepted:>7.3f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Đọc frame từ file video hoặc thư mục ảnh cho các benchmark headless"""
+
+import os
+
+import cv2
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def iter_frames(source, max_frames=None):
+    """Yield frame BGR từ file video hoặc thư mục ảnh (sắp theo tên file)"""
+    count = 0
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if not name.lower().endswith(IMAGE_EXTS):
+                continue
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is None:
+                continue
+            yield frame
+            count += 1
+            if max_frames and count >= max_frames:
+                return
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Không mở được video: {source}")
+    try:
+        while not max_frames or count < max_frames:
+            grabbed, frame = cap.read()
+            if not grabbed:
+                break
+            yield frame
+            count += 1
+    finally:
+        cap.release()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Quản lý nhiều camera RTSP trong 1 process (1 camera / phòng)
+- Danh sách camera đọc từ csv/05_cameras.csv (cùng format với bảng cameras)
+- Mỗi camera 1 RTSPVideoStream tự reconnect với backoff; frame mới nhất lấy theo tên camera
+- Inference chạy trên 1 worker pool dùng chung, lập lịch round-robin:
+  mỗi camera tối đa 1 frame đang xử lý, camera có frame mới được phục vụ lần lượt → không camera nào bị bỏ đói
+
+Cách chạy (in thống kê fps xử lý của từng camera):
+    python camera_manager.py
+    python camera_manager.py --workers 4 --detect
+    python camera_manager.py --workers 4 --detect --embed   # embedding gom batch giữa các camera
+    python camera_manager.py --process-pool 0                # pipeline trong nhiều process, tự chọn số worker
+    python camera_manager.py --detect --metrics-port 9108    # metrics Prometheus tại /metrics
+"""
+
+import argparse
+import csv
+import os
+import threading
+import time
+
+from face_recognition_demo import RTSPVideoStream
+from metrics import REGISTRY, start_metrics_server
+
+CAMERAS_CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "csv", "05_cameras.csv")
+
+PROCESS_SECONDS = REGISTRY.histogram("fuacs_camera_process_seconds", "Thời gian xử lý 1 frame của camera",
+                                     ("camera",))
+CAMERA_ERRORS = REGISTRY.counter("fuacs_camera_errors_total", "Số frame xử lý lỗi", ("camera",))
+
+
+def load_cameras_csv(path, active_only=True):
+    """Đọc danh sách camera: [{'name', 'rtsp_url', 'room_name', 'active'}]"""
+    cameras = []
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            active = row.get("status", "true").strip().lower() == "true"
+            if active_only and not active:
+                continue
+            cameras.append({"name": row["name"], "rtsp_url": row["rtspUrl"],
+                            "room_name": row["room_name"], "active": active})
+    return cameras
+
+
+class CameraManager:
+    """Mở nhiều camera và phân phối frame mới nhất của từng camera cho worker pool chung"""
+
+    def __init__(self, cameras, buffer_size=4):
+        self.cameras = {cam["name"]: cam for cam in cameras}
+        self.streams = {name: RTSPVideoStream(cam["rtsp_url"], buffer_size=buffer_size, reconnect=True)
+                        for name, cam in self.cameras.items()}
+        self.order = list(self.cameras)
+        self.cursor = 0
+        self.lock = threading.Lock()
+        self.busy = set()                                   # camera đang có frame trong worker
+        self.last_seq = {name: 0 for name in self.order}    # frame cuối đã xử lý
+        self.processed = {name: 0 for name in self.order}
+        self.results = {}                                   # name → (seq, result)
+        self.stop_event = threading.Event()
+        self.workers = []
+
+    def start(self):
+        for stream in self.streams.values():
+            stream.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for stream in self.streams.values():
+            stream.stop()
+
+    def read(self, name):
+        """Frame mới nhất của camera: (view read-only hoặc None, lease), gọi release(name, lease) khi xong"""
+        return self.streams[name].read()
+
+    def read_new(self, name, last_seq):
+        return self.streams[name].read_new(last_seq)
+
+    def release(self, name, lease):
+        self.streams[name].release(lease)
+
+    def latest_result(self, name):
+        """Kết quả inference mới nhất của camera: (seq, result) hoặc None"""
+        return self.results.get(name)
+
+    def start_workers(self, process_fn, num_workers=2, on_result=None):
+        """
+        Chạy worker pool dùng chung cho mọi camera
+        process_fn(name, frame) → result; on_result(name, seq, result) gọi trong worker thread
+        """
+        for _ in range(num_workers):
+            t = threading.Thread(target=self._run_worker, args=(process_fn, on_result), daemon=True)
+            t.start()
+            self.workers.append(t)
+        return self
+
+    def _next_job(self):
+        """Round-robin: camera kế tiếp (tính từ cursor) có frame mới và chưa bận"""
+        with self.lock:
+            for i in range(len(self.order)):
+                name = self.order[(self.cursor + i) % len(self.order)]
+                if name in self.busy:
+                    continue
+                seq, frame, lease = self.streams[name].read_new(self.last_seq[name])
+                if frame is None:
+                    continue
+                self.busy.add(name)
+                self.last_seq[name] = seq
+                self.cursor = (self.cursor + i + 1) % len(self.order)
+                return name, seq, frame, lease
+        return None
+
+    def _run_worker(self, process_fn, on_result):
+        while not self.stop_event.is_set():
+            job = self._next_job()
+            if job is None:
+                time.sleep(0.005)
+                continue
+            name, seq, frame, lease = job
+            job = None
+            try:
+                with PROCESS_SECONDS.labels(name).time():
+                    result = process_fn(name, frame)
+                self.results[name] = (seq, result)
+                if on_result is not None:
+                    on_result(name, seq, result)
+            except Exception as e:
+                CAMERA_ERRORS.labels(name).inc()
+                print(f"Error [{name}]: {e}")
+            finally:
+                frame = None
+                self.streams[name].release(lease)  # trả slot ring buffer cho capture thread
+                with self.lock:
+                    self.busy.discard(name)
+                    self.processed[name] += 1
+
+    def stats(self):
+        """Trạng thái từng camera: kết nối, frame đã grab, frame đã xử lý"""
+        return {name: {"room": self.cameras[name]["room_name"],
+                       "connected": self.streams[name].connected,
+                       "grabbed": self.streams[name].seq,
+                       "processed": self.processed[name]}
+                for name in self.order}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy nhiều camera trong 1 process")
+    parser.add_argument("--csv", default=CAMERAS_CSV_PATH)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--detect", action="store_true", help="Chạy face detection (cần insightface)")
+    parser.add_argument("--embed", action="store_true",
+                        help="Tính embedding qua EmbeddingScheduler dùng chung mọi camera (kèm --detect)")
+    parser.add_argument("--process-pool", type=int, default=None, metavar="N",
+                        help="Chạy pipeline đầy đủ trong N process (0 = tự chọn theo số core), thay cho --detect")
+    parser.add_argument("--embed-max-batch", type=int, default=32)
+    parser.add_argument("--embed-max-wait", type=float, default=0.005)
+    parser.add_argument("--interval", type=float, default=5.0, help="Chu kỳ in thống kê (s)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Phục vụ /metrics (Prometheus) ở port này")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="0.0.0.0 = cho máy khác scrape")
+    args = parser.parse_args()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, args.metrics_host)
+        print(f"📊 Metrics: http://{args.metrics_host}:{args.metrics_port}/metrics")
+
+    cameras = load_cameras_csv(args.csv)
+    print(f"📹 {len(cameras)} camera active trong {args.csv}")
+
+    process_fn = lambda name, frame: None  # noqa: E731 - chỉ đo tốc độ grab/phân phối
+    scheduler = None
+    if args.detect:
+        from face_recognition_demo import load_face_model
+        # Cùng provider / det_size / warm-up với demo và inference_service
+        face_model = load_face_model(allowed_modules=['detection', 'recognition'])
+        process_fn = lambda name, frame: len(face_model.get(frame))  # noqa: E731
+        if args.embed:
+            from insightface.utils import face_align
+            from embedding_scheduler import EmbeddingScheduler
+            rec_model = face_model.models['recognition']
+            scheduler = EmbeddingScheduler(rec_model, max_batch=args.embed_max_batch,
+                                           max_wait=args.embed_max_wait).start()
+
+            def process_fn(name, frame):
+                # Detect riêng từng camera, embedding gom batch qua scheduler (session = tên camera)
+                bboxes, kpss = face_model.det_model.detect(frame, max_num=0, metric='default')
+                if kpss is None or len(kpss) == 0:
+                    return 0
+                crops = [face_align.norm_crop(frame, landmark=kps, image_size=rec_model.input_size[0])
+                         for kps in kpss]
+                return len(scheduler.embed(name, crops))
+
+    pool = None
+    if args.process_pool is not None:
+        from process_pool import ProcessInferencePool
+        from face_recognition_demo import FACE_DATABASE_PATH
+        from enrollment_log import enrollment_log_path
+        pool = ProcessInferencePool(num_workers=args.process_pool or None,
+                                    enrollment_log=enrollment_log_path(FACE_DATABASE_PATH)).start()
+        print(f"✅ Process pool: {pool.num_workers} worker")
+        process_fn = lambda name, frame: len(pool.process(frame))  # noqa: E731
+        # Mỗi thread của manager chờ 1 job → đủ thread để mọi process luôn có việc
+        args.workers = max(args.workers, pool.num_workers * 2)
+
+    manager = CameraManager(cameras).start().start_workers(process_fn, num_workers=args.workers)
+    previous = {name: 0 for name in manager.order}
+    try:
+        while True:
+            time.sleep(args.interval)
+            for name, st in manager.stats().items():
+                fps = (st["processed"] - previous[name]) / args.interval
+                previous[name] = st["processed"]
+                status = "✓" if st["connected"] else "✗"
+                print(f"{status} {name:<16} {st['room']:<12} grabbed={st['grabbed']:<8} {fps:.1f} fps")
+            if scheduler is not None:
+                st = scheduler.stats()
+                print(f"   embed: queue={st['queue_depth']} avg_batch={st['avg_batch_size']:.1f} "
+                      f"p50={st['p50_ms']:.1f} ms p99={st['p99_ms']:.1f} ms hist={st['batch_size_hist']}")
+    except KeyboardInterrupt:
+        manager.stop()
+        if scheduler is not None:
+            scheduler.stop()
+        if pool is not None:
+            pool.stop()
+
+
+if __name__ == "__main__":
+    main()
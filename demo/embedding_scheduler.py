@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-batching embedding cho nhiều phiên điểm danh chạy song song
+- Mỗi session (camera / pipeline) submit các crop mặt đã align của 1 frame
+- 1 worker gom crop của nhiều session thành batch (tối đa max_batch crop hoặc chờ tối đa max_wait),
+  chạy model recognition 1 lần rồi trả embedding về đúng session qua Future
+- Metrics: độ sâu queue, histogram kích thước batch, latency p50/p99 (submit → có embedding)
+"""
+
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    def __init__(self, session_id, crops):
+        self.session_id = session_id
+        self.crops = crops
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+class EmbeddingScheduler:
+    """
+    rec_model: model recognition của FaceAnalysis (get_feat(list crop) → (N, dim))
+    max_batch: số crop tối đa mỗi lần gọi model; max_wait: thời gian chờ gom batch (s) tính từ request đầu
+    """
+
+    def __init__(self, rec_model, max_batch=32, max_wait=0.005, latency_window=2000):
+        self.rec_model = rec_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = deque()
+        self.pending_crops = 0
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen=latency_window)
+        self.sessions = Counter()
+        self.max_queue_depth = 0
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def submit(self, session_id, crops):
+        """Gửi crop (list ảnh BGR đã align) của 1 session, trả về Future → embeddings (N, dim)"""
+        request = _Request(session_id, list(crops))
+        if not request.crops:
+            request.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return request.future
+        if self.stop_event.is_set():
+            request.future.set_exception(RuntimeError("EmbeddingScheduler đã dừng"))
+            return request.future
+        with self.cond:
+            self.pending.append(request)
+            self.pending_crops += len(request.crops)
+            self.max_queue_depth = max(self.max_queue_depth, self.pending_crops)
+            self.cond.notify()
+        return request.future
+
+    def embed(self, session_id, crops, timeout=None):
+        """submit() rồi chờ kết quả (dùng trong worker thread của session)"""
+        return self.submit(session_id, crops).result(timeout)
+
+    def _take_batch(self):
+        """Chờ request đầu tiên, gom thêm tới khi đủ max_batch crop hoặc hết max_wait"""
+        with self.cond:
+            while not self.pending and not self.stop_event.is_set():
+                self.cond.wait(0.1)
+            if not self.pending:
+                return []
+            deadline = self.pending[0].submitted + self.max_wait
+            while self.pending_crops < self.max_batch and not self.stop_event.is_set():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            # Lấy nguyên request (không tách crop của 1 frame); request lớn hơn max_batch đi riêng
+            batch, size = [], 0
+            while self.pending and (not batch or size + len(self.pending[0].crops) <= self.max_batch):
+                request = self.pending.popleft()
+                batch.append(request)
+                size += len(request.crops)
+            self.pending_crops -= size
+            return batch
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            batch = self._take_batch()
+            if not batch:
+                continue
+            crops = [crop for request in batch for crop in request.crops]
+            try:
+                embeddings = np.concatenate([self.rec_model.get_feat(crops[i:i + self.max_batch])
+                                             for i in range(0, len(crops), self.max_batch)])
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            offset = 0
+            with self.cond:
+                self.batch_sizes[len(crops)] += 1
+                for request in batch:
+                    self.latencies.append(now - request.submitted)
+                    self.sessions[request.session_id] += len(request.crops)
+            for request in batch:
+                request.future.set_result(embeddings[offset:offset + len(request.crops)])
+                offset += len(request.crops)
+
+        # Dừng: báo lỗi cho request còn chờ thay vì để session treo
+        with self.cond:
+            leftover, self.pending = list(self.pending), deque()
+            self.pending_crops = 0
+        for request in leftover:
+            request.future.set_exception(RuntimeError("EmbeddingScheduler đã dừng"))
+
+    def stats(self):
+        """queue_depth (crop đang chờ), histogram kích thước batch, latency p50/p99 (ms), crop theo session"""
+        with self.cond:
+            latencies = np.array(self.latencies) * 1000
+            batches = sum(self.batch_sizes.values())
+            return {
+                "queue_depth": self.pending_crops,
+                "max_queue_depth": self.max_queue_depth,
+                "batches": batches,
+                "avg_batch_size": (sum(size * n for size, n in self.batch_sizes.items()) / batches
+                                   if batches else 0.0),
+                "batch_size_hist": dict(sorted(self.batch_sizes.items())),
+                "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+                "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+                "sessions": dict(self.sessions),
+            }
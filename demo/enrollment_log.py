@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Log enroll append-only cho face database (không phải ghi lại cả face_database.json khi thêm 1 sinh viên)
+- File <gallery>.enroll.jsonl cạnh file gallery (theo tên file đầy đủ, .json và .fgal có log riêng), mỗi dòng 1 record JSON:
+  {"seq": 12, "op": "add" | "update" | "delete" | "compacted", "id": ..., "name": ..., "embedding": [...], "ts": ...}
+  Enroll nhiều ảnh cho 1 người: "embeddings": [[...], [...]] thay cho "embedding"
+- Lúc load: gallery gốc + áp các record trong log
+- Đang chạy: EnrollmentWatcher đọc dòng mới và áp thẳng vào FaceGallery (add / update / remove),
+  recognition không phải dừng hay reload
+- compact(): gộp log vào file gallery gốc (.json hoặc .fgal), log chỉ còn 1 dòng "compacted" giữ seq
+- Ghi log / compact dùng chung 1 lock file → nhiều tiến trình enroll không ghi chồng lên nhau
+
+Cách chạy:
+    python enrollment_log.py add HE180314 "Nguyen Doan Hieu" --image hieu.jpg   # cần insightface
+    python enrollment_log.py add HE180314 "Nguyen Doan Hieu" --image hieu_1.jpg hieu_2.jpg hieu_3.jpg
+    python enrollment_log.py add HE180314 "Nguyen Doan Hieu" --embedding hieu.npy
+    python enrollment_log.py update HE180314 --name "Nguyen Doan Hieu"
+    python enrollment_log.py delete HE180314
+    python enrollment_log.py list
+    python enrollment_log.py compact
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from face_gallery import person_embeddings
+from gallery_format import GALLERY_EXT, open_gallery, write_gallery
+
+DEFAULT_GALLERY_PATH = os.path.join(os.path.dirname(__file__), "face_database.json")
+OPS = ("add", "update", "delete", "compacted")
+
+
+def enrollment_log_path(gallery_path):
+    """
+    face_database.json → face_database.json.enroll.jsonl
+    Giữ cả phần mở rộng: .json và .fgal cùng tên nằm cạnh nhau không dùng chung log
+    (marker "compacted" của file này sẽ làm file kia bỏ qua record chưa gộp)
+    """
+    return gallery_path + ".enroll.jsonl"
+
+
+@contextmanager
+def _file_lock(path, timeout=10.0, stale_after=60.0):
+    """Lock liên tiến trình bằng file tạo với O_EXCL (chạy được cả Windows), lock quá stale_after giây bị bỏ"""
+    lock_path = path + ".lock"
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"Không lấy được lock {lock_path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def read_records(log_path, offset=0):
+    """
+    Đọc record từ byte offset, bỏ dòng cuối chưa ghi xong (chưa có '\\n')
+    Returns: (records, offset mới)
+    """
+    if not os.path.exists(log_path):
+        return [], 0
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    records = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line.decode("utf-8"))
+        except ValueError:
+            print(f"⚠️ Bỏ qua dòng log enroll lỗi: {line[:80]!r}")
+            continue
+        if record.get("op") in OPS:
+            records.append(record)
+    return records, offset + end
+
+
+def compacted_seq(log_path):
+    """Seq đã được gộp vào file gallery gốc (record "compacted" đầu log), 0 nếu chưa compact lần nào"""
+    records = read_records(log_path)[0]
+    return records[0]["seq"] if records and records[0]["op"] == "compacted" else 0
+
+
+class EnrollmentLog:
+    """Ghi record vào log enroll (append + fsync, seq tăng dần)"""
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+
+    def records(self):
+        return read_records(self.log_path)[0]
+
+    def last_seq(self):
+        records = self.records()
+        return records[-1]["seq"] if records else 0
+
+    def append(self, op, person_id=None, name=None, embedding=None):
+        if op not in OPS:
+            raise ValueError(f"op không hợp lệ: {op}")
+        with _file_lock(self.log_path):
+            record = {"seq": self.last_seq() + 1, "op": op, "id": person_id, "ts": round(time.time(), 3)}
+            if name is not None:
+                record["name"] = name
+            if embedding is not None:
+                embedding = np.asarray(embedding, dtype=np.float32)
+                rows = [[round(float(v), 7) for v in row] for row in embedding.reshape(-1, embedding.shape[-1])]
+                if len(rows) == 1:
+                    record["embedding"] = rows[0]
+                else:
+                    record["embeddings"] = rows
+            with open(self.log_path, "ab") as f:
+                f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+        return record
+
+    def add(self, person_id, name, embedding):
+        return self.append("add", person_id, name, embedding)
+
+    def update(self, person_id, name=None, embedding=None):
+        return self.append("update", person_id, name, embedding)
+
+    def delete(self, person_id):
+        return self.append("delete", person_id)
+
+
+def _record_embedding(record):
+    """Embedding (k, D) của record, None nếu record không có embedding"""
+    if "embeddings" not in record and "embedding" not in record:
+        return None
+    return person_embeddings(record)
+
+
+def apply_record(gallery, record):
+    """Áp 1 record vào FaceGallery, True nếu gallery thay đổi"""
+    op = record["op"]
+    embedding = _record_embedding(record)
+    if op == "add":
+        gallery.add(record["id"], record.get("name", record["id"]), embedding)
+        return True
+    if op == "update":
+        if record["id"] not in gallery.ids and embedding is not None:
+            gallery.add(record["id"], record.get("name", record["id"]), embedding)
+            return True
+        return gallery.update(record["id"], name=record.get("name"), embedding=embedding)
+    if op == "delete":
+        return gallery.remove(record["id"])
+    return False
+
+
+def apply_to_persons(persons, record):
+    """Áp 1 record vào OrderedDict id → (name, embeddings (k, D)) (dùng khi compact)"""
+    op, person_id = record["op"], record.get("id")
+    embedding = _record_embedding(record)
+    if op == "add" or (op == "update" and person_id not in persons and embedding is not None):
+        persons[person_id] = (record.get("name", person_id), embedding)
+    elif op == "update" and person_id in persons:
+        name, old_embedding = persons[person_id]
+        persons[person_id] = (record.get("name", name), embedding if embedding is not None else old_embedding)
+    elif op == "delete":
+        persons.pop(person_id, None)
+
+
+def _read_base(gallery_path):
+    """OrderedDict id → (name, embeddings (k, D)) + phần còn lại của file JSON (giữ nguyên khi ghi lại)"""
+    persons, extra = OrderedDict(), {}
+    if not os.path.exists(gallery_path):
+        return persons, extra
+    if gallery_path.endswith(GALLERY_EXT):
+        ids, names, embeddings, _, counts = open_gallery(gallery_path)
+        offsets = np.concatenate([[0], np.cumsum(counts if counts is not None else np.ones(len(ids), dtype=int))])
+        for i, (pid, name) in enumerate(zip(ids, names)):
+            persons[pid] = (name, np.array(embeddings[offsets[i]:offsets[i + 1]], dtype=np.float32))
+        return persons, extra
+    with open(gallery_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for p in data.pop("persons", []):
+        persons[p["id"]] = (p["name"], person_embeddings(p))
+    return persons, data
+
+
+def _person_json(person_id, name, embeddings):
+    """Person trong file JSON: 1 embedding → "embedding" (như file cũ), nhiều embedding → "embeddings" (k, D)"""
+    if len(embeddings) == 1:
+        return {"id": person_id, "name": name, "embedding": [float(v) for v in embeddings[0]]}
+    return {"id": person_id, "name": name, "embeddings": [[float(v) for v in row] for row in embeddings]}
+
+
+def _write_base(gallery_path, persons, extra):
+    if gallery_path.endswith(GALLERY_EXT):
+        dim = next(iter(persons.values()))[1].shape[1] if persons else 0
+        embeddings = [e for _, e in persons.values()]
+        write_gallery(gallery_path, list(persons), [name for name, _ in persons.values()],
+                      np.concatenate(embeddings) if persons else np.zeros((0, dim), dtype=np.float32),
+                      counts=[len(e) for e in embeddings])
+        return
+    data = dict(extra, persons=[_person_json(pid, name, embeddings)
+                                for pid, (name, embeddings) in persons.items()])
+    tmp_path = f"{gallery_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, gallery_path)
+
+
+def compact(gallery_path, log_path=None):
+    """
+    Gộp log vào file gallery gốc rồi thay log bằng 1 record "compacted" (giữ seq để process đang chạy
+    biết những record nào đã nằm trong file gốc). Returns: số record đã gộp
+    """
+    log_path = log_path or enrollment_log_path(gallery_path)
+    with _file_lock(log_path):
+        records = read_records(log_path)[0]
+        changes = [r for r in records if r["op"] != "compacted"]
+        if not changes:
+            return 0
+        persons, extra = _read_base(gallery_path)
+        for record in changes:
+            apply_to_persons(persons, record)
+        _write_base(gallery_path, persons, extra)
+
+        marker = {"seq": records[-1]["seq"], "op": "compacted", "id": None, "ts": round(time.time(), 3)}
+        tmp_path = f"{log_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write((json.dumps(marker) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, log_path)
+    return len(changes)
+
+
+class EnrollmentWatcher:
+    """
+    Theo dõi log enroll, áp record mới vào gallery đang dùng để nhận diện
+    reload_fn: hàm load lại gallery gốc (vd. load_face_gallery), dùng khi log đã bị compact mà process
+               chưa kịp đọc hết record cũ
+    on_change: gọi sau mỗi lần gallery thay đổi, tham số là list record vừa áp
+    base_seq: compacted_seq() đọc TRƯỚC khi load gallery gốc — file gốc chứa ít nhất tới seq này.
+              Record "compacted" có seq lớn hơn → file gốc có record chưa thấy → reload
+    """
+
+    def __init__(self, gallery, log_path, reload_fn=None, on_change=None, interval=1.0, base_seq=0):
+        self.gallery = gallery
+        self.log_path = log_path
+        self.reload_fn = reload_fn
+        self.on_change = on_change
+        self.interval = interval
+        self.seq = base_seq
+        self.offset = 0
+        self.file_id = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"applied": 0, "reloads": 0}
+
+    def _file_changed(self):
+        """Log bị thay (compact) hoặc ngắn đi → đọc lại từ đầu"""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            self.offset, self.file_id = 0, None
+            return
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self.file_id or st.st_size < self.offset:
+            self.offset, self.file_id = 0, file_id
+
+    def poll(self):
+        """Áp các record mới, trả về list record đã áp"""
+        self._file_changed()
+        records, self.offset = read_records(self.log_path, self.offset)
+        applied = []
+        for record in records:
+            if record["seq"] <= self.seq:
+                continue
+            if record["op"] == "compacted":
+                if self.reload_fn is not None:
+                    # Bỏ lỡ record đã bị gộp vào file gốc → lấy lại toàn bộ gallery, swap 1 lần
+                    self.gallery.replace_with(self.reload_fn())
+                    self.stats["reloads"] += 1
+                    applied.append(record)
+            elif apply_record(self.gallery, record):
+                applied.append(record)
+            self.seq = record["seq"]
+        if applied:
+            self.stats["applied"] += len(applied)
+            if self.on_change is not None:
+                self.on_change(applied)
+        return applied
+
+    def start(self):
+        """Thread nền đọc log mỗi interval giây (interval None/0 = không theo dõi)"""
+        if not self.interval:
+            return self
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                for record in self.poll():
+                    print(f"✅ Enroll {record['op']}: {record.get('id') or ''} (seq {record['seq']})")
+            except Exception as e:
+                print(f"⚠️ Lỗi áp log enroll: {e}")
+
+
+def load_enroll_model():
+    """FaceAnalysis detection + recognition để tính embedding enroll (cần insightface)"""
+    from face_recognition_demo import load_face_model
+    return load_face_model((640, 640), allowed_modules=['detection', 'recognition'], warm_up=False)
+
+
+def embedding_from_image(image_path, face_model=None):
+    """Embedding của mặt lớn nhất trong ảnh; face_model None = load mới (nhiều ảnh thì load 1 lần rồi truyền vào)"""
+    import cv2
+
+    image = cv2.imread(image_path)
+    if image is None:
+        raise IOError(f"Không đọc được ảnh: {image_path}")
+    faces = (face_model or load_enroll_model()).get(image)
+    if not faces:
+        raise ValueError(f"Không tìm thấy mặt trong {image_path}")
+    face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+    return face.embedding
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enroll / xoá sinh viên qua log append-only, compact vào gallery")
+    parser.add_argument("--gallery", default=DEFAULT_GALLERY_PATH, help="face_database.json hoặc .fgal")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command in ("add", "update"):
+        p = sub.add_parser(command)
+        p.add_argument("id")
+        if command == "add":
+            p.add_argument("name")
+        else:
+            p.add_argument("--name", default=None)
+        p.add_argument("--image", nargs="+", default=None,
+                       help="1 hoặc nhiều ảnh chân dung (ánh sáng / góc khác nhau), tính embedding bằng insightface")
+        p.add_argument("--embedding", default=None, help="File .npy chứa embedding (D,) hoặc (k, D)")
+    sub.add_parser("delete").add_argument("id")
+    sub.add_parser("list")
+    sub.add_parser("compact")
+    args = parser.parse_args()
+
+    log = EnrollmentLog(enrollment_log_path(args.gallery))
+    if args.command in ("add", "update"):
+        embedding = None
+        if args.embedding:
+            embedding = np.load(args.embedding)
+        elif args.image:
+            face_model = load_enroll_model()
+            embedding = np.stack([embedding_from_image(path, face_model) for path in args.image])
+        elif args.command == "add":
+            parser.error("add cần --image hoặc --embedding")
+        record = log.append(args.command, args.id, args.name, embedding)
+        print(f"✅ {args.command} {args.id} (seq {record['seq']})")
+    elif args.command == "delete":
+        print(f"✅ delete {args.id} (seq {log.delete(args.id)['seq']})")
+    elif args.command == "list":
+        for record in log.records():
+            embedding = _record_embedding(record)
+            dim = f" [{len(embedding)}x{embedding.shape[1]}d]" if embedding is not None else ""
+            print(f"{record['seq']:>6} {record['op']:<9} {record.get('id') or '':<12} {record.get('name', '')}{dim}")
+    else:
+        count = compact(args.gallery, log.log_path)
+        print(f"✅ Đã gộp {count} record vào {args.gallery}" if count else "Log không có gì để gộp")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
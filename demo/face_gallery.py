@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Face gallery dạng ma trận cho face recognition
+- Toàn bộ embedding được gom thành 1 ma trận float32 (R, D) liên tục, đã L2-normalize sẵn
+- Mỗi người có 1 hoặc nhiều embedding (nhiều ảnh enroll: ánh sáng / góc mặt khác nhau), các row của 1 người
+  nằm liền nhau: người i = matrix[offsets[i]:offsets[i + 1]]
+- Cosine similarity của cả batch probe = 1 phép nhân ma trận (M, D) x (D, R), rồi gộp theo người:
+  "max" (row giống nhất), "centroid" (so với trung bình các row), "topk" (trung bình top_k row giống nhất)
+- Có thể gắn ANN index (xem ann_index.py) để không phải quét toàn bộ gallery
+- Thêm / sửa / xoá người khi đang nhận diện (add, update, remove): trạng thái (ids, names, matrix, index, offsets)
+  là 1 snapshot bất biến, thay đổi tạo snapshot mới rồi gán 1 lần → search đang chạy vẫn dùng snapshot cũ,
+  không cần khoá reader. Thêm người ghi vào phần dư của buffer (không copy ma trận), sửa/xoá copy ma trận.
+"""
+
+import itertools
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+GallerySnapshot = namedtuple("GallerySnapshot", "ids names matrix index offsets")
+
+SCORING_MODES = ("max", "centroid", "topk")
+
+
+def l2_normalize(x, axis=-1, eps=1e-10):
+    """L2-normalize theo trục cuối, vector 0 giữ nguyên là 0"""
+    x = np.asarray(x, dtype=np.float32)
+    norm = np.linalg.norm(x, axis=axis, keepdims=True)
+    return x / np.maximum(norm, eps)
+
+
+def exact_search(matrix, probes, k):
+    """Brute-force top-k trên ma trận đã normalize, probes (M, D) đã normalize"""
+    k = max(1, min(k, matrix.shape[0]))
+    sims = probes @ matrix.T
+    if k == 1:
+        idx = np.argmax(sims, axis=1)[:, None]
+    else:
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, idx, axis=1), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+    return idx, np.take_along_axis(sims, idx, axis=1)
+
+
+def person_embeddings(person):
+    """Embedding (k, D) của 1 person: 'embeddings' (nhiều ảnh enroll) hoặc 'embedding' (1 ảnh)"""
+    embeddings = person['embeddings'] if person.get('embeddings') is not None else person['embedding']
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings.reshape(-1, embeddings.shape[-1])
+
+
+def _row_owners(snapshot, rows):
+    """Vị trí người sở hữu các row, giữ -1 cho row -1 (ANN index không tìm thấy)"""
+    rows = np.asarray(rows)
+    return np.where(rows >= 0, np.searchsorted(snapshot.offsets, rows, side="right") - 1, -1)
+
+
+_gallery_tokens = itertools.count(1)  # token duy nhất trong process cho mỗi FaceGallery (id() bị dùng lại sau GC)
+
+
+def _offsets(counts):
+    return np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+
+
+class FaceGallery:
+    """
+    Gallery embedding đã normalize để tìm top-1/top-k bằng phép nhân ma trận.
+    Kết quả match giữ nguyên contract của recognize_face: (person_id, person_name, similarity)
+    counts: số row (embedding) của từng người, None = mỗi người 1 row
+    scoring / top_k: cách gộp similarity các row của 1 người (xem SCORING_MODES)
+    """
+
+    def __init__(self, ids, names, embeddings, normalized=False, counts=None, scoring="max", top_k=3):
+        ids, names = list(ids), list(names)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        counts = np.ones(len(ids), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        if len(counts) != len(ids) or (len(counts) and counts.min() < 1):
+            raise ValueError(f"counts phải có {len(ids)} phần tử >= 1; nhận {counts.tolist()}")
+        if embeddings.ndim != 2 or embeddings.shape[0] != counts.sum():
+            raise ValueError(f"embeddings phải có shape (R, D), R = {int(counts.sum())}; nhận {embeddings.shape}")
+        # normalized=True: dùng thẳng ma trận (vd. memmap read-only), không copy
+        matrix = np.ascontiguousarray(embeddings if normalized else l2_normalize(embeddings))
+        self._snapshot = GallerySnapshot(ids, names, matrix, None, _offsets(counts))  # index None = exact search
+        self._buffer = None  # buffer ghi được, matrix = _buffer[:R]; None = chưa thêm người nào
+        self._lock = threading.Lock()  # chỉ serialize các thao tác ghi
+        self._derived = (None, {})  # (snapshot, centroid / vị trí topk) tính 1 lần cho mỗi snapshot
+        self.version = 0  # tăng mỗi lần add/update/remove (cache theo gallery dùng để biết đã cũ)
+        self.token = next(_gallery_tokens)
+        self.set_scoring(scoring, top_k)
+
+    def set_scoring(self, scoring, top_k=None):
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"scoring phải là 1 trong {SCORING_MODES}; nhận {scoring!r}")
+        self.scoring = scoring
+        self.top_k = max(1, int(top_k if top_k is not None else self.top_k))
+
+    @property
+    def cache_key(self):
+        """(token, version): khác nhau giữa 2 gallery bất kỳ trong process và sau mỗi lần gallery thay đổi"""
+        return self.token, self.version
+
+    @property
+    def ids(self):
+        return self._snapshot.ids
+
+    @property
+    def names(self):
+        return self._snapshot.names
+
+    @property
+    def matrix(self):
+        return self._snapshot.matrix
+
+    @property
+    def offsets(self):
+        return self._snapshot.offsets
+
+    @property
+    def counts(self):
+        return np.diff(self._snapshot.offsets)
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    @index.setter
+    def index(self, index):
+        with self._lock:
+            self._snapshot = self._snapshot._replace(index=index)
+
+    @classmethod
+    def from_persons(cls, persons, **kwargs):
+        """Tạo gallery từ list persons của load_face_database ('embedding' hoặc 'embeddings')"""
+        if not persons:
+            return cls([], [], np.zeros((0, 0), dtype=np.float32), **kwargs)
+        embeddings = [person_embeddings(p) for p in persons]
+        return cls([p['id'] for p in persons],
+                   [p['name'] for p in persons],
+                   np.concatenate(embeddings), counts=[len(e) for e in embeddings], **kwargs)
+
+    def subset(self, ids):
+        """Gallery con chỉ gồm các id trong ids (giữ thứ tự của gallery gốc, bỏ qua id không có)"""
+        snapshot = self._snapshot
+        wanted = set(ids)
+        people = [i for i, pid in enumerate(snapshot.ids) if pid in wanted]
+        offsets = snapshot.offsets
+        rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in people]) if people else []
+        return FaceGallery([snapshot.ids[i] for i in people], [snapshot.names[i] for i in people],
+                           snapshot.matrix[rows].reshape(len(rows), snapshot.matrix.shape[1]), normalized=True,
+                           counts=np.diff(offsets)[people], scoring=self.scoring, top_k=self.top_k)
+
+    # ============================================
+    # THAY ĐỔI KHI ĐANG CHẠY
+    # ============================================
+    def add(self, person_id, name, embedding):
+        """
+        Thêm người với 1 embedding (D,) hoặc nhiều embedding (k, D) (id đã có → update)
+        Ghi vào phần dư của buffer, ma trận cũ không bị copy
+        """
+        embedding = l2_normalize(np.asarray(embedding, dtype=np.float32))
+        embedding = embedding.reshape(-1, embedding.shape[-1])
+        with self._lock:
+            snapshot = self._snapshot
+            if person_id in snapshot.ids:
+                self._replace_rows(snapshot, [snapshot.ids.index(person_id)], {person_id: (name, embedding)})
+                return
+            n, k = snapshot.matrix.shape[0], embedding.shape[0]
+            if len(snapshot.ids) and embedding.shape[1] != snapshot.matrix.shape[1]:
+                raise ValueError(f"Embedding {embedding.shape[1]} chiều, gallery {snapshot.matrix.shape[1]} chiều")
+            buffer = self._buffer
+            if buffer is None or buffer.shape[0] < n + k or buffer.shape[1] != embedding.shape[1]:
+                # Buffer mới gấp đôi: reader đang giữ matrix cũ không bị ảnh hưởng
+                buffer = np.empty((max(16, 2 * (n + k)), embedding.shape[1]), dtype=np.float32)
+                if n:
+                    buffer[:n] = snapshot.matrix
+                self._buffer = buffer
+            buffer[n:n + k] = embedding  # row n.. nằm ngoài matrix của mọi snapshot cũ
+            matrix = buffer[:n + k]
+            index = snapshot.index.updated(matrix, np.arange(n), k) if snapshot.index is not None else None
+            self._publish(GallerySnapshot(snapshot.ids + [person_id], snapshot.names + [name], matrix, index,
+                                          np.append(snapshot.offsets, n + k)))
+
+    def update(self, person_id, name=None, embedding=None):
+        """Đổi tên và/hoặc thay toàn bộ embedding (D,) / (k, D) của người đã có, False nếu không có id"""
+        with self._lock:
+            snapshot = self._snapshot
+            if person_id not in snapshot.ids:
+                return False
+            person = snapshot.ids.index(person_id)
+            if embedding is None:
+                names = list(snapshot.names)
+                names[person] = name if name is not None else names[person]
+                self._publish(snapshot._replace(names=names))
+                return True
+            embedding = l2_normalize(np.asarray(embedding, dtype=np.float32))
+            embedding = embedding.reshape(-1, embedding.shape[-1])
+            self._replace_rows(snapshot, [person], {person_id: (name or snapshot.names[person], embedding)})
+            return True
+
+    def remove(self, person_id):
+        """Xoá người khỏi gallery, False nếu không có id"""
+        with self._lock:
+            snapshot = self._snapshot
+            if person_id not in snapshot.ids:
+                return False
+            self._replace_rows(snapshot, [snapshot.ids.index(person_id)], {})
+            return True
+
+    def replace_with(self, other):
+        """Thay toàn bộ nội dung bằng gallery other (vd. load lại file gốc) trong 1 lần gán, giữ ANN index"""
+        with self._lock:
+            snapshot = other._snapshot
+            index = self._snapshot.index
+            if index is not None and len(snapshot.ids):
+                # Gán lại mọi row vào centroid sẵn có, không train lại
+                index = index.updated(snapshot.matrix, np.arange(0), snapshot.matrix.shape[0])
+            self._buffer = None
+            self._publish(snapshot._replace(index=index if len(snapshot.ids) else None))
+
+    def _replace_rows(self, snapshot, people, appended):
+        """
+        Bỏ người ở vị trí people, nối thêm appended {id: (name, embedding (k, D))} vào cuối
+        → ma trận mới (copy), publish
+        """
+        counts = np.diff(snapshot.offsets)
+        keep = np.setdiff1d(np.arange(len(snapshot.ids)), people)
+        keep_rows = np.flatnonzero(np.isin(np.repeat(np.arange(len(snapshot.ids)), counts), keep))
+        ids = [snapshot.ids[i] for i in keep] + list(appended)
+        names = [snapshot.names[i] for i in keep] + [name for name, _ in appended.values()]
+        new_rows = [embedding for _, embedding in appended.values()]
+        n_new = sum(len(rows) for rows in new_rows)
+        dim = snapshot.matrix.shape[1]
+        matrix = np.empty((max(16, 2 * (len(keep_rows) + n_new)), dim), dtype=np.float32)
+        matrix[:len(keep_rows)] = snapshot.matrix[keep_rows]
+        if new_rows:
+            matrix[len(keep_rows):len(keep_rows) + n_new] = np.concatenate(new_rows)
+        self._buffer = matrix
+        matrix = matrix[:len(keep_rows) + n_new]
+        index = snapshot.index.updated(matrix, keep_rows, n_new) if snapshot.index is not None else None
+        offsets = _offsets(np.concatenate([counts[keep], [len(rows) for rows in new_rows]]))
+        self._publish(GallerySnapshot(ids, names, matrix, index, offsets))
+
+    def _publish(self, snapshot):
+        self._snapshot = snapshot
+        self.version += 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    @property
+    def num_embeddings(self):
+        return self.matrix.shape[0]
+
+    def search(self, probes, k=1):
+        """
+        Tìm top-k row cho batch probe embeddings (M, D) hoặc 1 vector (D,)
+        Returns: (indices, similarities) shape (M, k), sắp xếp giảm dần theo similarity
+        indices là row của matrix, đổi sang vị trí người bằng row_owners(); -1 = ANN index không tìm đủ k row
+        """
+        return self._search(self._snapshot, probes, k)
+
+    @staticmethod
+    def _search(snapshot, probes, k):
+        probes = l2_normalize(np.atleast_2d(probes))
+        if snapshot.index is not None:
+            return snapshot.index.search(probes, k)
+        return exact_search(snapshot.matrix, probes, k)
+
+    def row_owners(self, rows):
+        """Vị trí người (trong ids) sở hữu các row của matrix, row -1 (không có kết quả) → -1"""
+        return _row_owners(self._snapshot, rows)
+
+    # ============================================
+    # GỘP SIMILARITY THEO NGƯỜI
+    # ============================================
+    def _derived_for(self, snapshot):
+        """Dữ liệu suy ra từ snapshot (centroid, vị trí row cho topk), tính lười và dùng lại tới khi đổi snapshot"""
+        cached_snapshot, derived = self._derived
+        if cached_snapshot is not snapshot:
+            derived = {}
+            self._derived = (snapshot, derived)  # race giữa 2 reader chỉ làm tính lại 1 lần, không sai
+        return derived
+
+    def _centroids(self, snapshot):
+        if snapshot.matrix.shape[0] == len(snapshot.ids):
+            return snapshot.matrix
+        derived = self._derived_for(snapshot)
+        if "centroids" not in derived:
+            sums = np.add.reduceat(snapshot.matrix, snapshot.offsets[:-1], axis=0)
+            derived["centroids"] = np.ascontiguousarray(l2_normalize(sums))
+        return derived["centroids"]
+
+    def _topk_rows(self, snapshot):
+        """(rows (P, kmax), valid (P, kmax)): row của từng người, pad tới số row nhiều nhất"""
+        derived = self._derived_for(snapshot)
+        if "topk_rows" not in derived:
+            counts = np.diff(snapshot.offsets)
+            slots = np.arange(counts.max())
+            valid = slots[None, :] < counts[:, None]
+            rows = np.where(valid, snapshot.offsets[:-1, None] + slots[None, :], 0)
+            derived["topk_rows"] = (rows, valid)
+        return derived["topk_rows"]
+
+    def _scores(self, snapshot, probes):
+        """Similarity (M, P) giữa probe và từng người theo self.scoring, probes (M, D) đã normalize"""
+        if self.scoring == "centroid":
+            return probes @ self._centroids(snapshot).T
+        sims = probes @ snapshot.matrix.T
+        if sims.shape[1] == len(snapshot.ids):
+            return sims  # mỗi người 1 row: mọi cách gộp đều như nhau
+        if self.scoring == "max" or self.top_k == 1:
+            return np.maximum.reduceat(sims, snapshot.offsets[:-1], axis=1)
+
+        rows, valid = self._topk_rows(snapshot)
+        if rows.size == sims.shape[1]:
+            grouped = sims.reshape(len(sims), *rows.shape)  # mọi người cùng số row: reshape, không gather
+        else:
+            grouped = np.where(valid, sims[:, rows], -np.inf)  # (M, P, kmax)
+        k = min(self.top_k, rows.shape[1])
+        if k < rows.shape[1]:
+            grouped = np.partition(grouped, rows.shape[1] - k, axis=2)[:, :, -k:]
+        grouped = np.where(np.isfinite(grouped), grouped, 0.0)
+        return grouped.sum(axis=2) / np.minimum(np.diff(snapshot.offsets), k)
+
+    def scores(self, probes):
+        """Similarity (M, P) giữa batch probe và từng người trong ids, theo self.scoring"""
+        return self._scores(self._snapshot, l2_normalize(np.atleast_2d(probes)))
+
+    def match_batch(self, probes, threshold):
+        """
+        Match batch probe embeddings, 1 kết quả cho mỗi probe
+        Returns: list (person_id, person_name, similarity) hoặc (None, "Unknown", best_sim)
+        """
+        snapshot = self._snapshot  # ids/names/matrix cùng 1 phiên bản dù gallery đang được sửa
+        if len(snapshot.ids) == 0:
+            return [(None, "No DB", 0.0) for _ in range(len(np.atleast_2d(probes)))]
+
+        probes = l2_normalize(np.atleast_2d(probes))
+        if snapshot.matrix.shape[0] == len(snapshot.ids) or (self.scoring == "max" and snapshot.index is not None):
+            # 1 row / người, hoặc max qua ANN index: row giống nhất → người sở hữu row
+            idx, sims = self._search(snapshot, probes, k=1)
+            people, sims = _row_owners(snapshot, idx[:, 0]), sims[:, 0]
+        else:
+            # centroid / topk (hoặc max không có index): 1 lần nhân ma trận + gộp theo người
+            scores = self._scores(snapshot, probes)
+            people = np.argmax(scores, axis=1)
+            sims = scores[np.arange(len(people)), people]
+
+        results = []
+        for i, sim in zip(people, sims):
+            sim = float(sim)
+            if i >= 0 and sim >= threshold:
+                results.append((snapshot.ids[i], snapshot.names[i], sim))
+            else:
+                results.append((None, "Unknown", sim))
+        return results
+
+    def match(self, embedding, threshold):
+        """Match 1 embedding, cùng contract với recognize_face"""
+        return self.match_batch(embedding, threshold)[0]
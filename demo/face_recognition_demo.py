@@ -18,6 +18,18 @@ import numpy as np
 import os
 import json
 
+from face_gallery import FaceGallery, person_embeddings
+from ann_index import load_or_build_ivf
+from gallery_format import GALLERY_EXT, load_gallery, load_gallery_persons
+from enrollment_log import EnrollmentWatcher, compacted_seq, enrollment_log_path
+from roster_cache import SubGalleryCache, load_class_rosters
+from pipeline import RecognitionPipeline
+from motion_gate import MotionGate
+from face_tracker import FaceTracker
+from multiscale_detect import MultiScaleDetector
+from startup import format_timings, load_parallel, warm_up_face_model
+from metrics import REGISTRY, SampledLog, enable_log, start_metrics_server
+
 # ============================================
 # CẤU HÌNH - THAY ĐỔI Ở ĐÂY
 # ============================================
@@ -28,11 +40,69 @@ WEBCAM_INDEX = 0  # 0 = webcam mặc định
 
 # Đường dẫn
 ANTISPOOF_DIR = os.path.join(os.path.dirname(__file__), "anti_spoof")
-FACE_DATABASE_PATH = os.path.join(os.path.dirname(__file__), "face_database.json")
+FACE_DATABASE_PATH = os.path.join(os.path.dirname(__file__), "face_database.json")  # .json hoặc .fgal (binary)
 
 # Face Recognition config
 RECOGNITION_THRESHOLD = 0.5  # Cosine similarity threshold (0.5 = 50%)
+# Người có nhiều embedding (nhiều ảnh enroll): cách gộp similarity các embedding của 1 người
+# "max" = embedding giống nhất, "centroid" = so với trung bình (nhanh nhất), "topk" = trung bình RECOGNITION_TOP_K
+# embedding giống nhất. Mỗi người 1 embedding thì 3 cách cho cùng kết quả
+RECOGNITION_SCORING = "max"
+RECOGNITION_TOP_K = 2
 DET_SIZE = (1920, 1920)  # Detection size: (640, 640), (1280, 1280), (1920, 1920)
+# "fixed" = detect toàn frame ở DET_SIZE
+# "multiscale" = coarse pass toàn frame ở size nhỏ (tự chọn theo mặt nhỏ nhất đã thấy) + detect lại ROI,
+#   full DET_SIZE mỗi MULTISCALE_FULL_REFRESH frame. Mặt MỚI quá nhỏ so với coarse size (ở xa) chỉ được thấy ở
+#   lần full kế tiếp → trễ tới MULTISCALE_FULL_REFRESH frame (~1s ở 30 FPS). Chưa đo recall với insightface thật:
+#   chạy benchmarks/bench_detection.py trên video lớp học trước khi bật
+DETECTION_MODE = "fixed"
+MULTISCALE_FULL_REFRESH = 30
+
+# Anti-spoof backend: "torch" = PyTorch (.pth), "onnx" = ONNX Runtime CPU (không cần torch lúc chạy)
+# File .onnx tạo bằng: python -m anti_spoof.onnx_backend --verify
+ANTISPOOF_BACKEND = "torch"
+# Cascade: chạy model nhanh nhất trước, chỉ hỏi các model còn lại khi |p_real - p_fake| < margin
+ANTISPOOF_CASCADE = False
+ANTISPOOF_CASCADE_MARGIN = 0.5  # Tăng → ít exit sớm, gần ensemble đầy đủ hơn (benchmarks/bench_cascade.py)
+ANTISPOOF_OPTIMIZE = True       # Backend torch: gộp Conv-BN, bỏ Dropout (anti_spoof/optimize.py)
+ANTISPOOF_CHANNELS_LAST = True  # Crop (N, H, W, C) sau permute vốn đã là channels_last
+# Lưu graph đã tối ưu (TorchScript) vào anti_spoof/.cache theo hash .pth → lần sau load nhanh, không trace lại
+ANTISPOOF_MODEL_CACHE = True
+ANTISPOOF_ONNX_THREADS = 1  # Thread/model ONNX Runtime, để ít vì chạy chung process với insightface
+# Backend onnx: dùng bản INT8 (.int8.onnx, tạo bằng python -m anti_spoof.quantize --calib crops/)
+# Đo accuracy/tốc độ trên máy thật trước khi bật: benchmarks/bench_quantization.py
+ANTISPOOF_INT8 = False
+
+# ANN index (IVF) cho gallery lớn, gallery nhỏ hơn ngưỡng dùng exact search
+ANN_MIN_GALLERY_SIZE = 5000
+ANN_N_PROBE = 8  # Số inverted list quét mỗi query: tăng → recall cao hơn, chậm hơn
+ANN_INDEX_PATH = os.path.join(os.path.dirname(__file__), "face_index.npz")
+
+# Enroll/xoá sinh viên qua log append-only (enrollment_log.py), áp vào gallery khi đang chạy
+ENROLLMENT_WATCH_INTERVAL = 1.0  # giây giữa 2 lần đọc log, None = chỉ áp log lúc load
+
+# Motion gate: bỏ qua detection khi lớp học đứng yên, dùng lại kết quả detect trước
+MOTION_GATE_ENABLED = True
+MOTION_MIN_CHANGED_RATIO = 0.002  # Tỉ lệ pixel thay đổi tối thiểu để detect lại (nhỏ hơn = nhạy hơn)
+MOTION_MAX_SKIP = 30  # Số frame tối đa được bỏ qua liên tiếp
+
+# Face tracking: cache liveness/identity theo track, chỉ chạy lại khi track mới hoặc cache hết hạn
+TRACKING_ENABLED = True
+LIVENESS_TTL = 2.0  # giây
+IDENTITY_TTL = 5.0  # giây
+
+# Metrics dạng Prometheus tại http://METRICS_HOST:METRICS_PORT/metrics (None = tắt, vd. 9108 để bật)
+METRICS_PORT = None
+METRICS_HOST = "127.0.0.1"  # "0.0.0.0" = cho Prometheus ở máy khác scrape (không có xác thực)
+# Log xác suất anti-spoof (fake1/real/fake2) 1 trong N mặt thay vì print mọi mặt (0 = tắt)
+ANTISPOOF_LOG_EVERY = 100
+
+# Khởi động: chạy thử model trên ảnh đen ngay khi load để frame thật đầu tiên không bị chậm
+WARMUP_MODELS = True
+
+# Session điểm danh: chỉ match sinh viên enroll trong lớp này (None = toàn bộ gallery)
+SESSION_CLASS_CODE = None  # vd "SE01"
+ENROLLMENTS_CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "csv", "09_enrollments.csv")
 
 # ============================================
 # IMPORTS
@@ -47,22 +117,39 @@ except ImportError:
     print("⚠️ Chưa cài insightface")
 
 try:
-    from anti_spoof.models import MiniFASNetV1, MiniFASNetV2, MiniFASNetV1SE, MiniFASNetV2SE
-    from anti_spoof.utils import parse_model_name, get_kernel, CropImage
-    from anti_spoof.transform import Compose, ToTensor
+    from anti_spoof.utils import CropImage
+    if ANTISPOOF_BACKEND == "torch":
+        import torch  # noqa: F401 - backend torch bắt buộc có torch
     ANTISPOOF_AVAILABLE = True
-    print("✅ Anti-Spoofing: Silent-Face ✓")
+    print(f"✅ Anti-Spoofing: Silent-Face ({ANTISPOOF_BACKEND}) ✓")
 except ImportError as e:
     print(f"⚠️ Không thể import anti_spoof: {e}")
 
 
 class RTSPVideoStream:
-    """Đọc video stream trong thread riêng"""
-    def __init__(self, src=0):
+    """
+    Đọc video stream trong thread riêng, frame ghi thẳng vào ring buffer cấp phát sẵn.
+    read() / read_new() trả về view read-only (không copy) kèm lease của slot: slot đang được lease không bị
+    ghi đè, consumer gọi release(lease) khi xong. Nếu lease thêm sẽ làm capture hết slot rảnh → trả bản copy,
+    lease None (release(None) không làm gì).
+    """
+    def __init__(self, src=0, buffer_size=4, reconnect=False, reconnect_delay=1.0, max_reconnect_delay=30.0):
         self.src = src
         self.stream = None
         self.grabbed = False
-        self.frame = None
+        self.connected = False
+        self.reconnect = reconnect  # True = tự kết nối lại khi mất stream (backoff x2, tối đa max_reconnect_delay)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_read_failures = 100
+        self.buffer_size = max(3, buffer_size)  # lease được tối đa buffer_size - 2 slot
+        self.ring = []     # frame cấp phát sẵn, capture ghi thẳng vào đây
+        self.leases = []   # số consumer đang giữ từng slot
+        self.slot_gen = [] # thế hệ của mảng trong slot: lease cũ (mảng đã bị thay) bị bỏ qua khi release
+        self.next_gen = 0
+        self.latest = -1   # slot chứa frame mới nhất
+        self.writing = -1  # slot capture đang ghi
+        self.seq = 0       # số thứ tự frame mới nhất, tăng mỗi lần grab thành công
         self.stop_event = False
         self.lock = threading.Lock()
         
@@ -70,48 +157,146 @@ class RTSPVideoStream:
         threading.Thread(target=self.update, daemon=True).start()
         return self
 
+    def _new_gen(self):
+        self.next_gen += 1
+        return self.next_gen
+
+    def _free_slots(self):
+        """Slot capture được ghi: không phải slot mới nhất / đang ghi, không có lease"""
+        return [i for i in range(len(self.ring))
+                if i != self.latest and i != self.writing and self.leases[i] == 0]
+
+    def _next_slot(self):
+        """Chọn slot để ghi frame kế tiếp (read() luôn chừa lại slot rảnh cho capture)"""
+        with self.lock:
+            if not self.ring:
+                return None
+            free = [(i - self.latest) % len(self.ring) for i in self._free_slots()]
+            if free:
+                idx = (self.latest + min(free)) % len(self.ring)
+            else:
+                # Không còn slot rảnh (không xảy ra khi mọi consumer đều lease qua read): thay mảng mới,
+                # consumer đang giữ mảng cũ không bị ảnh hưởng
+                idx = (self.latest + 1) % len(self.ring)
+                self.ring[idx] = np.empty_like(self.ring[idx])
+                self.leases[idx], self.slot_gen[idx] = 0, self._new_gen()
+            self.writing = idx
+            return idx
+
     def update(self):
-        print(f"📹 Đang kết nối camera: {self.src}...")
-        self.stream = cv2.VideoCapture(self.src)
-        if self.stream.isOpened():
-            self.stream.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            print("✅ Kết nối camera thành công!")
-        else:
-            print("❌ Không thể kết nối camera!")
-            self.stop_event = True
-            return
+        delay = self.reconnect_delay
+        while not self.stop_event:
+            print(f"📹 Đang kết nối camera: {self.src}...")
+            self.stream = cv2.VideoCapture(self.src)
+            if self.stream.isOpened():
+                self.stream.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                print("✅ Kết nối camera thành công!")
+                self.connected = True
+                delay = self.reconnect_delay
+                self._capture_loop()
+                self.connected = False
+            else:
+                print("❌ Không thể kết nối camera!")
+            self.stream.release()
+            
+            if not self.reconnect:
+                self.stop_event = True
+                return
+            # Reconnect với exponential backoff, vẫn dừng được ngay khi stop()
+            print(f"🔄 Kết nối lại {self.src} sau {delay:.1f}s...")
+            deadline = time.time() + delay
+            while not self.stop_event and time.time() < deadline:
+                time.sleep(0.1)
+            delay = min(delay * 2, self.max_reconnect_delay)
 
+    def _capture_loop(self):
+        failures = 0
         while not self.stop_event:
             if not self.stream.isOpened():
                 break
-            grabbed, frame = self.stream.read()
+            idx = self._next_slot()
+            if idx is None:
+                grabbed, frame = self.stream.read()
+            else:
+                grabbed, frame = self.stream.read(self.ring[idx])
             with self.lock:
                 self.grabbed = grabbed
-                self.frame = frame
+                self.writing = -1
+                if grabbed and frame is not None:
+                    if idx is None or frame.shape != self.ring[idx].shape:
+                        # Frame đầu tiên hoặc camera đổi độ phân giải → cấp phát lại ring (lease cũ hết hiệu lực)
+                        self.ring = [frame] + [np.empty_like(frame) for _ in range(self.buffer_size - 1)]
+                        self.leases = [0] * self.buffer_size
+                        self.slot_gen = [self._new_gen() for _ in range(self.buffer_size)]
+                        idx = 0
+                    elif frame is not self.ring[idx]:
+                        self.ring[idx] = frame
+                        self.slot_gen[idx] = self._new_gen()
+                    self.latest = idx
+                    self.seq += 1
+            # Mất stream (read lỗi liên tục) → thoát để reconnect
+            failures = 0 if grabbed else failures + 1
+            if self.reconnect and failures >= self.max_read_failures:
+                print(f"⚠️ Mất tín hiệu camera: {self.src}")
+                break
             time.sleep(0.005)
-        self.stream.release()
 
     def read(self):
+        """Frame mới nhất: (frame view read-only hoặc None, lease) — gọi release(lease) khi dùng xong"""
+        _, frame, lease = self.read_new(0)
+        return frame, lease
+
+    def read_new(self, last_seq):
+        """
+        Frame mới hơn last_seq (để bỏ qua frame trùng)
+        Returns: (seq, frame view read-only, lease) hoặc (last_seq, None, None) nếu chưa có frame mới
+        """
+        with self.lock:
+            if not self.grabbed or self.latest < 0 or self.seq <= last_seq:
+                return last_seq, None, None
+            idx = self.latest
+            unleased = sum(1 for i, n in enumerate(self.leases) if i != idx and n == 0)
+            if self.leases[idx] == 0 and unleased < 2:
+                # Capture cần 2 slot không bị lease ngoài slot này (1 đang/sắp ghi, 1 cho frame sau khi
+                # frame đó thành mới nhất) → trả bản copy, không giữ slot
+                return self.seq, self.ring[idx].copy(), None
+            self.leases[idx] += 1
+            frame = self.ring[idx].view()
+            frame.flags.writeable = False
+            return self.seq, frame, (idx, self.slot_gen[idx])
+
+    def release(self, lease):
+        """Trả slot đã lease qua read() / read_new(); lease None (bản copy) hoặc lease cũ thì bỏ qua"""
+        if lease is None:
+            return
+        idx, gen = lease
         with self.lock:
-            return self.frame.copy() if self.grabbed and self.frame is not None else None
+            if idx < len(self.slot_gen) and self.slot_gen[idx] == gen and self.leases[idx] > 0:
+                self.leases[idx] -= 1
 
     def stop(self):
         self.stop_event = True
 
 
 def load_face_database(path):
-    """Load face database từ JSON file"""
+    """Load face database từ JSON file hoặc file binary .fgal (xem gallery_format.py)"""
     if not os.path.exists(path):
         print(f"⚠️ Không tìm thấy face database: {path}")
         return []
     
     try:
+        if path.endswith(GALLERY_EXT):
+            persons = load_gallery_persons(path)
+            print(f"✅ Loaded {len(persons)} persons from face database")
+            return persons
+        
         with open(path, 'r', encoding='utf-8') as f:
             data = json.load(f)
         persons = data.get('persons', [])
-        # Convert embedding list to numpy array
+        # Convert embedding list to numpy array ('embeddings' (k, D) khi enroll nhiều ảnh)
         for p in persons:
-            p['embedding'] = np.array(p['embedding'], dtype=np.float32)
+            p['embeddings'] = person_embeddings(p)
+            p['embedding'] = p['embeddings'][0]
         print(f"✅ Loaded {len(persons)} persons from face database")
         return persons
     except Exception as e:
@@ -119,6 +304,66 @@ def load_face_database(path):
         return []
 
 
+def load_face_gallery(path):
+    """Load face database thành FaceGallery; file .fgal được memmap, không copy embedding"""
+    scoring = dict(scoring=RECOGNITION_SCORING, top_k=RECOGNITION_TOP_K)
+    if path.endswith(GALLERY_EXT) and os.path.exists(path):
+        try:
+            gallery = load_gallery(path, **scoring)
+            print(f"✅ Loaded {len(gallery)} persons from face database")
+            return gallery
+        except Exception as e:
+            print(f"❌ Lỗi load face database: {e}")
+            return FaceGallery.from_persons([], **scoring)
+    return FaceGallery.from_persons(load_face_database(path), **scoring)
+
+
+def limit_session_threads(face_model, num_threads):
+    """
+    Tạo lại session ONNX Runtime của các model FaceAnalysis với intra_op_num_threads = num_threads
+    (insightface chỉ chuyển providers/provider_options vào session, không nhận SessionOptions)
+    """
+    import onnxruntime
+    sess_options = onnxruntime.SessionOptions()
+    sess_options.intra_op_num_threads = num_threads
+    sess_options.inter_op_num_threads = 1
+    for model in face_model.models.values():
+        model.session = onnxruntime.InferenceSession(model.model_file, sess_options=sess_options,
+                                                     providers=model.session.get_providers())
+
+
+def load_face_model(det_size=DET_SIZE, allowed_modules=None, warm_up=WARMUP_MODELS, num_threads=None):
+    """
+    FaceAnalysis buffalo_l đã prepare (+ warm-up trên ảnh đen)
+    num_threads: intra-op thread của mỗi session ONNX Runtime (None = mặc định ORT, bằng số core)
+    """
+    face_model = FaceAnalysis(name='buffalo_l', allowed_modules=allowed_modules,
+                              providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+    face_model.prepare(ctx_id=0, det_size=det_size)
+    if num_threads:
+        limit_session_threads(face_model, num_threads)
+    if warm_up:
+        warm_up_face_model(face_model, det_size)
+    return face_model
+
+
+def load_gallery_with_log(path=FACE_DATABASE_PATH, on_change=None):
+    """
+    Load face database + áp log enroll chưa compact, trả về (gallery, EnrollmentWatcher chưa start)
+    Seq đã compact được đọc trước khi load file gốc → compact chen giữa 2 bước sẽ bị phát hiện và reload
+    Start watcher sau khi đã gắn ANN index để index build trên đúng ma trận
+    """
+    log_path = enrollment_log_path(path)
+    base_seq = compacted_seq(log_path)
+    gallery = load_face_gallery(path)
+    watcher = EnrollmentWatcher(gallery, log_path, reload_fn=lambda: load_face_gallery(path),
+                                on_change=on_change, interval=ENROLLMENT_WATCH_INTERVAL, base_seq=base_seq)
+    applied = watcher.poll()
+    if applied:
+        print(f"✅ Đã áp {len(applied)} record từ log enroll")
+    return gallery, watcher
+
+
 def cosine_similarity(emb1, emb2):
     """Tính cosine similarity giữa 2 embedding vectors"""
     dot = np.dot(emb1, emb2)
@@ -132,24 +377,16 @@ def cosine_similarity(emb1, emb2):
 def recognize_face(embedding, database, threshold=RECOGNITION_THRESHOLD):
     """
     So sánh embedding với database, trả về person match nhất
+    database: FaceGallery (khuyến nghị) hoặc list persons từ load_face_database
     Returns: (person_id, person_name, similarity) hoặc (None, "Unknown", best_sim)
     """
     if not database:
         return None, "No DB", 0.0
     
-    best_match = None
-    best_sim = -1.0
-    
-    for person in database:
-        sim = cosine_similarity(embedding, person['embedding'])
-        if sim > best_sim:
-            best_sim = sim
-            best_match = person
+    if not isinstance(database, FaceGallery):
+        database = FaceGallery.from_persons(database, scoring=RECOGNITION_SCORING, top_k=RECOGNITION_TOP_K)
     
-    if best_sim >= threshold and best_match:
-        return best_match['id'], best_match['name'], best_sim
-    
-    return None, "Unknown", best_sim
+    return database.match(embedding, threshold)
 
 
 def is_frontal_face(kps, threshold=0.25):
@@ -178,22 +415,42 @@ def is_frontal_face(kps, threshold=0.25):
     return is_frontal, ratio
 
 
+ANTISPOOF_SECONDS = REGISTRY.histogram("fuacs_antispoof_batch_seconds", "Thời gian 1 lần check_batch (crop + forward)")
+ANTISPOOF_FACES = REGISTRY.counter("fuacs_antispoof_faces_total", "Số mặt đã kiểm tra liveness", ("result",))
+RENDER_SECONDS = REGISTRY.histogram("fuacs_render_seconds", "Thời gian hiển thị 1 frame lên Tk (main thread)")
+
+
 class AntiSpoofEngine:
     """Engine quản lý Silent-Face anti-spoofing"""
     
-    def __init__(self, device_id=0):
+    def __init__(self, device_id=0, backend=ANTISPOOF_BACKEND, cascade=ANTISPOOF_CASCADE,
+                 cascade_margin=ANTISPOOF_CASCADE_MARGIN):
         self.device_id = device_id
+        self.backend = backend
         self.device = None
         self.models = {}
+        self.cascade = cascade
+        self.cascade_margin = cascade_margin
+        self.cascade_order = []  # Tên model theo latency tăng dần
+        self.cascade_stats = {"faces": 0, "early_exit": 0, "model_runs": 0}
         self.image_cropper = None
+        self.lock = threading.Lock()  # Buffer input dùng chung → mỗi lần chỉ 1 check_batch
+        self.sf_log = SampledLog("anti_spoof", every=ANTISPOOF_LOG_EVERY)
         self.available = False
         
     def load(self):
         """Tải models"""
         if not ANTISPOOF_AVAILABLE:
             return False
+        
+        if self.backend == "onnx":
+            return self._load_onnx()
             
         import torch
+        from anti_spoof.model_cache import load_optimized_model
+        from anti_spoof.models import load_model
+        from anti_spoof.optimize import optimize_for_inference
+        from anti_spoof.transform import BatchBuffer
         
         self.device = torch.device(f"cuda:{self.device_id}" if torch.cuda.is_available() else "cpu")
         print(f"🔄 Device: {self.device}")
@@ -203,33 +460,71 @@ class AntiSpoofEngine:
             
             model_files = [f for f in os.listdir(ANTISPOOF_DIR) 
                           if f.endswith('.pth') and 'MiniFAS' in f]
-            MODEL_MAPPING = {
-                'MiniFASNetV1': MiniFASNetV1, 'MiniFASNetV2': MiniFASNetV2,
-                'MiniFASNetV1SE': MiniFASNetV1SE, 'MiniFASNetV2SE': MiniFASNetV2SE
-            }
             
             for model_name in model_files:
-                h_input, w_input, model_type, scale = parse_model_name(model_name)
-                kernel_size = get_kernel(h_input, w_input)
-                
-                model = MODEL_MAPPING[model_type](conv6_kernel=kernel_size).to(self.device)
                 model_path = os.path.join(ANTISPOOF_DIR, model_name)
+                cached = ""
+                if ANTISPOOF_OPTIMIZE and ANTISPOOF_MODEL_CACHE:
+                    model, (h_input, w_input, model_type, scale), hit = load_optimized_model(
+                        model_path, self.device, channels_last=ANTISPOOF_CHANNELS_LAST)
+                    cached = " (cache)" if hit else " (đã lưu cache)"
+                else:
+                    model, (h_input, w_input, model_type, scale) = load_model(model_path, self.device)
+                    if ANTISPOOF_OPTIMIZE:
+                        model = optimize_for_inference(model, channels_last=ANTISPOOF_CHANNELS_LAST)
                 
-                state_dict = torch.load(model_path, map_location=self.device, weights_only=True)
-                if list(state_dict.keys())[0].startswith('module.'):
-                    from collections import OrderedDict
-                    state_dict = OrderedDict((k[7:], v) for k, v in state_dict.items())
-                
-                model.load_state_dict(state_dict)
-                model.eval()
+                self.models[model_name] = {
+                    'model': model, 'h_input': h_input, 'w_input': w_input, 'scale': scale,
+                    # Input buffer dùng lại mỗi frame (pinned khi CUDA)
+                    'buffer': BatchBuffer(h_input, w_input, device=self.device,
+                                          channels_last=ANTISPOOF_CHANNELS_LAST)
+                }
+                print(f"   ✓ {model_name}{cached}")
+            
+            self.image_cropper = CropImage()
+            self.available = len(self.models) > 0
+            self._rank_models()
+            print("✅ Silent-Face đã sẵn sàng!")
+            return self.available
+            
+        except Exception as e:
+            print(f"❌ Lỗi tải Silent-Face: {e}")
+            return False
+    
+    def _load_onnx(self):
+        """Tải models bằng ONNX Runtime; .pth chưa có .onnx tương ứng thì export (cần torch)"""
+        from anti_spoof.onnx_backend import OnnxModel, export_model, onnx_path_for
+        
+        self.device = "cpu"
+        print(f"🔄 Device: {self.device} (ONNX Runtime)")
+        
+        try:
+            print("🔄 Đang tải Silent-Face models (ONNX)...")
+            
+            model_files = [f for f in os.listdir(ANTISPOOF_DIR) 
+                          if f.endswith('.pth') and 'MiniFAS' in f]
+            
+            for model_name in model_files:
+                onnx_path = onnx_path_for(os.path.join(ANTISPOOF_DIR, model_name))
+                if not os.path.exists(onnx_path):
+                    print(f"   🔄 Export {model_name} → ONNX")
+                    export_model(os.path.join(ANTISPOOF_DIR, model_name), onnx_path)
+                if ANTISPOOF_INT8:
+                    int8_path = onnx_path.replace(".onnx", ".int8.onnx")
+                    if os.path.exists(int8_path):
+                        onnx_path = int8_path
+                    else:
+                        print(f"   ⚠️ Chưa có {os.path.basename(int8_path)}, dùng FP32")
                 
+                model = OnnxModel(onnx_path, num_threads=ANTISPOOF_ONNX_THREADS)
                 self.models[model_name] = {
-                    'model': model, 'h_input': h_input, 'w_input': w_input, 'scale': scale
+                    'model': model, 'h_input': model.h_input, 'w_input': model.w_input, 'scale': model.scale
                 }
-                print(f"   ✓ {model_name}")
+                print(f"   ✓ {os.path.basename(onnx_path)}")
             
             self.image_cropper = CropImage()
             self.available = len(self.models) > 0
+            self._rank_models()
             print("✅ Silent-Face đã sẵn sàng!")
             return self.available
             
@@ -242,47 +537,131 @@ class AntiSpoofEngine:
         Kiểm tra liveness
         Returns: (is_real, score, label)
         """
-        if not self.available:
-            return True, 0.5, "N/A"
+        return self.check_batch(frame, [bbox])[0]
+    
+    def _rank_models(self, repeat=3):
+        """Đo latency 1 mặt của từng model (kiêm warm-up), sắp tăng dần làm thứ tự cascade"""
+        frame = np.zeros((160, 160, 3), dtype=np.uint8)
+        for name, model_info in self.models.items():
+            batch = self._crop_batch(frame, [[40, 40, 80, 80]], [model_info])[0]
+            self._forward(model_info['model'], batch)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                self._forward(model_info['model'], batch)
+            model_info['latency'] = (time.perf_counter() - start) / repeat
+        self.cascade_order = sorted(self.models, key=lambda name: self.models[name]['latency'])
+    
+    def early_exit_ratio(self):
+        faces = self.cascade_stats["faces"]
+        return self.cascade_stats["early_exit"] / faces if faces else 0.0
+    
+    def _crop_batch(self, frame, image_bboxes, model_infos):
+        """Crop mọi mặt cho các model: list batch (N, 3, h, w) float, cùng thứ tự model_infos"""
+        configs = [(m['scale'], m['w_input'], m['h_input']) for m in model_infos]
+        
+        if self.backend == "torch" and self.device.type == "cuda":
+            import torch
+            from anti_spoof.utils import crop_batch_torch
             
+            # Upload frame 1 lần, crop + resize trên GPU cho cả batch
+            frame_t = torch.from_numpy(np.ascontiguousarray(frame)).to(self.device).permute(2, 0, 1)[None].float()
+            src_h, src_w = frame.shape[:2]
+            batches = []
+            for scale, out_w, out_h in configs:
+                if scale is None:
+                    boxes = [[0, 0, src_w - 1, src_h - 1]] * len(image_bboxes)
+                else:
+                    boxes = self.image_cropper._get_new_boxes(src_w, src_h, image_bboxes, scale)
+                batches.append(crop_batch_torch(frame_t, boxes, out_w, out_h))
+            return batches
+        
+        if self.backend == "torch":
+            # Crop ghi thẳng vào buffer của từng model, không cấp phát ở steady state
+            buffers = [m['buffer'] for m in model_infos]
+            self.image_cropper.crop_batch(frame, image_bboxes, configs, buffers=buffers)
+            return [buffer.to_device(len(image_bboxes)) for buffer in buffers]
+        
+        return self.image_cropper.crop_batch(frame, image_bboxes, configs)
+    
+    def _forward(self, model, batch):
+        """batch (N, 3, h, w) float32 (numpy hoặc tensor trên device) → xác suất softmax (N, 3)"""
+        if self.backend == "onnx":
+            from anti_spoof.onnx_backend import softmax
+            return softmax(model(batch))
+        
         import torch
         import torch.nn.functional as F
         
-        x1, y1, x2, y2 = [int(v) for v in bbox]
-        image_bbox = [x1, y1, x2 - x1, y2 - y1]
-        if image_bbox[2] <= 0 or image_bbox[3] <= 0:
-            return True, 0.5, "N/A"
-        
-        prediction = np.zeros((1, 3))
-        test_transform = Compose([ToTensor()])
-        
-        for model_info in self.models.values():
-            param = {
-                "org_img": frame, "bbox": image_bbox,
-                "scale": model_info['scale'],
-                "out_w": model_info['w_input'], "out_h": model_info['h_input'],
-                "crop": model_info['scale'] is not None,
-            }
-            img = self.image_cropper.crop(**param)
-            img_tensor = test_transform(img).unsqueeze(0).to(self.device)
-            
-            with torch.no_grad():
-                result = model_info['model'](img_tensor)
-                result = F.softmax(result, dim=1).cpu().numpy()
-            prediction += result
+        if isinstance(batch, np.ndarray):
+            batch = torch.from_numpy(batch).to(self.device)
+        with torch.no_grad():
+            return F.softmax(model(batch), dim=1).cpu().numpy()
+    
+    def _predict_all(self, frame, image_bboxes, model_infos):
+        """Tổng softmax (N, 3) của các model trên cùng tập mặt"""
+        total = np.zeros((len(image_bboxes), 3))
+        for model_info, batch in zip(model_infos, self._crop_batch(frame, image_bboxes, model_infos)):
+            total += self._forward(model_info['model'], batch)
+        self.cascade_stats["model_runs"] += len(model_infos) * len(image_bboxes)
+        return total
+    
+    def _predict_cascade(self, frame, image_bboxes):
+        """Model nhanh nhất cho mọi mặt; mặt có margin real/fake thấp mới chạy thêm các model còn lại"""
+        ordered = [self.models[name] for name in self.cascade_order]
+        prediction = self._predict_all(frame, image_bboxes, ordered[:1])
         
-        num_models = len(self.models)
-        prediction = prediction / num_models
+        margin = np.abs(prediction[:, 1] - np.maximum(prediction[:, 0], prediction[:, 2]))
+        uncertain = np.flatnonzero(margin < self.cascade_margin)
+        self.cascade_stats["faces"] += len(image_bboxes)
+        self.cascade_stats["early_exit"] += len(image_bboxes) - len(uncertain)
         
-        # Log chi tiết 3 classes
-        fake1, real, fake2 = prediction[0]
-        label_idx = np.argmax(prediction)
-        score = prediction[0][label_idx]
-        is_real = label_idx == 1
+        if len(uncertain):
+            # Mặt chưa chắc chắn: trung bình trên toàn bộ ensemble như chế độ thường
+            rest = self._predict_all(frame, [image_bboxes[i] for i in uncertain], ordered[1:])
+            prediction[uncertain] = (prediction[uncertain] + rest) / len(ordered)
+        return prediction
+    
+    def check_batch(self, frame, bboxes):
+        """
+        Kiểm tra liveness cho nhiều mặt trong cùng frame: mỗi model chạy 1 forward cho cả batch
+        Returns: list (is_real, score, label), cùng thứ tự với bboxes
+        """
+        results = [(True, 0.5, "N/A")] * len(bboxes)
+        if not self.available or len(bboxes) == 0:
+            return results
+            
+        # Bỏ qua bbox rỗng, giữ index để trả kết quả đúng vị trí
+        image_bboxes, valid = [], []
+        for i, bbox in enumerate(bboxes):
+            x1, y1, x2, y2 = [int(v) for v in bbox]
+            if x2 - x1 > 0 and y2 - y1 > 0:
+                image_bboxes.append([x1, y1, x2 - x1, y2 - y1])
+                valid.append(i)
+        if not valid:
+            return results
+        
+        # Mọi box tính bằng numpy 1 lần, crop ra thẳng batch NCHW float cho từng model
+        with self.lock, ANTISPOOF_SECONDS.time():
+            if self.cascade and len(self.models) > 1:
+                prediction = self._predict_cascade(frame, image_bboxes)
+            else:
+                prediction = self._predict_all(frame, image_bboxes, list(self.models.values())) / len(self.models)
         
-        print(f"[SF] fake1={fake1:.3f}, real={real:.3f}, fake2={fake2:.3f} → {'REAL' if is_real else 'FAKE'} {score:.3f}")
+        for i, probs in zip(valid, prediction):
+            label_idx = np.argmax(probs)
+            score = probs[label_idx]
+            is_real = label_idx == 1
+            label = "REAL" if is_real else "FAKE"
+            
+            # Log chi tiết 3 classes, chỉ 1 trong ANTISPOOF_LOG_EVERY mặt
+            if self.sf_log.should_log():
+                fake1, real, fake2 = probs
+                self.sf_log.write("sf", fake1=float(fake1), real=float(real), fake2=float(fake2),
+                                  result=label, score=float(score))
+            ANTISPOOF_FACES.labels(label).inc()
+            results[i] = (bool(is_real), float(score), label)
         
-        return is_real, float(score), "REAL" if is_real else "FAKE"
+        return results
 
 
 class App:
@@ -300,8 +679,11 @@ class App:
         self.anti_spoof_enabled = BooleanVar(value=False)
         self.face_recognition_enabled = BooleanVar(value=False)
         self.face_model = None
-        self.anti_spoof = AntiSpoofEngine(device_id=0)
-        self.face_database = []
+        self.anti_spoof = AntiSpoofEngine(device_id=0, backend=ANTISPOOF_BACKEND)
+        self.face_database = FaceGallery.from_persons([])
+        self.roster_cache = SubGalleryCache(self.face_database)
+        self.match_gallery = self.face_database  # gallery dùng để match (full hoặc theo session)
+        self.session_roster = None  # roll number của SESSION_CLASS_CODE
         
         # --- Statistics ---
         self.stats = {"real": 0, "fake": 0, "total": 0}
@@ -382,35 +764,56 @@ class App:
         # START
         # ============================================
         self.video_stream = RTSPVideoStream(self.camera_source).start()
+        self.pipeline = RecognitionPipeline(self.video_stream, RECOGNITION_THRESHOLD,
+                                            is_frontal_face)
+        if MOTION_GATE_ENABLED:
+            self.pipeline.motion_gate = MotionGate(min_changed_ratio=MOTION_MIN_CHANGED_RATIO,
+                                                   max_skip=MOTION_MAX_SKIP)
+        if TRACKING_ENABLED:
+            self.pipeline.tracker = FaceTracker(liveness_ttl=LIVENESS_TTL, identity_ttl=IDENTITY_TTL)
+        self.pipeline.start()
+        self.has_frame = False
         threading.Thread(target=self.init_models, daemon=True).start()
         self.update_video()
     
     def init_models(self):
-        """Tải models"""
+        """Tải face model, anti-spoof và face database song song, in thời gian từng phần"""
         status_parts = []
         
         try:
+            tasks = {"gallery": self._load_gallery}
             if INSIGHTFACE_AVAILABLE:
                 print("🔄 Đang tải Face Detection...")
-                self.face_model = FaceAnalysis(name='buffalo_l',
-                    providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
-                self.face_model.prepare(ctx_id=0, det_size=DET_SIZE)
+                tasks["face"] = load_face_model
+            if ANTISPOOF_AVAILABLE:
+                tasks["antispoof"] = self.anti_spoof.load
+            results, timings, _ = load_parallel(tasks)
+            print(f"⏱️ Khởi động: {format_timings(timings)}")
+            
+            if results.get("face") is not None:
+                self.face_model = results["face"]
+                if DETECTION_MODE == "multiscale":
+                    self.pipeline.detector = MultiScaleDetector(self.face_model.det_model, full_size=DET_SIZE,
+                                                                full_refresh_interval=MULTISCALE_FULL_REFRESH)
+                self.pipeline.face_model = self.face_model
                 status_parts.append("Face ✓")
             else:
                 status_parts.append("Face ✗")
             
             if ANTISPOOF_AVAILABLE:
-                if self.anti_spoof.load():
+                if results.get("antispoof"):
+                    self.pipeline.anti_spoof = self.anti_spoof
                     status_parts.append("AntiSpoof ✓")
                 else:
                     status_parts.append("AntiSpoof ✗")
             
-            # Load face database
-            self.face_database = load_face_database(FACE_DATABASE_PATH)
             if self.face_database:
                 status_parts.append(f"DB: {len(self.face_database)}")
+                if SESSION_CLASS_CODE:
+                    status_parts.append(f"{SESSION_CLASS_CODE}: {len(self.match_gallery)}")
             else:
                 status_parts.append("DB ✗")
+            self.pipeline.gallery = self.match_gallery
             
             status_text = " | ".join(status_parts)
             self.root.after(0, lambda: self.lbl_status.configure(text=f"Status: {status_text}", fg="#27ae60"))
@@ -419,108 +822,78 @@ class App:
             print(f"❌ Lỗi: {e}")
             self.root.after(0, lambda: self.lbl_status.configure(text=f"Error: {str(e)[:30]}", fg="#e74c3c"))
     
+    def _load_gallery(self):
+        """Load face database + log enroll (+ IVF index, roster của session), chạy trong thread khởi động"""
+        gallery, watcher = load_gallery_with_log(FACE_DATABASE_PATH, on_change=self._on_enrollment)
+        if len(gallery) >= ANN_MIN_GALLERY_SIZE:
+            load_or_build_ivf(gallery, ANN_INDEX_PATH, n_probe=ANN_N_PROBE)
+        
+        # Session theo lớp → chỉ match trong roster của lớp
+        self.face_database = gallery
+        self.roster_cache.set_gallery(gallery)
+        self.session_roster = None
+        if SESSION_CLASS_CODE:
+            self.session_roster = load_class_rosters(ENROLLMENTS_CSV_PATH).get(SESSION_CLASS_CODE, [])
+        self._refresh_match_gallery()
+        watcher.start()
+        return gallery
+    
+    def _refresh_match_gallery(self):
+        self.match_gallery = self.face_database
+        if self.session_roster is not None:
+            self.match_gallery = self.roster_cache.get(SESSION_CLASS_CODE, self.session_roster)
+    
+    def _on_enrollment(self, records):
+        """Gallery vừa add/update/remove (thread watcher): session theo lớp cần build lại sub-gallery"""
+        if self.session_roster is not None:
+            self._refresh_match_gallery()
+            self.pipeline.gallery = self.match_gallery
+    
     def reset_stats(self):
         self.stats = {"real": 0, "fake": 0, "total": 0}
         self.lbl_stats.configure(text="Real: 0 | Fake: 0 | Total: 0")
     
     def update_video(self):
+        """Main thread chỉ đồng bộ option + hiển thị kết quả, inference chạy trong pipeline"""
         if not self.is_playing:
             return
-
-        frame = self.video_stream.read()
         
-        if frame is not None:
-            display_frame = frame.copy()
-            
-            if self.face_detection_enabled.get() and self.face_model is not None:
-                try:
-                    faces = self.face_model.get(frame)
-                    
-                    for face in faces:
-                        bbox = face.bbox.astype(int)
-                        
-                        # Anti-Spoofing check (chỉ kiểm tra frontal khi bật anti-spoof)
-                        if self.anti_spoof_enabled.get():
-                            # Kiểm tra mặt có nhìn thẳng không
-                            is_frontal, yaw_ratio = is_frontal_face(face.kps, threshold=0.25)
-                            
-                            if not is_frontal:
-                                # Mặt nghiêng → skip anti-spoof
-                                color = (0, 255, 255)  # Yellow
-                                display_label = f"TURN {yaw_ratio:.2f}"
-                                cv2.rectangle(display_frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 2)
-                                cv2.putText(display_frame, display_label, (bbox[0], bbox[1] - 10),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                                if face.kps is not None:
-                                    for kp in face.kps.astype(int):
-                                        cv2.circle(display_frame, (kp[0], kp[1]), 2, (255, 0, 0), -1)
-                                continue
-                            is_real, spoof_score, spoof_label = self.anti_spoof.check(frame, face.bbox)
-                            
-                            # Update stats
-                            self.stats["total"] += 1
-                            if is_real:
-                                self.stats["real"] += 1
-                            else:
-                                self.stats["fake"] += 1
-                                color = (0, 0, 255)  # Red for FAKE
-                                display_label = f"FAKE {spoof_score:.2f}"
-                                cv2.rectangle(display_frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 2)
-                                cv2.putText(display_frame, display_label, (bbox[0], bbox[1] - 10),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                                if face.kps is not None:
-                                    for kp in face.kps.astype(int):
-                                        cv2.circle(display_frame, (kp[0], kp[1]), 2, (255, 0, 0), -1)
-                                self.lbl_stats.configure(
-                                    text=f"Real: {self.stats['real']} | Fake: {self.stats['fake']} | Total: {self.stats['total']}")
-                                continue
-                            
-                            self.lbl_stats.configure(
-                                text=f"Real: {self.stats['real']} | Fake: {self.stats['fake']} | Total: {self.stats['total']}")
-                        
-                        # Face Recognition
-                        if self.face_recognition_enabled.get() and face.embedding is not None:
-                            person_id, person_name, similarity = recognize_face(
-                                face.embedding, self.face_database, RECOGNITION_THRESHOLD)
-                            
-                            if person_id:
-                                color = (0, 255, 0)  # Green - recognized
-                                display_label = f"{person_id} ({similarity:.2f})"
-                                self.lbl_model_info.configure(text=f"{person_name} | sim={similarity:.3f}")
-                            else:
-                                color = (0, 165, 255)  # Orange - unknown
-                                display_label = f"Unknown ({similarity:.2f})"
-                                self.lbl_model_info.configure(text=f"Unknown | best_sim={similarity:.3f}")
-                        else:
-                            color = (0, 255, 0)
-                            display_label = f"{face.det_score:.2f}"
-                        
-                        cv2.rectangle(display_frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 2)
-                        cv2.putText(display_frame, display_label, (bbox[0], bbox[1] - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                        
-                        if face.kps is not None:
-                            for kp in face.kps.astype(int):
-                                cv2.circle(display_frame, (kp[0], kp[1]), 2, (255, 0, 0), -1)
-                                
-                except Exception as e:
-                    print(f"Error: {e}")
-            
-            cv2image = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(cv2image)
-            
-            win_w, win_h = self.video_label.winfo_width(), self.video_label.winfo_height()
-            if win_w > 1 and win_h > 1:
-                img = img.resize((win_w, win_h), Image.Resampling.LANCZOS)
-            
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.video_label.imgtk = imgtk
-            self.video_label.configure(image=imgtk, text="")
-        else:
+        self.pipeline.detect_enabled = self.face_detection_enabled.get()
+        self.pipeline.liveness_enabled = self.anti_spoof_enabled.get()
+        self.pipeline.recognize_enabled = self.face_recognition_enabled.get()
+        self.pipeline.render_size = (self.video_label.winfo_width(), self.video_label.winfo_height())
+        
+        result = self.pipeline.latest()
+        
+        if result is not None and result.get("rgb") is not None:
+            self.has_frame = True
+            with RENDER_SECONDS.time():
+                self.update_stats(result["faces"])
+                
+                imgtk = ImageTk.PhotoImage(image=Image.fromarray(result["rgb"]))
+                self.video_label.imgtk = imgtk
+                self.video_label.configure(image=imgtk, text="")
+        elif not self.has_frame:
             self.video_label.configure(text="📹 Đang kết nối...", fg="white")
         
         self.root.after(15, self.update_video)
     
+    def update_stats(self, faces):
+        """Cập nhật thống kê Real/Fake và thông tin nhận diện từ kết quả của 1 frame"""
+        for face in faces:
+            if face["liveness"] is not None:
+                self.stats["total"] += 1
+                self.stats["real" if face["liveness"][0] else "fake"] += 1
+                self.lbl_stats.configure(
+                    text=f"Real: {self.stats['real']} | Fake: {self.stats['fake']} | Total: {self.stats['total']}")
+            
+            if face["identity"] is not None:
+                person_id, person_name, similarity = face["identity"]
+                if person_id:
+                    self.lbl_model_info.configure(text=f"{person_name} | sim={similarity:.3f}")
+                else:
+                    self.lbl_model_info.configure(text=f"Unknown | best_sim={similarity:.3f}")
+    
     def snapshot(self):
         """
         Chụp ảnh với logic:
@@ -528,10 +901,12 @@ class App:
         - FAKE: wide crop (padding 200px) để thấy context xung quanh
         - Không có mặt hoặc không bật anti-spoof: full frame
         """
-        frame = self.video_stream.read()
+        frame, lease = self.video_stream.read()
         if frame is None:
             messagebox.showwarning("Cảnh báo", "Chưa có video!")
             return
+        frame = frame.copy()  # giữ frame trong lúc hiện messagebox → copy rồi trả slot ngay
+        self.video_stream.release(lease)
         
         timestamp = int(time.time())
         h, w = frame.shape[:2]
@@ -623,6 +998,7 @@ class App:
     
     def on_close(self):
         self.is_playing = False
+        self.pipeline.stop()
         self.video_stream.stop()
         self.root.destroy()
 
@@ -635,9 +1011,15 @@ if __name__ == "__main__":
     print("=" * 50)
     print(f"Camera: {'Webcam' if USE_WEBCAM else 'RTSP'} ({camera_source})")
     print(f"InsightFace: {'✓' if INSIGHTFACE_AVAILABLE else '✗'}")
-    print(f"Silent-Face: {'✓' if ANTISPOOF_AVAILABLE else '✗'}")
+    print(f"Silent-Face: {'✓' if ANTISPOOF_AVAILABLE else '✗'} ({ANTISPOOF_BACKEND})")
     print("=" * 50)
     
+    if ANTISPOOF_LOG_EVERY:
+        enable_log("anti_spoof")
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+        print(f"📊 Metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    
     root = tk.Tk()
     app = App(root, camera_source)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Face tracker IoU/centroid: gán track ID cho detection qua các frame
+- Cache kết quả liveness và identity theo track, có TTL
+- Chỉ chạy lại anti-spoof / recognition khi track mới, cache hết hạn hoặc kết quả cũ kém tin cậy
+- Identity lưu kèm phiên bản gallery lúc nhận diện → enroll / xoá người (gallery đổi) thì nhận diện lại
+  → steady state (sinh viên ngồi yên) gần như không tốn inference
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU giữa 2 tập bbox (x1, y1, x2, y2): shape (len(a), len(b))"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    def __init__(self, track_id, bbox, now):
+        self.track_id = track_id
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.last_seen = now
+        self.missed = 0
+        self.hits = 1
+        self.liveness = None      # (is_real, score, label)
+        self.liveness_at = 0.0
+        self.identity = None      # (person_id, person_name, similarity)
+        self.identity_at = 0.0
+        self.identity_version = None
+
+
+class FaceTracker:
+    """
+    iou_threshold: IoU tối thiểu để nối detection vào track cũ
+    centroid_ratio: không đạt IoU thì nối nếu tâm lệch < centroid_ratio * cạnh bbox của track
+    max_missed: số frame liên tiếp không thấy trước khi xoá track
+    liveness_ttl / identity_ttl: thời gian (s) cache còn hiệu lực
+    min_liveness_score: score liveness dưới ngưỡng → không cache, kiểm tra lại frame sau
+    identity_margin: similarity phải >= threshold + margin mới cache identity
+    """
+
+    def __init__(self, iou_threshold=0.3, centroid_ratio=0.5, max_missed=10,
+                 liveness_ttl=2.0, identity_ttl=5.0, min_liveness_score=0.8, identity_margin=0.05):
+        self.iou_threshold = iou_threshold
+        self.centroid_ratio = centroid_ratio
+        self.max_missed = max_missed
+        self.liveness_ttl = liveness_ttl
+        self.identity_ttl = identity_ttl
+        self.min_liveness_score = min_liveness_score
+        self.identity_margin = identity_margin
+        self.tracks = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.stats = {"liveness_run": 0, "liveness_cached": 0, "identity_run": 0, "identity_cached": 0}
+
+    def update(self, bboxes, now=None):
+        """Nối detections của frame hiện tại vào track; trả về list track_id theo thứ tự bboxes"""
+        now = time.time() if now is None else now
+        bboxes = [np.asarray(b, dtype=np.float32) for b in bboxes]
+
+        with self.lock:
+            track_ids = list(self.tracks)
+            assigned = [None] * len(bboxes)
+            used = set()
+
+            if track_ids and bboxes:
+                track_boxes = np.stack([self.tracks[t].bbox for t in track_ids])
+                det_boxes = np.stack(bboxes)
+
+                # 1. Greedy theo IoU giảm dần
+                ious = iou_matrix(track_boxes, det_boxes)
+                for flat in np.argsort(-ious, axis=None):
+                    ti, di = np.unravel_index(flat, ious.shape)
+                    if ious[ti, di] < self.iou_threshold:
+                        break
+                    if assigned[di] is None and ti not in used:
+                        assigned[di] = track_ids[ti]
+                        used.add(ti)
+
+                # 2. Còn lại → nối theo khoảng cách tâm (mặt di chuyển nhanh, IoU thấp)
+                centers_t = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+                centers_d = (det_boxes[:, :2] + det_boxes[:, 2:]) / 2
+                sizes_t = np.maximum(track_boxes[:, 2] - track_boxes[:, 0], track_boxes[:, 3] - track_boxes[:, 1])
+                dists = np.linalg.norm(centers_t[:, None] - centers_d[None], axis=2) / np.maximum(sizes_t[:, None], 1)
+                for flat in np.argsort(dists, axis=None):
+                    ti, di = np.unravel_index(flat, dists.shape)
+                    if dists[ti, di] > self.centroid_ratio:
+                        break
+                    if assigned[di] is None and ti not in used:
+                        assigned[di] = track_ids[ti]
+                        used.add(ti)
+
+            for di, track_id in enumerate(assigned):
+                if track_id is None:
+                    track_id = self.next_id
+                    self.next_id += 1
+                    self.tracks[track_id] = Track(track_id, bboxes[di], now)
+                    assigned[di] = track_id
+                else:
+                    track = self.tracks[track_id]
+                    track.bbox = bboxes[di]
+                    track.last_seen = now
+                    track.missed = 0
+                    track.hits += 1
+
+            # Track không được thấy ở frame này
+            seen = set(assigned)
+            for track_id in list(self.tracks):
+                if track_id not in seen:
+                    self.tracks[track_id].missed += 1
+                    if self.tracks[track_id].missed > self.max_missed:
+                        del self.tracks[track_id]
+
+        return assigned
+
+    def cached_liveness(self, track_id, now=None):
+        """Liveness còn hiệu lực của track, None nếu cần chạy lại anti-spoof"""
+        now = time.time() if now is None else now
+        with self.lock:
+            track = self.tracks.get(track_id)
+            if track is None or track.liveness is None or now - track.liveness_at > self.liveness_ttl:
+                return None
+            self.stats["liveness_cached"] += 1
+            return track.liveness
+
+    def store_liveness(self, track_id, result, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.stats["liveness_run"] += 1
+            track = self.tracks.get(track_id)
+            # Kết quả kém tin cậy không cache → frame sau kiểm tra lại
+            if track is not None and result[1] >= self.min_liveness_score:
+                track.liveness, track.liveness_at = result, now
+
+    def cached_identity(self, track_id, version=None, now=None):
+        """
+        Identity còn hiệu lực của track, None nếu cần chạy lại recognition
+        version: phiên bản gallery hiện tại (vd. gallery.cache_key), khác lúc store → cache cũ
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            track = self.tracks.get(track_id)
+            if (track is None or track.identity is None or now - track.identity_at > self.identity_ttl
+                    or track.identity_version != version):
+                return None
+            self.stats["identity_cached"] += 1
+            return track.identity
+
+    def store_identity(self, track_id, result, threshold, version=None, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.stats["identity_run"] += 1
+            track = self.tracks.get(track_id)
+            # Chỉ cache khi đã nhận ra người và similarity đủ xa ngưỡng
+            if track is not None and result[0] is not None and result[2] >= threshold + self.identity_margin:
+                track.identity, track.identity_at, track.identity_version = result, now, version
+
+    def reset(self):
+        with self.lock:
+            self.tracks.clear()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Face gallery dạng binary, mở bằng np.memmap (read-only, share page cache giữa các process)
+
+Layout file (.fgal, little-endian):
+    [0:8]    magic b"FUACSGAL"
+    [8:40]   header: version, flags, n, dim (uint32) + table_len, data_offset (uint64)
+    [40:..]  bảng id/name dạng JSON utf-8: {"ids": [...], "names": [...], "counts": [...]}
+             counts: số embedding của từng người (row liền nhau), không có = mỗi người 1 row
+    padding  tới data_offset (align 64 byte)
+    [data_offset:]  block float32 (n, dim), C-order — giống phần data của file .npy; n = tổng số row
+
+Cách convert từ JSON:
+    python gallery_format.py face_database.json face_database.fgal
+"""
+
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from face_gallery import FaceGallery, l2_normalize, person_embeddings
+
+GALLERY_MAGIC = b"FUACSGAL"
+GALLERY_VERSION = 1
+GALLERY_EXT = ".fgal"
+FLAG_NORMALIZED = 1  # embedding đã L2-normalize lúc ghi
+
+_HEADER = struct.Struct("<IIIIQQ")
+_DATA_ALIGN = 64
+
+
+def write_gallery(path, ids, names, embeddings, normalize=True, counts=None):
+    """
+    Ghi gallery ra file binary (ghi file tạm rồi os.replace để reader không thấy file dở)
+    counts: số embedding của từng người (None = mỗi người 1 row)
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n_rows = len(ids) if counts is None else int(np.sum(counts))
+    if embeddings.ndim != 2 or embeddings.shape[0] != n_rows:
+        raise ValueError(f"embeddings phải có shape (R, D), R = {n_rows}; nhận {embeddings.shape}")
+    if normalize:
+        embeddings = l2_normalize(embeddings)
+    embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+
+    table = {"ids": list(ids), "names": list(names)}
+    if counts is not None and any(int(c) != 1 for c in counts):
+        table["counts"] = [int(c) for c in counts]  # bỏ qua khi mỗi người 1 row → file giống hệt bản cũ
+    table = json.dumps(table, ensure_ascii=False).encode("utf-8")
+    table_end = len(GALLERY_MAGIC) + _HEADER.size + len(table)
+    data_offset = (table_end + _DATA_ALIGN - 1) // _DATA_ALIGN * _DATA_ALIGN
+    n, dim = embeddings.shape
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(GALLERY_MAGIC)
+        f.write(_HEADER.pack(GALLERY_VERSION, FLAG_NORMALIZED if normalize else 0,
+                             n, dim, len(table), data_offset))
+        f.write(table)
+        f.write(b"\0" * (data_offset - table_end))
+        f.write(embeddings.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    """Đọc header + bảng id/name, không đọc block embedding"""
+    with open(path, "rb") as f:
+        if f.read(len(GALLERY_MAGIC)) != GALLERY_MAGIC:
+            raise ValueError(f"Không phải file gallery: {path}")
+        version, flags, n, dim, table_len, data_offset = _HEADER.unpack(f.read(_HEADER.size))
+        if version != GALLERY_VERSION:
+            raise ValueError(f"Gallery version không hỗ trợ: {version}")
+        table = json.loads(f.read(table_len).decode("utf-8"))
+    return {
+        "n": n, "dim": dim, "data_offset": data_offset,
+        "normalized": bool(flags & FLAG_NORMALIZED),
+        "ids": table["ids"], "names": table["names"], "counts": table.get("counts"),
+    }
+
+
+def open_gallery(path):
+    """
+    Mở gallery, embedding là np.memmap read-only (không copy vào RAM của process)
+    Returns: (ids, names, embeddings (R, D), normalized, counts) — counts None = mỗi người 1 row
+    """
+    header = read_header(path)
+    if header["n"] == 0:
+        embeddings = np.zeros((0, header["dim"]), dtype=np.float32)
+    else:
+        embeddings = np.memmap(path, dtype="<f4", mode="r", offset=header["data_offset"],
+                               shape=(header["n"], header["dim"]))
+    return header["ids"], header["names"], embeddings, header["normalized"], header["counts"]
+
+
+def load_gallery_persons(path):
+    """Drop-in cho load_face_database: list persons, 'embedding' / 'embeddings' là view vào memmap"""
+    ids, names, embeddings, _, counts = open_gallery(path)
+    offsets = np.concatenate([[0], np.cumsum(counts if counts is not None else np.ones(len(ids), dtype=int))])
+    return [{"id": pid, "name": name, "embedding": embeddings[offsets[i]],
+             "embeddings": embeddings[offsets[i]:offsets[i + 1]]}
+            for i, (pid, name) in enumerate(zip(ids, names))]
+
+
+def load_gallery(path, **kwargs):
+    """Tạo FaceGallery từ file binary; file đã normalize thì matrix chính là memmap"""
+    ids, names, embeddings, normalized, counts = open_gallery(path)
+    return FaceGallery(ids, names, embeddings, normalized=normalized, counts=counts, **kwargs)
+
+
+def convert_json(json_path, out_path):
+    """Convert face_database.json ('embedding' hoặc 'embeddings' là list float) sang file binary"""
+    with open(json_path, "r", encoding="utf-8") as f:
+        persons = json.load(f).get("persons", [])
+    embeddings = [person_embeddings(p) for p in persons]
+    dim = embeddings[0].shape[1] if persons else 0
+    write_gallery(out_path, [p["id"] for p in persons], [p["name"] for p in persons],
+                  np.concatenate(embeddings) if persons else np.zeros((0, dim), dtype=np.float32),
+                  counts=[len(e) for e in embeddings])
+    return len(persons)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Cách dùng: python gallery_format.py <face_database.json> <output.fgal>")
+        sys.exit(1)
+    count = convert_json(sys.argv[1], sys.argv[2])
+    print(f"✅ Đã convert {count} persons → {sys.argv[2]}")
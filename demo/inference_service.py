@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+Inference service asyncio: nhiều camera client dùng chung 1 bộ model đã load
+- HTTP/1.1 tối giản trên asyncio.start_server (không cần thư viện ngoài), keep-alive
+- POST /v1/frame: body JPEG frame → detect, frontal, anti-spoof, nhận diện → JSON từng mặt
+- POST /v1/crop:  body JPEG mặt đã align (norm_crop, 112x112) → embedding + nhận diện
+  Query: ?class=SE01 chỉ match trong roster lớp (csv/09_enrollments.csv), ?embedding=1 trả kèm embedding
+- GET /v1/health, GET /v1/stats, GET /metrics (text Prometheus, metrics.REGISTRY)
+- Micro-batching: request đến trong cửa sổ max_wait (hoặc đủ max_batch) được gom lại,
+  model chạy 1 lần cho cả batch trên 1 thread inference duy nhất
+
+Cách chạy:
+    python inference_service.py --port 8765
+    python inference_service.py --client snapshots/ --port 8765 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from face_recognition_demo import (
+    ANTISPOOF_AVAILABLE, ANTISPOOF_LOG_EVERY, ANN_INDEX_PATH, ANN_MIN_GALLERY_SIZE, ANN_N_PROBE, DET_SIZE,
+    ENROLLMENTS_CSV_PATH, FACE_DATABASE_PATH, INSIGHTFACE_AVAILABLE, RECOGNITION_THRESHOLD, AntiSpoofEngine,
+    is_frontal_face, load_face_model, load_gallery_with_log,
+)
+from ann_index import load_or_build_ivf
+from roster_cache import SubGalleryCache, load_class_rosters
+from startup import format_timings, load_parallel
+from metrics import CONTENT_TYPE, REGISTRY, enable_log
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+ROUTES = ("/v1/frame", "/v1/crop", "/v1/health", "/v1/stats", "/metrics")
+REQUESTS = REGISTRY.counter("fuacs_service_requests_total", "Số request theo endpoint + status", ("path", "status"))
+REQUEST_SECONDS = REGISTRY.histogram("fuacs_service_request_seconds", "Latency xử lý request (sau khi đọc body)",
+                                     ("path",))
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class MicroBatcher:
+    """
+    Gom các item submit() đồng thời thành batch rồi gọi process_fn(items) → list kết quả cùng thứ tự
+    Batch đóng khi đủ max_batch item hoặc sau max_wait giây kể từ item đầu tiên
+    """
+
+    def __init__(self, process_fn, executor, max_batch=8, max_wait=0.01):
+        self.process_fn = process_fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = None
+        self.task = None
+        self.stats = {"batches": 0, "items": 0, "max_batch_seen": 0}
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.process_fn, [item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+def identity_to_json(identity):
+    if identity is None:
+        return None
+    person_id, name, similarity = identity
+    return {"person_id": person_id, "name": name, "similarity": round(float(similarity), 4)}
+
+
+def face_to_json(face, with_embedding=False):
+    """Face dict nội bộ → dict JSON-serializable"""
+    result = {
+        "bbox": [int(v) for v in face["bbox"]],
+        "det_score": round(float(face["det_score"]), 4),
+        "frontal": bool(face["frontal"]),
+        "yaw": round(float(face["yaw"]), 4),
+        "liveness": None,
+        "identity": identity_to_json(face["identity"]),
+    }
+    if face["liveness"] is not None:
+        is_real, score, label = face["liveness"]
+        result["liveness"] = {"is_real": bool(is_real), "score": round(float(score), 4), "label": label}
+    if with_embedding and face.get("embedding") is not None:
+        result["embedding"] = [round(float(v), 6) for v in face["embedding"]]
+    return result
+
+
+class InferenceService:
+    """
+    Logic detect/liveness/nhận diện headless của demo, gom batch qua MicroBatcher
+    face_model: FaceAnalysis đã prepare; anti_spoof: AntiSpoofEngine đã load (None = bỏ qua)
+    gallery: FaceGallery; class_rosters: {class_code: [person_id]} cho ?class=
+    """
+
+    def __init__(self, face_model, anti_spoof=None, gallery=None, threshold=RECOGNITION_THRESHOLD,
+                 class_rosters=None, max_batch=8, max_wait=0.01):
+        self.face_model = face_model
+        self.anti_spoof = anti_spoof
+        self.gallery = gallery
+        self.threshold = threshold
+        self.class_rosters = class_rosters or {}
+        self.roster_cache = SubGalleryCache(gallery) if gallery is not None else None
+        # 1 thread inference: model không bị gọi song song, batch nối tiếp nhau
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.frame_batcher = MicroBatcher(self.process_frames, self.executor, max_batch, max_wait)
+        self.crop_batcher = MicroBatcher(self.process_crops, self.executor, max_batch * 4, max_wait)
+        self.requests = 0
+        self.started_at = time.time()
+
+    # ============================================
+    # INFERENCE (chạy trong thread inference)
+    # ============================================
+    def _gallery_for(self, class_code):
+        if class_code is None or self.roster_cache is None:
+            return self.gallery
+        return self.roster_cache.get(class_code, self.class_rosters.get(class_code, []))
+
+    def _match(self, faces, class_codes):
+        """Nhận diện theo nhóm class_code: mỗi nhóm 1 lần match_batch"""
+        groups = {}
+        for face, class_code in zip(faces, class_codes):
+            groups.setdefault(class_code, []).append(face)
+        for class_code, group in groups.items():
+            gallery = self._gallery_for(class_code)
+            if not gallery:
+                for face in group:
+                    face["identity"] = (None, "No DB", 0.0)
+                continue
+            matches = gallery.match_batch(np.stack([face["embedding"] for face in group]), self.threshold)
+            for face, identity in zip(group, matches):
+                face["identity"] = identity
+
+    def process_frames(self, items):
+        """items: list (frame BGR, class_code) → list (list face dict) theo từng frame"""
+        from insightface.utils import face_align
+
+        rec_model = self.face_model.models['recognition']
+        per_frame, to_embed = [], []
+        for frame, class_code in items:
+            bboxes, kpss = self.face_model.det_model.detect(frame, max_num=0, metric='default')
+            faces = []
+            for i in range(bboxes.shape[0]):
+                kps = kpss[i] if kpss is not None else None
+                frontal, yaw = is_frontal_face(kps, threshold=0.25) if kps is not None else (True, 0.0)
+                faces.append({"bbox": bboxes[i, :4], "det_score": bboxes[i, 4], "kps": kps, "frontal": frontal,
+                              "yaw": yaw, "liveness": None, "identity": None, "embedding": None})
+
+            frontal_faces = [face for face in faces if face["frontal"]]
+            if self.anti_spoof is not None and self.anti_spoof.available and frontal_faces:
+                results = self.anti_spoof.check_batch(frame, [face["bbox"] for face in frontal_faces])
+                for face, result in zip(frontal_faces, results):
+                    face["liveness"] = result
+
+            for face in frontal_faces:
+                if face["kps"] is not None and (face["liveness"] is None or face["liveness"][0]):
+                    to_embed.append((frame, face, class_code))
+            per_frame.append(faces)
+
+        # Embedding cho mọi mặt của mọi frame trong batch: 1 lần get_feat
+        if to_embed and self.gallery is not None:
+            crops = [face_align.norm_crop(frame, landmark=face["kps"], image_size=rec_model.input_size[0])
+                     for frame, face, _ in to_embed]
+            for (_, face, _), embedding in zip(to_embed, rec_model.get_feat(crops)):
+                face["embedding"] = embedding
+            self._match([face for _, face, _ in to_embed], [class_code for _, _, class_code in to_embed])
+        return per_frame
+
+    def process_crops(self, items):
+        """items: list (crop BGR đã align, class_code) → list face dict (chỉ embedding + identity)"""
+        rec_model = self.face_model.models['recognition']
+        size = tuple(rec_model.input_size)
+        crops = [crop if crop.shape[1::-1] == size else cv2.resize(crop, size) for crop, _ in items]
+        faces = [{"embedding": embedding, "identity": None} for embedding in rec_model.get_feat(crops)]
+        if self.gallery is not None:
+            self._match(faces, [class_code for _, class_code in items])
+        return faces
+
+    # ============================================
+    # HTTP
+    # ============================================
+    async def start(self, host="127.0.0.1", port=8765):
+        self.frame_batcher.start()
+        self.crop_batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.frame_batcher.stop()
+        await self.crop_batcher.stop()
+        self.executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {"error": "body quá lớn"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                path = urlsplit(target).path
+                path = path if path in ROUTES else "other"  # giới hạn số giá trị label
+                start = time.perf_counter()
+                status, payload = await self._route(method, target, body)
+                REQUEST_SECONDS.labels(path).observe(time.perf_counter() - start)
+                REQUESTS.labels(path, status).inc()
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        """payload dict → JSON, str → text (metrics Prometheus)"""
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), CONTENT_TYPE
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _route(self, method, target, body):
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        class_code = query.get("class")
+        with_embedding = query.get("embedding") == "1"
+
+        if url.path == "/v1/health":
+            return 200, {"status": "ok", "face_model": self.face_model is not None,
+                         "anti_spoof": bool(self.anti_spoof and self.anti_spoof.available),
+                         "gallery": len(self.gallery) if self.gallery is not None else 0}
+        if url.path == "/v1/stats":
+            return 200, {"requests": self.requests, "uptime_s": round(time.time() - self.started_at, 1),
+                         "frame_batcher": self.frame_batcher.stats, "crop_batcher": self.crop_batcher.stats}
+        if url.path == "/metrics":
+            return 200, REGISTRY.render()
+        if url.path not in ("/v1/frame", "/v1/crop"):
+            return 404, {"error": f"không có endpoint {url.path}"}
+        if method != "POST":
+            return 405, {"error": "chỉ hỗ trợ POST"}
+        if self.face_model is None:
+            return 503, {"error": "chưa load face model"}
+
+        # Decode JPEG ngoài event loop (thread mặc định), không chặn client khác
+        image = await asyncio.get_running_loop().run_in_executor(
+            None, cv2.imdecode, np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return 400, {"error": "body không phải ảnh JPEG/PNG hợp lệ"}
+
+        start = time.perf_counter()
+        try:
+            if url.path == "/v1/frame":
+                faces = await self.frame_batcher.submit((image, class_code))
+                payload = {"faces": [face_to_json(face, with_embedding) for face in faces]}
+            else:
+                face = await self.crop_batcher.submit((image, class_code))
+                payload = {"identity": identity_to_json(face["identity"])}
+                if with_embedding:
+                    payload["embedding"] = [round(float(v), 6) for v in face["embedding"]]
+        except Exception as e:
+            return 500, {"error": str(e)}
+        payload["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return 200, payload
+
+
+# ============================================
+# CLIENT
+# ============================================
+class ServiceClient:
+    """Client HTTP/1.1 keep-alive tối giản cho InferenceService (asyncio, không cần thư viện ngoài)"""
+
+    def __init__(self, host="127.0.0.1", port=8765):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b""):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: image/jpeg\r\nContent-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode("latin-1") + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            if key.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def post_frame(self, jpeg, class_code=None):
+        return await self.request("POST", "/v1/frame" + (f"?class={class_code}" if class_code else ""), jpeg)
+
+    async def post_crop(self, jpeg, class_code=None, embedding=False):
+        query = "&".join(q for q in (f"class={class_code}" if class_code else "", "embedding=1" if embedding else "") if q)
+        return await self.request("POST", "/v1/crop" + (f"?{query}" if query else ""), jpeg)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def run_client(source, host, port, concurrency, max_frames):
+    """Gửi frame từ video/thư mục ảnh bằng `concurrency` kết nối song song, in latency + throughput"""
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+    from frame_source import iter_frames
+
+    jpegs = [cv2.imencode(".jpg", frame)[1].tobytes() for frame in iter_frames(source, max_frames)]
+    if not jpegs:
+        print(f"❌ Không đọc được frame nào từ {source}")
+        return
+    latencies, faces = [], 0
+
+    async def worker(offset):
+        nonlocal faces
+        client = ServiceClient(host, port)
+        try:
+            for jpeg in jpegs[offset::concurrency]:
+                start = time.perf_counter()
+                status, payload = await client.post_frame(jpeg)
+                latencies.append(time.perf_counter() - start)
+                if status == 200:
+                    faces += len(payload["faces"])
+                else:
+                    print(f"⚠️ {status}: {payload.get('error')}")
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    print(f"Frames: {len(latencies)}, mặt: {faces}, {len(latencies) / elapsed:.1f} frame/s, "
+          f"p50={np.percentile(latencies, 50) * 1000:.1f} ms, p99={np.percentile(latencies, 99) * 1000:.1f} ms")
+    status, stats = await ServiceClient(host, port).request("GET", "/v1/stats")
+    print(f"Server: {stats}")
+
+
+def load_service(max_batch, max_wait, det_size, num_threads=None, watch=True):
+    """
+    Load model song song giống App.init_models, trả về InferenceService
+    num_threads: intra-op thread của session ONNX Runtime (None = mặc định ORT, theo số core)
+    watch: False = không chạy thread theo dõi log enroll (vd. worker của process_pool, process cha báo thay đổi
+           và worker gọi service.enrollment_watcher.poll())
+    """
+    anti_spoof = AntiSpoofEngine(device_id=0) if ANTISPOOF_AVAILABLE else None
+    watchers = []
+
+    def load_gallery():
+        gallery, watcher = load_gallery_with_log(FACE_DATABASE_PATH)
+        if len(gallery) >= ANN_MIN_GALLERY_SIZE:
+            load_or_build_ivf(gallery, ANN_INDEX_PATH, n_probe=ANN_N_PROBE)
+        if watch:
+            watcher.start()  # enroll mới áp thẳng vào gallery đang phục vụ
+        watchers.append(watcher)
+        return gallery
+
+    tasks = {"gallery": load_gallery}
+    if INSIGHTFACE_AVAILABLE:
+        tasks["face"] = lambda: load_face_model(det_size, allowed_modules=['detection', 'recognition'],
+                                                num_threads=num_threads)
+    if anti_spoof is not None:
+        tasks["antispoof"] = anti_spoof.load
+    results, timings, _ = load_parallel(tasks)
+    print(f"⏱️ Khởi động: {format_timings(timings)}")
+
+    rosters = load_class_rosters(ENROLLMENTS_CSV_PATH) if os.path.exists(ENROLLMENTS_CSV_PATH) else {}
+    service = InferenceService(results.get("face"), anti_spoof, results["gallery"], class_rosters=rosters,
+                               max_batch=max_batch, max_wait=max_wait)
+    service.enrollment_watcher = watchers[0] if watchers else None
+    return service
+
+
+async def serve(args):
+    service = load_service(args.max_batch, args.max_wait, (args.det_size, args.det_size))
+    await service.start(args.host, args.port)
+    print(f"✅ Inference service: http://{args.host}:{args.port} (batch ≤ {args.max_batch}, "
+          f"chờ ≤ {args.max_wait * 1000:.0f} ms)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference service (detect + anti-spoof + nhận diện) qua HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait", type=float, default=0.01, help="Cửa sổ gom batch (s)")
+    parser.add_argument("--det-size", type=int, default=DET_SIZE[0])
+    parser.add_argument("--client", default=None, help="Chạy client: gửi frame từ video/thư mục ảnh")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-frames", type=int, default=200)
+    args = parser.parse_args()
+
+    try:
+        if args.client:
+            asyncio.run(run_client(args.client, args.host, args.port, args.concurrency, args.max_frames))
+        else:
+            asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    if ANTISPOOF_LOG_EVERY:
+        enable_log("anti_spoof")
+    main()
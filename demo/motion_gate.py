@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Motion gate: lọc rẻ tiền trước face detection
+- So sánh frame hiện tại (thu nhỏ, grayscale, blur) với frame của lần detect gần nhất
+- Tỉ lệ pixel thay đổi dưới ngưỡng → lớp học đứng yên, bỏ qua detection và dùng lại kết quả cũ
+- Sau max_skip frame liên tiếp bị bỏ qua vẫn detect lại 1 lần (chống trôi do ánh sáng thay đổi chậm)
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    pixel_threshold: chênh lệch mức xám (0-255) để coi 1 pixel là thay đổi
+    min_changed_ratio: tỉ lệ pixel thay đổi tối thiểu để chạy detection (nhỏ hơn = nhạy hơn)
+    """
+
+    def __init__(self, pixel_threshold=15, min_changed_ratio=0.002, downscale_width=160, max_skip=30):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio
+        self.downscale_width = downscale_width
+        self.max_skip = max_skip
+        self.reference = None
+        self.skipped_in_row = 0
+        self.stats = {"frames": 0, "skipped": 0, "last_changed_ratio": 0.0}
+
+    def _preprocess(self, frame):
+        h, w = frame.shape[:2]
+        size = (self.downscale_width, max(1, int(h * self.downscale_width / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def should_detect(self, frame):
+        """True nếu cần chạy detection cho frame này"""
+        self.stats["frames"] += 1
+        small = self._preprocess(frame)
+
+        if self.reference is not None and self.reference.shape == small.shape:
+            diff = cv2.absdiff(small, self.reference)
+            changed = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+            self.stats["last_changed_ratio"] = changed
+            if changed < self.min_changed_ratio and self.skipped_in_row < self.max_skip:
+                self.skipped_in_row += 1
+                self.stats["skipped"] += 1
+                return False
+
+        self.reference = small
+        self.skipped_in_row = 0
+        return True
+
+    def reset(self):
+        """Bắt buộc detect ở frame kế tiếp (vd. khi vừa bật lại detection)"""
+        self.reference = None
+
+    def skip_ratio(self):
+        return self.stats["skipped"] / self.stats["frames"] if self.stats["frames"] else 0.0
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Face detection đa tỉ lệ thay cho DET_SIZE cố định (1920, 1920)
+- Coarse pass: detect toàn frame ở input size nhỏ, chọn tự động theo kích thước mặt quan sát được
+- Fine pass: cắt vùng quanh mặt (ROI, đã gộp các vùng chồng nhau) và detect lại ở độ phân giải gốc
+  → bbox/keypoints chính xác như detect full-size nhưng chỉ tốn chi phí trên vùng nhỏ
+- Định kỳ chạy 1 lần full-size để bắt mặt quá nhỏ mà coarse pass bỏ sót: mặt mới xuất hiện nhỏ hơn
+  min_face_px ở coarse size chỉ được phát hiện sau tối đa full_refresh_interval frame
+Dùng det_model (RetinaFace) của FaceAnalysis: det_model.detect(img, input_size=(w, h))
+"""
+
+import numpy as np
+
+
+def _round_up(value, multiple=32):
+    return int((value + multiple - 1) // multiple * multiple)
+
+
+def _merge_rois(rois):
+    """Gộp các ROI (x1, y1, x2, y2) chồng nhau cho tới khi không còn cặp nào giao nhau"""
+    rois = [list(r) for r in rois]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rois)):
+            for j in range(i + 1, len(rois)):
+                a, b = rois[i], rois[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rois[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rois[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rois
+
+
+def _nms(bboxes, kpss, iou_threshold=0.4):
+    """NMS đơn giản để bỏ mặt bị detect trùng ở 2 ROI"""
+    if len(bboxes) == 0:
+        return bboxes, kpss
+    x1, y1, x2, y2, scores = bboxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores)
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[order[1:]] - inter + 1e-6)
+        order = order[1:][iou < iou_threshold]
+    keep = np.array(keep)
+    return bboxes[keep], (kpss[keep] if kpss is not None else None)
+
+
+class MultiScaleDetector:
+    """
+    coarse_sizes: các input size cho coarse pass (chọn size nhỏ nhất đủ thấy mặt nhỏ nhất)
+    full_size: input size của lần detect full định kỳ (= DET_SIZE cũ)
+    min_face_px: chiều cao mặt tối thiểu (pixel trên ảnh input) để detector bắt ổn định
+    roi_margin: nới rộng bbox coarse theo tỉ lệ cạnh trước khi detect lại
+    full_refresh_interval: số frame giữa 2 lần detect full-size
+    """
+
+    def __init__(self, det_model, coarse_sizes=(320, 480, 640, 960, 1280), full_size=(1920, 1920),
+                 min_face_px=20, roi_margin=0.5, max_roi_size=640, full_refresh_interval=30, ema=0.3):
+        self.det_model = det_model
+        self.coarse_sizes = sorted(coarse_sizes)
+        self.full_size = full_size
+        self.min_face_px = min_face_px
+        self.roi_margin = roi_margin
+        self.max_roi_size = max_roi_size
+        self.full_refresh_interval = full_refresh_interval
+        self.ema = ema
+        self.min_face_height = None  # EMA chiều cao mặt nhỏ nhất (pixel frame gốc)
+        self.frame_count = 0
+        self.stats = {"full": 0, "coarse": 0, "rois": 0, "last_coarse_size": None}
+
+    def choose_coarse_size(self, frame_shape):
+        """Input size nhỏ nhất mà mặt nhỏ nhất quan sát được vẫn cao >= min_face_px sau khi thu nhỏ"""
+        if self.min_face_height is None:
+            return None
+        max_dim = max(frame_shape[:2])
+        for size in self.coarse_sizes:
+            if self.min_face_height * size / max_dim >= self.min_face_px:
+                return size
+        return None  # mặt quá nhỏ cho mọi coarse size → detect full
+
+    def detect(self, frame):
+        """Returns: (bboxes (N, 5) [x1, y1, x2, y2, score], kpss (N, 5, 2) hoặc None) như det_model.detect"""
+        self.frame_count += 1
+        size = self.choose_coarse_size(frame.shape)
+
+        if size is None or self.frame_count % self.full_refresh_interval == 0:
+            self.stats["full"] += 1
+            bboxes, kpss = self.det_model.detect(frame, input_size=self.full_size, max_num=0, metric='default')
+        else:
+            self.stats["coarse"] += 1
+            self.stats["last_coarse_size"] = size
+            coarse, _ = self.det_model.detect(frame, input_size=(size, size), max_num=0, metric='default')
+            bboxes, kpss = self._refine(frame, coarse)
+
+        self._observe(bboxes)
+        return bboxes, kpss
+
+    def _refine(self, frame, coarse):
+        """Detect lại trong ROI quanh mỗi mặt coarse ở độ phân giải gốc"""
+        h, w = frame.shape[:2]
+        rois = []
+        for x1, y1, x2, y2, _ in coarse:
+            mx, my = (x2 - x1) * self.roi_margin, (y2 - y1) * self.roi_margin
+            rois.append([max(0, int(x1 - mx)), max(0, int(y1 - my)),
+                         min(w, int(x2 + mx)), min(h, int(y2 + my))])
+
+        all_bboxes, all_kpss = [], []
+        for x1, y1, x2, y2 in _merge_rois(rois):
+            crop = frame[y1:y2, x1:x2]
+            if crop.size == 0:
+                continue
+            self.stats["rois"] += 1
+            input_size = min(_round_up(max(x2 - x1, y2 - y1)), self.max_roi_size)
+            bboxes, kpss = self.det_model.detect(crop, input_size=(input_size, input_size),
+                                                 max_num=0, metric='default')
+            if len(bboxes) == 0:
+                continue
+            bboxes = bboxes.copy()
+            bboxes[:, [0, 2]] += x1
+            bboxes[:, [1, 3]] += y1
+            all_bboxes.append(bboxes)
+            if kpss is not None:
+                all_kpss.append(kpss + np.array([x1, y1], dtype=kpss.dtype))
+
+        if not all_bboxes:
+            return np.zeros((0, 5), dtype=np.float32), None
+        return _nms(np.concatenate(all_bboxes), np.concatenate(all_kpss) if all_kpss else None)
+
+    def _observe(self, bboxes):
+        """Cập nhật EMA chiều cao mặt nhỏ nhất để chọn coarse size cho frame sau"""
+        if len(bboxes) == 0:
+            return
+        smallest = float(np.min(bboxes[:, 3] - bboxes[:, 1]))
+        if self.min_face_height is None:
+            self.min_face_height = smallest
+        else:
+            self.min_face_height = (1 - self.ema) * self.min_face_height + self.ema * smallest
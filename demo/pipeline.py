@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline nhận diện nhiều stage, chạy headless (không phụ thuộc Tkinter)
+    capture → detect → liveness → recognize → annotate → output
+- Mỗi stage 1 worker thread, giữa các stage là queue bounded kiểu drop-oldest:
+  stage sau chậm thì frame cũ bị bỏ, pipeline luôn xử lý frame mới nhất
+- Đo thời gian từng stage (ms trung bình + số frame đã xử lý, số frame bị drop), đồng thời ghi vào
+  histogram metrics.REGISTRY theo session + stage (xem /metrics)
+- GUI chỉ lấy kết quả đã annotate qua latest(): packet["display"] (BGR) hoặc
+  packet["rgb"] đã resize nếu có render_size
+"""
+
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+
+COLOR_TURN = (0, 255, 255)      # Yellow - mặt nghiêng
+COLOR_FAKE = (0, 0, 255)        # Red - FAKE
+COLOR_KNOWN = (0, 255, 0)       # Green - recognized / chỉ detect
+COLOR_UNKNOWN = (0, 165, 255)   # Orange - unknown
+
+STAGE_SECONDS = REGISTRY.histogram("fuacs_pipeline_stage_seconds", "Thời gian xử lý 1 frame của mỗi stage",
+                                   ("session", "stage"))
+STAGE_DROPPED = REGISTRY.gauge("fuacs_pipeline_dropped_frames", "Số frame bị bỏ ở queue vào của stage",
+                               ("session", "stage"))
+MATCH_SECONDS = REGISTRY.histogram("fuacs_match_seconds", "Thời gian so khớp embedding với gallery (1 batch)",
+                                   ("session",))
+FACES_TOTAL = REGISTRY.counter("fuacs_pipeline_faces_total", "Số mặt detect được", ("session",))
+
+
+class DropOldestQueue:
+    """
+    Queue bounded: put() khi đầy sẽ bỏ phần tử cũ nhất thay vì block producer
+    on_drop(item): gọi với phần tử bị bỏ (vd. trả lease frame cho stream)
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        self.items = deque(maxlen=maxsize)
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.on_drop = on_drop
+
+    def put(self, item):
+        dropped = None
+        with self.cond:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+                dropped = self.items[0]
+            self.items.append(item)
+            self.cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Lấy phần tử cũ nhất, None nếu hết timeout"""
+        with self.cond:
+            if not self.items and not self.cond.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StageTimer:
+    """Thống kê thời gian xử lý của 1 stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "last_ms": self.last * 1000,
+        }
+
+
+def draw_face(display_frame, face_result):
+    """Vẽ bbox, label và keypoints của 1 mặt lên frame (in-place)"""
+    bbox = face_result["bbox"]
+    color = face_result["color"]
+    cv2.rectangle(display_frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 2)
+    cv2.putText(display_frame, face_result["label"], (bbox[0], bbox[1] - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    if face_result["kps"] is not None:
+        for kp in face_result["kps"].astype(int):
+            cv2.circle(display_frame, (kp[0], kp[1]), 2, (255, 0, 0), -1)
+
+
+class RecognitionPipeline:
+    """
+    Pipeline capture → detect → liveness → recognize → annotate.
+    stream: nguồn frame có read_new(last_seq) → (seq, frame BGR | None, lease) và release(lease),
+            vd. RTSPVideoStream; lease được trả khi annotate xong hoặc packet bị drop
+    face_model / anti_spoof / gallery: gán sau khi load model xong, None = bỏ qua stage tương ứng
+    """
+
+    STAGES = ("capture", "detect", "liveness", "recognize", "annotate")
+
+    def __init__(self, stream, threshold, frontal_fn, queue_size=1, capture_interval=0.005):
+        self.stream = stream
+        self.threshold = threshold
+        self.frontal_fn = frontal_fn
+        self.capture_interval = capture_interval
+
+        self.face_model = None
+        self.anti_spoof = None
+        self.gallery = None
+
+        # Bật/tắt từng bước (GUI đồng bộ từ main thread)
+        self.detect_enabled = False
+        self.liveness_enabled = False
+        self.recognize_enabled = False
+
+        # Motion gate tuỳ chọn (motion_gate.MotionGate): bỏ qua detection khi frame không đổi
+        self.motion_gate = None
+        self.last_detections = None
+        # Detector đa tỉ lệ tuỳ chọn (multiscale_detect.MultiScaleDetector), None = face_model.get
+        self.detector = None
+        # Face tracker tuỳ chọn (face_tracker.FaceTracker): cache liveness/identity theo track
+        self.tracker = None
+        # Scheduler embedding dùng chung nhiều pipeline (embedding_scheduler.EmbeddingScheduler),
+        # None = gọi thẳng get_feat; session_id để phân biệt pipeline trong metrics
+        self.embedder = None
+        self.session_id = "default"
+
+        # (w, h) vùng hiển thị do GUI cập nhật: annotate stage convert RGB + resize luôn,
+        # main thread chỉ còn tạo PhotoImage
+        self.render_size = None
+
+        self.queues = {name: DropOldestQueue(queue_size, on_drop=self._release_frame) for name in self.STAGES[1:]}
+        self.output = DropOldestQueue(1)
+        self.timers = {name: StageTimer() for name in self.STAGES}
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.bind_metrics()
+
+    def bind_metrics(self):
+        """Lấy metric con theo session_id 1 lần (gọi lại nếu đổi session_id sau __init__)"""
+        self.stage_metrics = {name: STAGE_SECONDS.labels(self.session_id, name) for name in self.STAGES}
+        self.match_seconds = MATCH_SECONDS.labels(self.session_id)
+        self.faces_total = FACES_TOTAL.labels(self.session_id)
+        for name, q in self.queues.items():
+            STAGE_DROPPED.labels(self.session_id, name).set_function(lambda q=q: q.dropped)
+
+    def start(self):
+        self.bind_metrics()
+        self.threads = [threading.Thread(target=self._run_capture, daemon=True)]
+        handlers = [self._detect, self._liveness, self._recognize, self._annotate]
+        outputs = [self.queues[name] for name in self.STAGES[2:]] + [self.output]
+        for name, handler, out_q in zip(self.STAGES[1:], handlers, outputs):
+            self.threads.append(threading.Thread(
+                target=self._run_stage, args=(name, handler, self.queues[name], out_q), daemon=True))
+        for t in self.threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def latest(self, timeout=0):
+        """Kết quả mới nhất đã annotate (dict packet) hoặc None nếu chưa có kết quả mới"""
+        return self.output.get(timeout=timeout)
+
+    def stats(self):
+        """Thời gian từng stage + số frame bị drop ở queue vào của stage"""
+        result = {name: timer.snapshot() for name, timer in self.timers.items()}
+        for name, q in self.queues.items():
+            result[name]["dropped"] = q.dropped
+        if self.motion_gate is not None:
+            result["detect"]["skipped"] = self.motion_gate.stats["skipped"]
+            result["detect"]["skip_ratio"] = self.motion_gate.skip_ratio()
+        if self.detector is not None:
+            result["detect"].update(self.detector.stats)
+        if self.anti_spoof is not None and self.anti_spoof.cascade:
+            result["liveness"]["early_exit_ratio"] = self.anti_spoof.early_exit_ratio()
+        if self.embedder is not None:
+            result["embedder"] = self.embedder.stats()
+        if self.tracker is not None:
+            result["tracker"] = dict(self.tracker.stats, tracks=len(self.tracker.tracks))
+        return result
+
+    # ============================================
+    # WORKERS
+    # ============================================
+    def _run_capture(self):
+        last_seq = 0
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            seq, frame, lease = self.stream.read_new(last_seq)
+            if frame is not None:
+                # Chỉ đẩy frame mới, frame trùng không xử lý lại
+                last_seq = seq
+                self.queues["detect"].put({"seq": seq, "frame": frame, "lease": lease, "faces": [],
+                                           "captured_at": time.time()})
+                elapsed = time.perf_counter() - start
+                self.timers["capture"].add(elapsed)
+                self.stage_metrics["capture"].observe(elapsed)
+            time.sleep(self.capture_interval)
+
+    def _run_stage(self, name, handler, in_q, out_q):
+        while not self.stop_event.is_set():
+            packet = in_q.get(timeout=0.1)
+            if packet is None:
+                continue
+            start = time.perf_counter()
+            try:
+                handler(packet)
+            except Exception as e:
+                print(f"Error [{name}]: {e}")
+                packet["faces"] = []
+            finally:
+                if out_q is self.output:
+                    self._release_frame(packet)  # stage cuối: frame gốc không còn dùng nữa
+            elapsed = time.perf_counter() - start
+            self.timers[name].add(elapsed)
+            self.stage_metrics[name].observe(elapsed)
+            out_q.put(packet)
+
+    def _release_frame(self, packet):
+        """Trả lease frame của packet cho stream (1 lần), frame gốc không được dùng sau đó"""
+        lease = packet.pop("lease", None)
+        packet["frame"] = None
+        if lease is not None and self.stream is not None:
+            self.stream.release(lease)
+
+    # ============================================
+    # STAGES
+    # ============================================
+    def _detect(self, packet):
+        face_model = self.face_model
+        if not self.detect_enabled or face_model is None:
+            self.last_detections = None
+            if self.tracker is not None:
+                self.tracker.reset()
+            return
+
+        # Scene đứng yên → dùng lại detections của lần detect trước
+        gate = self.motion_gate
+        if gate is not None:
+            if self.last_detections is None:
+                gate.reset()
+            if not gate.should_detect(packet["frame"]):
+                packet["reused_detections"] = True
+                packet["faces"] = [dict(face) for face in self.last_detections]
+                self._assign_tracks(packet)
+                return
+
+        if self.detector is not None or self.tracker is not None:
+            # Chỉ detect, embedding tính sau (recognize stage) cho mặt cần nhận diện
+            if self.detector is not None:
+                bboxes, kpss = self.detector.detect(packet["frame"])
+            else:
+                bboxes, kpss = face_model.det_model.detect(packet["frame"], max_num=0, metric='default')
+            raw = [(bboxes[i, :4], kpss[i] if kpss is not None else None, bboxes[i, 4], None)
+                   for i in range(bboxes.shape[0])]
+        else:
+            raw = [(face.bbox, face.kps, face.det_score, face.embedding)
+                   for face in face_model.get(packet["frame"])]
+
+        detections = [{
+            "bbox": bbox.astype(int), "raw_bbox": bbox, "kps": kps,
+            "det_score": float(det_score), "embedding": embedding,
+            "frontal": True, "yaw": 0.0, "liveness": None, "identity": None, "track_id": None,
+        } for bbox, kps, det_score, embedding in raw]
+        self.last_detections = detections
+        packet["faces"] = [dict(face) for face in detections]
+        self.faces_total.inc(len(detections))
+        self._assign_tracks(packet)
+
+    def _assign_tracks(self, packet):
+        if self.tracker is None:
+            return
+        track_ids = self.tracker.update([face["raw_bbox"] for face in packet["faces"]])
+        for face, track_id in zip(packet["faces"], track_ids):
+            face["track_id"] = track_id
+
+    def _liveness(self, packet):
+        anti_spoof = self.anti_spoof
+        if not self.liveness_enabled or anti_spoof is None or not packet["faces"]:
+            return
+        tracker = self.tracker
+        pending = []
+        for face in packet["faces"]:
+            face["frontal"], face["yaw"] = self.frontal_fn(face["kps"], threshold=0.25)
+            if not face["frontal"]:
+                continue
+            cached = tracker.cached_liveness(face["track_id"]) if tracker is not None else None
+            if cached is not None:
+                face["liveness"] = cached
+            else:
+                pending.append(face)
+        if not pending:
+            return
+        results = anti_spoof.check_batch(packet["frame"], [face["raw_bbox"] for face in pending])
+        for face, result in zip(pending, results):
+            face["liveness"] = result
+            if tracker is not None:
+                tracker.store_liveness(face["track_id"], result)
+
+    def _embed(self, frame, faces):
+        """Tính embedding (1 batch) cho các mặt chưa có, dùng model recognition của FaceAnalysis"""
+        from insightface.utils import face_align
+        rec_model = self.face_model.models['recognition']
+        crops = [face_align.norm_crop(frame, landmark=face["kps"], image_size=rec_model.input_size[0])
+                 for face in faces]
+        embedder = self.embedder
+        embeddings = embedder.embed(self.session_id, crops) if embedder is not None else rec_model.get_feat(crops)
+        for face, embedding in zip(faces, embeddings):
+            face["embedding"] = embedding
+
+    def _recognize(self, packet):
+        gallery = self.gallery
+        if not self.recognize_enabled or gallery is None:
+            return
+        tracker = self.tracker
+        # Đọc trước khi match: gallery đổi giữa chừng → version cũ → frame sau nhận diện lại
+        version = gallery.cache_key
+        # Chỉ nhận diện mặt frontal và không bị đánh FAKE
+        faces = []
+        for face in packet["faces"]:
+            if not face["frontal"] or (face["liveness"] is not None and not face["liveness"][0]):
+                continue
+            cached = tracker.cached_identity(face["track_id"], version) if tracker is not None else None
+            if cached is not None:
+                face["identity"] = cached
+            elif face["embedding"] is not None or face["kps"] is not None:
+                faces.append(face)
+        if not faces:
+            return
+        if not gallery:
+            for face in faces:
+                face["identity"] = (None, "No DB", 0.0)
+            return
+
+        missing = [face for face in faces if face["embedding"] is None]
+        if missing:
+            self._embed(packet["frame"], missing)
+        with self.match_seconds.time():
+            matches = gallery.match_batch(np.stack([face["embedding"] for face in faces]), self.threshold)
+        for face, identity in zip(faces, matches):
+            face["identity"] = identity
+            if tracker is not None:
+                tracker.store_identity(face["track_id"], identity, self.threshold, version)
+
+    def _annotate(self, packet):
+        # Frame từ stream là view read-only → copy 1 lần duy nhất để vẽ
+        display_frame = packet["frame"].copy()
+        for face in packet["faces"]:
+            if not face["frontal"]:
+                face["color"], face["label"] = COLOR_TURN, f"TURN {face['yaw']:.2f}"
+            elif face["liveness"] is not None and not face["liveness"][0]:
+                face["color"], face["label"] = COLOR_FAKE, f"FAKE {face['liveness'][1]:.2f}"
+            elif face["identity"] is not None:
+                person_id, _, similarity = face["identity"]
+                if person_id:
+                    face["color"], face["label"] = COLOR_KNOWN, f"{person_id} ({similarity:.2f})"
+                else:
+                    face["color"], face["label"] = COLOR_UNKNOWN, f"Unknown ({similarity:.2f})"
+            else:
+                face["color"], face["label"] = COLOR_KNOWN, f"{face['det_score']:.2f}"
+            draw_face(display_frame, face)
+
+        render_size = self.render_size
+        if render_size is None:
+            packet["display"] = display_frame
+            return
+        # GUI: convert RGB in-place trên bản copy, không cấp phát thêm
+        rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB, dst=display_frame)
+        if render_size[0] > 1 and render_size[1] > 1:
+            rgb = cv2.resize(rgb, render_size, interpolation=cv2.INTER_LANCZOS4)
+        packet["rgb"] = rgb
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Worker pool đa process cho host CPU nhiều core (tránh GIL)
+- N process, mỗi process load FaceAnalysis + AntiSpoofEngine + gallery đúng 1 lần
+- Frame truyền qua multiprocessing.shared_memory: process cha copy frame vào 1 slot,
+  qua queue chỉ gửi (job_id, slot, shape) → không pickle ảnh
+- Kết quả trả về là list face dict JSON (inference_service.face_to_json)
+- Số worker tự chọn theo số core khả dụng / số thread mỗi worker; biến môi trường OMP/MKL/OpenBLAS được đặt
+  trước khi spawn (worker import numpy/onnxruntime với đúng số thread), session ORT của FaceAnalysis dùng
+  intra_op_num_threads = threads_per_worker
+- Mỗi worker 1 queue riêng: process cha biết job nào đang ở worker nào → worker chết thì Future của nó lỗi ngay
+- Log enroll chỉ được theo dõi ở process cha (enrollment_log=...), có thay đổi thì báo mọi worker đọc record mới
+
+Dùng với CameraManager (mỗi worker thread của manager chờ 1 job của pool):
+    pool = ProcessInferencePool().start()
+    manager.start_workers(lambda name, frame: pool.process(frame), num_workers=pool.num_workers * 2)
+"""
+
+import importlib
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metrics import enable_log
+
+DEFAULT_FRAME_SHAPE = (1080, 1920, 3)
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+_worker_threads = None  # số thread của worker hiện tại (đặt trong _worker_main, factory đọc lại)
+
+
+def available_cores():
+    """Số core process được phép chạy (tôn trọng taskset/cgroup affinity)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def auto_worker_count(threads_per_worker=2, reserved_cores=1):
+    """Số worker: chia core còn lại (trừ reserved cho capture/process cha) cho mỗi worker threads_per_worker thread"""
+    return max(1, (available_cores() - reserved_cores) // max(1, threads_per_worker))
+
+
+def load_frame_processor(det_size=None, num_threads=None):
+    """
+    Factory mặc định (chạy trong worker): load model như inference_service, trả về fn(frame) → list face JSON
+    Không tự theo dõi log enroll: process cha gọi process.enrollment_changed() khi log đổi
+    """
+    from inference_service import face_to_json, load_service
+    from face_recognition_demo import DET_SIZE
+
+    service = load_service(max_batch=1, max_wait=0.0, det_size=det_size or DET_SIZE,
+                           num_threads=num_threads or _worker_threads, watch=False)
+    if service.face_model is None:
+        raise RuntimeError("Chưa cài insightface")
+
+    def process(frame):
+        return [face_to_json(face) for face in service.process_frames([(frame, None)])[0]]
+    process.enrollment_changed = service.enrollment_watcher.poll
+    return process
+
+
+@contextmanager
+def _thread_env(num_threads):
+    """Đặt biến môi trường số thread OpenMP/BLAS trong lúc spawn worker (process con kế thừa), rồi trả lại"""
+    saved = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    os.environ.update({var: str(num_threads) for var in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _limit_threads(num_threads):
+    """Giới hạn thread torch/OpenCV trong worker (đặt được sau khi import, khác OMP/BLAS đã đặt lúc spawn)"""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    import cv2
+    cv2.setNumThreads(num_threads)
+
+
+def _worker_main(worker_id, factory_spec, factory_kwargs, slot_names, slot_shape, threads, tasks, results):
+    """
+    Vòng lặp worker: attach shared memory, load model 1 lần, xử lý job tới khi nhận None
+    tasks: queue riêng của worker, job (job_id, slot, shape) hoặc "enrollment" (log enroll vừa đổi)
+    """
+    global _worker_threads
+    _worker_threads = threads
+    _limit_threads(threads)
+    enable_log("anti_spoof")  # process spawn không kế thừa handler của process cha
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    frames = [np.ndarray(slot_shape, dtype=np.uint8, buffer=slot.buf) for slot in slots]
+    try:
+        start = time.perf_counter()
+        module_name, func_name = factory_spec.split(":")
+        process = getattr(importlib.import_module(module_name), func_name)(**factory_kwargs)
+        results.put(("ready", worker_id, time.perf_counter() - start))
+    except Exception as e:
+        results.put(("failed", worker_id, repr(e)))
+        return
+
+    while True:
+        job = tasks.get()
+        if job is None:
+            break
+        if job == "enrollment":
+            try:
+                changed = getattr(process, "enrollment_changed", None)
+                if changed is not None:
+                    changed()
+            except Exception as e:
+                print(f"⚠️ Worker {worker_id}: lỗi áp log enroll: {e}")
+            continue
+        job_id, slot_idx, shape = job
+        h, w, c = shape
+        try:
+            result = process(frames[slot_idx][:h, :w, :c])
+            results.put(("done", job_id, slot_idx, result))
+        except Exception as e:
+            results.put(("error", job_id, slot_idx, repr(e)))
+
+    del frames
+    for slot in slots:
+        slot.close()
+
+
+class ProcessInferencePool:
+    """
+    num_workers: None = auto_worker_count(threads_per_worker)
+    worker_factory: "module:function" trả về fn(frame) → kết quả picklable, chạy 1 lần trong mỗi worker
+                    (fn.enrollment_changed() nếu có: gọi trong worker khi log enroll đổi)
+    max_frame_shape: kích thước frame lớn nhất (h, w, 3), quyết định dung lượng mỗi slot shared memory
+    slots_per_worker: số frame có thể đang chờ/đang xử lý cho mỗi worker
+    enrollment_log: file log enroll để theo dõi (xem enrollment_log.py), None = không theo dõi
+    """
+
+    def __init__(self, num_workers=None, threads_per_worker=2, worker_factory="process_pool:load_frame_processor",
+                 factory_kwargs=None, max_frame_shape=DEFAULT_FRAME_SHAPE, slots_per_worker=2,
+                 enrollment_log=None, watch_interval=1.0):
+        self.threads_per_worker = threads_per_worker
+        self.num_workers = num_workers or auto_worker_count(threads_per_worker)
+        self.worker_factory = worker_factory
+        self.factory_kwargs = factory_kwargs or {}
+        self.slot_shape = tuple(max_frame_shape)
+        self.num_slots = self.num_workers * slots_per_worker
+        self.enrollment_log = enrollment_log
+        self.watch_interval = watch_interval
+
+        self.ctx = mp.get_context("spawn")  # an toàn với torch/onnxruntime đã khởi tạo thread
+        self.slots = []
+        self.slot_frames = []
+        self.free_slots = queue.Queue()
+        self.jobs = {}  # job_id → (future, slot, worker_id) của job chưa có kết quả
+        self.job_ids = itertools.count()
+        self.lock = threading.Lock()
+        self.processes = []
+        self.task_queues = []
+        self.alive = set()  # worker_id còn sống
+        self.stopping = threading.Event()
+        self.collector = None
+        self.load_times = {}
+        self.stats_counter = {"submitted": 0, "done": 0, "errors": 0, "worker_deaths": 0}
+
+    def start(self, timeout=300):
+        """Tạo shared memory + spawn worker, chờ mọi worker load xong model"""
+        nbytes = int(np.prod(self.slot_shape))
+        for i in range(self.num_slots):
+            slot = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.slots.append(slot)
+            self.slot_frames.append(np.ndarray(self.slot_shape, dtype=np.uint8, buffer=slot.buf))
+            self.free_slots.put(i)
+
+        self.results = self.ctx.Queue()
+        slot_names = [slot.name for slot in self.slots]
+        with _thread_env(self.threads_per_worker):
+            for worker_id in range(self.num_workers):
+                tasks = self.ctx.Queue()
+                p = self.ctx.Process(target=_worker_main, daemon=True,
+                                     args=(worker_id, self.worker_factory, self.factory_kwargs, slot_names,
+                                           self.slot_shape, self.threads_per_worker, tasks, self.results))
+                p.start()
+                self.processes.append(p)
+                self.task_queues.append(tasks)
+
+        deadline = time.time() + timeout
+        while len(self.load_times) < self.num_workers:
+            try:
+                message = self.results.get(timeout=0.5)
+            except queue.Empty:
+                dead = [i for i, p in enumerate(self.processes) if not p.is_alive() and i not in self.load_times]
+                if dead:
+                    self.stop()
+                    raise RuntimeError(f"Worker {dead} đã dừng trong lúc load model")
+                if time.time() > deadline:
+                    self.stop()
+                    raise TimeoutError(f"Worker chưa load xong sau {timeout}s")
+                continue
+            if message[0] == "failed":
+                self.stop()
+                raise RuntimeError(f"Worker {message[1]} lỗi khi load model: {message[2]}")
+            self.load_times[message[1]] = message[2]
+        self.alive = set(range(self.num_workers))
+
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+        if self.enrollment_log and self.watch_interval:
+            threading.Thread(target=self._watch_enrollment, daemon=True).start()
+        return self
+
+    def _pick_worker(self):
+        """Worker còn sống đang giữ ít job nhất (gọi khi đang giữ self.lock)"""
+        if not self.alive:
+            raise RuntimeError("Không còn worker nào chạy")
+        load = {worker_id: 0 for worker_id in self.alive}
+        for _, _, worker_id in self.jobs.values():
+            if worker_id in load:
+                load[worker_id] += 1
+        return min(load, key=load.get)
+
+    def submit(self, frame, timeout=None):
+        """Copy frame vào 1 slot trống (chờ nếu hết slot) rồi gửi job, trả về Future → kết quả"""
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+        if h > self.slot_shape[0] or w > self.slot_shape[1] or c > self.slot_shape[2]:
+            raise ValueError(f"Frame {frame.shape} lớn hơn max_frame_shape {self.slot_shape}")
+
+        slot_idx = self.free_slots.get(timeout=timeout)
+        self.slot_frames[slot_idx][:h, :w, :c] = frame.reshape(h, w, c)
+        future = Future()
+        with self.lock:
+            try:
+                worker_id = self._pick_worker()
+            except RuntimeError:
+                self.free_slots.put(slot_idx)
+                raise
+            job_id = next(self.job_ids)
+            self.jobs[job_id] = (future, slot_idx, worker_id)
+            self.stats_counter["submitted"] += 1
+            self.task_queues[worker_id].put((job_id, slot_idx, (h, w, c)))
+        return future
+
+    def process(self, frame, timeout=None):
+        return self.submit(frame).result(timeout)
+
+    def _collect(self):
+        """Thread nhận kết quả từ worker: trả slot, resolve Future; phát hiện worker chết"""
+        while True:
+            try:
+                message = self.results.get(timeout=0.5)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if message is None:
+                break
+            kind, job_id, slot_idx, payload = message
+            with self.lock:
+                job = self.jobs.pop(job_id, None)
+                if job is None:
+                    continue  # job đã bị huỷ (worker bị coi là chết), slot đã trả
+                self.stats_counter["done" if kind == "done" else "errors"] += 1
+            self.free_slots.put(slot_idx)
+            if kind == "done":
+                job[0].set_result(payload)
+            else:
+                job[0].set_exception(RuntimeError(payload))
+
+    def _check_workers(self):
+        """Worker chết (crash, bị kill) → Future đang ở worker đó lỗi, trả slot, không giao job mới cho nó"""
+        if self.stopping.is_set():
+            return
+        for worker_id in list(self.alive):
+            p = self.processes[worker_id]
+            if p.is_alive():
+                continue
+            with self.lock:
+                self.alive.discard(worker_id)
+                self.stats_counter["worker_deaths"] += 1
+                lost = [(job_id, job) for job_id, job in self.jobs.items() if job[2] == worker_id]
+                for job_id, _ in lost:
+                    del self.jobs[job_id]
+            print(f"❌ Worker {worker_id} đã dừng (exit code {p.exitcode}), huỷ {len(lost)} job")
+            for _, (future, slot_idx, _) in lost:
+                self.free_slots.put(slot_idx)
+                future.set_exception(RuntimeError(f"Worker {worker_id} đã dừng (exit code {p.exitcode})"))
+
+    def _watch_enrollment(self):
+        """Theo dõi log enroll (stat file) ở process cha, có thay đổi thì báo mọi worker"""
+        def signature():
+            try:
+                st = os.stat(self.enrollment_log)
+                return st.st_ino, st.st_size, st.st_mtime_ns
+            except FileNotFoundError:
+                return None
+
+        last = signature()
+        while not self.stopping.wait(self.watch_interval):
+            current = signature()
+            if current != last:
+                last = current
+                self.broadcast("enrollment")
+
+    def broadcast(self, message):
+        """Gửi message điều khiển tới mỗi worker còn sống (xử lý theo thứ tự với job trong queue của worker)"""
+        with self.lock:
+            for worker_id in self.alive:
+                self.task_queues[worker_id].put(message)
+
+    def stop(self):
+        self.stopping.set()
+        for tasks in self.task_queues:
+            tasks.put(None)
+        for p in self.processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        if self.collector is not None:
+            self.results.put(None)
+            self.collector.join(timeout=1)
+        with self.lock:
+            for future, _, _ in self.jobs.values():
+                future.set_exception(RuntimeError("Pool đã dừng"))
+            self.jobs.clear()
+            self.alive.clear()
+        self.slot_frames = []
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+        self.slots = []
+        self.processes = []
+        self.task_queues = []
+
+    def stats(self):
+        with self.lock:
+            return dict(self.stats_counter, workers=self.num_workers, alive=len(self.alive),
+                        in_flight=len(self.jobs), load_s=round(max(self.load_times.values(), default=0.0), 2))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Cache sub-gallery theo slot điểm danh
+- Mỗi session (lecture/exam slot) chỉ match với sinh viên trong roster của slot đó
+  (enrollments / exam_slot_participants) → search nhanh hơn, ít false match hơn
+- Sub-gallery được build khi session start, giữ trong RAM với LRU eviction
+- Roster thay đổi (fingerprint khác) hoặc gallery gốc vừa add/update/remove (version khác) → tự build lại;
+  gallery gốc reload → xoá toàn bộ cache
+"""
+
+import csv
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+
+def roster_fingerprint(roster):
+    """Hash roster (không phụ thuộc thứ tự, bỏ trùng) để phát hiện roster thay đổi"""
+    joined = "\n".join(sorted(set(roster)))
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+class SubGalleryCache:
+    """LRU cache slot_id → sub-gallery, dùng chung giữa các session chạy đồng thời"""
+
+    def __init__(self, gallery, capacity=32):
+        self.gallery = gallery
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # slot_id → (fingerprint, gallery.version, sub_gallery)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, slot_id, roster):
+        """
+        Lấy sub-gallery của slot, build nếu chưa có hoặc roster đã đổi
+        roster: list roll number của sinh viên trong slot
+        """
+        fingerprint = roster_fingerprint(roster)
+
+        with self.lock:
+            gallery = self.gallery
+            version = gallery.version
+            entry = self.entries.get(slot_id)
+            if entry is not None and entry[:2] == (fingerprint, version):
+                self.entries.move_to_end(slot_id)
+                self.stats["hits"] += 1
+                return entry[2]
+            self.stats["misses"] += 1
+
+        # Build ngoài lock để các session khác không bị chặn
+        sub_gallery = gallery.subset(roster)
+
+        with self.lock:
+            if gallery is not self.gallery:
+                # Gallery gốc đã reload trong lúc build → không cache kết quả cũ
+                return sub_gallery
+            self.entries[slot_id] = (fingerprint, version, sub_gallery)
+            self.entries.move_to_end(slot_id)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return sub_gallery
+
+    def invalidate(self, slot_id):
+        """Xoá cache của 1 slot (vd. roster vừa được import lại)"""
+        with self.lock:
+            self.entries.pop(slot_id, None)
+
+    def set_gallery(self, gallery):
+        """Thay gallery gốc (reload face database) và xoá toàn bộ sub-gallery cũ"""
+        with self.lock:
+            self.gallery = gallery
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _load_rosters(csv_path, key_columns):
+    """Đọc CSV import, gom roll_number theo key_columns"""
+    rosters = defaultdict(list)
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            key = tuple(row[c] for c in key_columns)
+            rosters[key[0] if len(key) == 1 else key].append(row["roll_number"])
+    return dict(rosters)
+
+
+def load_class_rosters(enrollments_csv):
+    """Roster lecture từ 09_enrollments.csv: {class_code: [roll_number, ...]}"""
+    return _load_rosters(enrollments_csv, ("class_code",))
+
+
+def load_exam_rosters(participants_csv):
+    """Roster exam từ 12_exam_participants.csv: {(start_time, room_name): [roll_number, ...]}"""
+    return _load_rosters(participants_csv, ("start_time", "room_name"))
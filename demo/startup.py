@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Khởi động song song các thành phần (face model, anti-spoof, gallery)
+- Mỗi thành phần load trong 1 thread riêng: phần nặng là ONNX Runtime / torch / đọc file, đều nhả GIL
+- Lỗi của 1 thành phần không chặn các thành phần còn lại
+- Ghi thời gian từng thành phần để so tổng thời gian song song với tuần tự
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def load_parallel(tasks):
+    """
+    tasks: dict tên → hàm không tham số
+    Returns: (results, timings, errors) — dict theo tên; thành phần lỗi có result None và errors[tên] = exception
+    """
+    results, timings, errors = {}, {}, {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            timings[name] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, len(tasks)), thread_name_prefix="startup") as executor:
+        futures = {name: executor.submit(timed, name, fn) for name, fn in tasks.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"❌ Lỗi khởi động {name}: {e}")
+                results[name], errors[name] = None, e
+    timings["total"] = time.perf_counter() - start
+    return results, timings, errors
+
+
+def format_timings(timings):
+    """'face 3.20s | antispoof 0.41s | gallery 0.05s | tổng 3.21s (tuần tự 3.66s)'"""
+    parts = [f"{name} {seconds:.2f}s" for name, seconds in timings.items() if name != "total"]
+    sequential = sum(seconds for name, seconds in timings.items() if name != "total")
+    if "total" in timings:
+        parts.append(f"tổng {timings['total']:.2f}s (tuần tự {sequential:.2f}s)")
+    return " | ".join(parts)
+
+
+def warm_up_face_model(face_model, det_size):
+    """
+    Chạy detection + recognition trên ảnh đen để ONNX Runtime cấp phát buffer / chọn kernel trước frame thật
+    (frame đầu tiên không bị chậm hơn hẳn các frame sau)
+    """
+    face_model.det_model.detect(np.zeros((det_size[1], det_size[0], 3), dtype=np.uint8),
+                                input_size=det_size, max_num=0, metric='default')
+    rec_model = face_model.models.get('recognition')
+    if rec_model is not None:
+        w, h = rec_model.input_size
+        rec_model.get_feat([np.zeros((h, w, 3), dtype=np.uint8)])